@@ -0,0 +1 @@
+"""Performance benchmarks of ocp_tessellate, run with python -m benchmarks"""
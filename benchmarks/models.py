@@ -0,0 +1,234 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Scalable synthetic models built with OCP primitives only"""
+
+import math
+
+from OCP.BRep import BRep_Builder
+from OCP.BRepAlgoAPI import BRepAlgoAPI_Fuse
+from OCP.BRepBuilderAPI import (
+    BRepBuilderAPI_MakeFace,
+    BRepBuilderAPI_MakePolygon,
+    BRepBuilderAPI_MakeWire,
+)
+from OCP.BRepFilletAPI import BRepFilletAPI_MakeFillet
+from OCP.BRepPrimAPI import (
+    BRepPrimAPI_MakeBox,
+    BRepPrimAPI_MakeCylinder,
+    BRepPrimAPI_MakePrism,
+)
+from OCP.gp import gp_Ax2, gp_Dir, gp_Pnt, gp_Trsf, gp_Vec
+from OCP.TopLoc import TopLoc_Location
+from OCP.TopoDS import TopoDS_Compound
+
+from ocp_tessellate.ocp_utils import circle, get_edges
+
+
+def _location(x=0.0, y=0.0, z=0.0, angle=0.0):
+    trsf = gp_Trsf()
+    trsf.SetRotation(gp_Ax2().Axis(), angle)
+    trsf.SetTranslationPart(gp_Vec(x, y, z))
+    return TopLoc_Location(trsf)
+
+
+def _compound(shapes):
+    builder = BRep_Builder()
+    compound = TopoDS_Compound()
+    builder.MakeCompound(compound)
+    for shape in shapes:
+        builder.Add(compound, shape)
+    return compound
+
+
+def box_grid(n):
+    """
+    A grid of n distinct boxes with varying sizes.
+
+    @param n: The number of boxes
+    @return: List of TopoDS_Solid
+    """
+    cols = math.ceil(math.sqrt(n))
+    boxes = []
+    for i in range(n):
+        x, y = divmod(i, cols)
+        size = 1 + (i % 7) * 0.1  # different sizes, so no two boxes are instances
+        box = BRepPrimAPI_MakeBox(gp_Pnt(2 * x, 2 * y, 0), size, size, size).Shape()
+        boxes.append(box)
+    return boxes
+
+
+def filleted_solid(sides, radius=0.2):
+    """
+    A prism over a regular polygon with all edges filleted, i.e. with about
+    4 * sides faces.
+
+    @param sides: The number of sides of the polygon
+    @param radius: The fillet radius
+    @return: The TopoDS_Shape
+    """
+    polygon = BRepBuilderAPI_MakePolygon()
+    for i in range(sides):
+        a = 2 * math.pi * i / sides
+        polygon.Add(gp_Pnt(5 * math.cos(a), 5 * math.sin(a), 0))
+    polygon.Close()
+    face = BRepBuilderAPI_MakeFace(polygon.Wire()).Face()
+    prism = BRepPrimAPI_MakePrism(face, gp_Vec(0, 0, 3)).Shape()
+
+    fillet = BRepFilletAPI_MakeFillet(prism)
+    for edge in get_edges(prism):
+        fillet.Add(radius, edge)
+    return fillet.Shape()
+
+
+def fastener():
+    """
+    A simple bolt, i.e. a shaft fused with a head.
+
+    @return: The TopoDS_Shape
+    """
+    shaft = BRepPrimAPI_MakeCylinder(0.3, 3).Shape()
+    head = BRepPrimAPI_MakeCylinder(
+        gp_Ax2(gp_Pnt(0, 0, 3), gp_Dir(0, 0, 1)), 0.5, 0.3
+    ).Shape()
+    return BRepAlgoAPI_Fuse(shaft, head).Shape()
+
+
+def fastener_array(n):
+    """
+    n located copies of the same fastener, so all of them share one TShape.
+
+    @param n: The number of fasteners
+    @return: List of TopoDS_Shape
+    """
+    bolt = fastener()
+    cols = math.ceil(math.sqrt(n))
+    return [
+        bolt.Moved(_location(2 * (i // cols), 2 * (i % cols), 0, 0.1 * i))
+        for i in range(n)
+    ]
+
+
+def wire_sketch(n):
+    """
+    A compound of n wires, closed polygons and circles alternating.
+
+    @param n: The number of wires
+    @return: The TopoDS_Compound
+    """
+    wires = []
+    for i in range(n):
+        x, y = 3 * (i % 20), 3 * (i // 20)
+        if i % 2 == 0:
+            polygon = BRepBuilderAPI_MakePolygon()
+            for k in range(3 + i % 5):
+                a = 2 * math.pi * k / (3 + i % 5)
+                polygon.Add(gp_Pnt(x + math.cos(a), y + math.sin(a), 0))
+            polygon.Close()
+            wires.append(polygon.Wire())
+        else:
+            wires.append(
+                BRepBuilderAPI_MakeWire(circle((x, y, 0), (0, 0, 1), 1)).Wire()
+            )
+    return _compound(wires)
+
+
+def nested_assembly(depth, breadth):
+    """
+    A tree of dicts with the given depth and breadth. Every level adds a box and
+    a fastener, so parts appear on all levels and fasteners are instanced.
+
+    @param depth: The depth of the tree
+    @param breadth: The number of sub assemblies per level
+    @return: dict
+    """
+    bolt = fastener()
+
+    def level(d, offset):
+        result = {
+            "plate": BRepPrimAPI_MakeBox(gp_Pnt(offset, 0, d), 4, 4, 0.5).Shape(),
+            "bolt": bolt.Moved(_location(offset + 2, 2, d)),
+        }
+        if d < depth:
+            for b in range(breadth):
+                result[f"sub_{b}"] = level(
+                    d + 1, offset + 5 * b * breadth ** (depth - d)
+                )
+        return result
+
+    return level(0, 0)
+
+
+def deep_assembly(n, depth=25):
+    """
+    A hierarchy of nested dicts with the given depth and about n nodes in total,
+    i.e. every level has about n / depth located copies of one box, so all leaves
+    share one TShape. It exercises the traversal, not the tessellation.
+
+    @param n: The number of nodes
+    @param depth: The depth of the hierarchy
+    @return: dict
+    """
+    box = BRepPrimAPI_MakeBox(1, 1, 1).Shape()
+    per_level = max(n // depth - 1, 1)
+    root = level = {}
+    for d in range(depth):
+        for i in range(per_level):
+            level[f"part_{i}"] = box.Moved(_location(2 * i, 2 * d, 0))
+        if d < depth - 1:
+            level["sub"] = {}
+            level = level["sub"]
+    return root
+
+
+#
+# The benchmark models by name, every factory takes a size parameter
+#
+
+MODELS = {
+    "box_grid": box_grid,
+    "filleted_solid": filleted_solid,
+    "fastener_array": fastener_array,
+    "wire_sketch": wire_sketch,
+    "nested_assembly": lambda depth: nested_assembly(depth, 3),
+}
+
+SIZES = {
+    "small": {
+        "box_grid": 25,
+        "filleted_solid": 8,
+        "fastener_array": 50,
+        "wire_sketch": 50,
+        "nested_assembly": 2,
+        "traversal": 10_000,
+    },
+    "medium": {
+        "box_grid": 200,
+        "filleted_solid": 24,
+        "fastener_array": 500,
+        "wire_sketch": 400,
+        "nested_assembly": 3,
+        "traversal": 100_000,
+    },
+    "large": {
+        "box_grid": 1000,
+        "filleted_solid": 64,
+        "fastener_array": 5000,
+        "wire_sketch": 2000,
+        "nested_assembly": 5,
+        "traversal": 300_000,
+    },
+}
@@ -0,0 +1,285 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Run the benchmarks, write the results as JSON and compare with a baseline"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+from ocp_tessellate import ot_version, tessellator
+from ocp_tessellate.convert import tessellate_group, to_ocpgroup
+from ocp_tessellate.fingerprint import clear_fingerprints
+from ocp_tessellate.ocp_utils import get_edges, occt_version
+from ocp_tessellate.tessellator import cache, discretize_edges
+from ocp_tessellate.utils import numpy_to_buffer_json
+
+from .models import MODELS, SIZES, deep_assembly
+
+# timings that are compared with the baseline
+METRICS = (
+    "to_ocpgroup",
+    "tessellate_cold",
+    "tessellate_warm",
+    "discretize_edges",
+    "numpy_to_buffer_json",
+    "collect",
+    "to_state",
+)
+
+# the benchmark of the hierarchy traversal, next to the models
+TRAVERSAL = "traversal"
+
+
+def _timed(func, repeat):
+    """The best of repeat runs of func, and the result of the last run"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _shapes(model):
+    """All shapes of a model, i.e. of a nested structure of lists and dicts"""
+    if isinstance(model, dict):
+        model = list(model.values())
+    if isinstance(model, (list, tuple)):
+        return [shape for obj in model for shape in _shapes(obj)]
+    return [model]
+
+
+def bench_model(name, size, repeat=3, workers=None, deflection=0.01):
+    """
+    Benchmark the pipeline for one model.
+
+    @param name: The name of the model in MODELS
+    @param size: The size parameter of the model factory
+    @param repeat: The number of runs per timing, the best run counts
+    @param workers: The number of worker processes for tessellate_group
+    @param deflection: The deflection for discretize_edges
+    @return: dict with timings in seconds, counts and peak memory in bytes
+    """
+    model = MODELS[name](size)
+    result = {"model": name, "size": size}
+
+    def convert():
+        clear_fingerprints()
+        return to_ocpgroup(model)
+
+    result["to_ocpgroup"], (group, instances) = _timed(convert, repeat)
+    result["instances"] = len(instances)
+
+    def tessellate():
+        cache.clear()
+        return tessellate_group(group, instances, workers=workers)
+
+    result["tessellate_cold"], _ = _timed(tessellate, repeat)
+    result["tessellate_warm"], (meshed_instances, shapes, _) = _timed(
+        lambda: tessellate_group(group, instances, workers=workers), repeat
+    )
+    result["triangles"] = sum(
+        len(m["triangles"]) // 3 for m in meshed_instances if m is not None
+    )
+
+    edges = [list(get_edges(shape)) for shape in _shapes(model)]
+    result["edges"] = sum(len(e) for e in edges)
+    result["discretize_edges"], _ = _timed(
+        lambda: [discretize_edges(e, deflection) for e in edges], repeat
+    )
+
+    data = {"instances": meshed_instances, "shapes": shapes}
+    result["numpy_to_buffer_json"], (_, stats) = _timed(
+        lambda: numpy_to_buffer_json(data, report=True), repeat
+    )
+    result["buffer_bytes"] = stats["encoded_bytes"]
+
+    # One more pass for the peak memory of the whole pipeline. tracemalloc sees the
+    # Python and numpy allocations, but not the memory allocated by OCCT
+    cache.clear()
+    clear_fingerprints()
+    tracemalloc.start()
+    group, instances = to_ocpgroup(model)
+    meshed_instances, shapes, _ = tessellate_group(group, instances, workers=workers)
+    numpy_to_buffer_json({"instances": meshed_instances, "shapes": shapes})
+    result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    cache.clear()
+
+    return result
+
+
+def bench_traversal(size, repeat=3):
+    """
+    Benchmark the traversal of a large hierarchy, i.e. the conversion to an
+    OcpGroup and the collection of the parts and states without tessellation.
+
+    @param size: The number of nodes of the deep_assembly model
+    @param repeat: The number of runs per timing, the best run counts
+    @return: dict with timings in seconds, counts and peak memory in bytes
+    """
+    model = deep_assembly(size)
+    result = {"model": TRAVERSAL, "size": size}
+
+    def convert():
+        clear_fingerprints()
+        return to_ocpgroup(model)
+
+    result["to_ocpgroup"], (group, instances) = _timed(convert, repeat)
+    result["instances"] = len(instances)
+    result["nodes"] = group.count_shapes()
+
+    result["collect"], _ = _timed(lambda: group.collect("", instances), repeat)
+    result["to_state"], _ = _timed(group.to_state, repeat)
+
+    clear_fingerprints()
+    tracemalloc.start()
+    group, instances = to_ocpgroup(model)
+    group.collect("", instances)
+    group.to_state()
+    result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return result
+
+
+def run(scale="small", models=None, repeat=3, workers=None):
+    """
+    Benchmark all (or the selected) models.
+
+    @param scale: The size preset, one of the keys of SIZES
+    @param models: List of model names and "traversal" (None: all)
+    @param repeat: The number of runs per timing
+    @param workers: The number of worker processes for tessellate_group
+    @return: dict with the environment and the results per model
+    """
+    results = {}
+    for name in [*MODELS, TRAVERSAL] if models is None else models:
+        if name == TRAVERSAL:
+            results[name] = bench_traversal(SIZES[scale][name], repeat)
+        else:
+            results[name] = bench_model(name, SIZES[scale][name], repeat, workers)
+
+    return {
+        "environment": {
+            "ocp_tessellate": ot_version,
+            "occt": occt_version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "disk_cache": tessellator.disk_cache is not None,
+        },
+        "scale": scale,
+        "repeat": repeat,
+        "workers": workers,
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold=0.1):
+    """
+    Compare the timings and peak memory with a baseline.
+
+    @param current: The result of run()
+    @param baseline: A previous result of run()
+    @param threshold: The relative change that counts as regression
+    @return: List of (model, metric, baseline, current, ratio, regression) tuples
+    """
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or base["size"] != result["size"]:
+            continue
+        for metric in METRICS + ("peak_memory",):
+            if metric not in result or base.get(metric, 0) <= 0:
+                continue
+            ratio = result[metric] / base[metric]
+            rows.append(
+                (
+                    name,
+                    metric,
+                    base[metric],
+                    result[metric],
+                    ratio,
+                    ratio > 1 + threshold,
+                )
+            )
+    return rows
+
+
+def _format(metric, value):
+    if metric == "peak_memory":
+        return f"{value / 2**20:9.2f} MB"
+    return f"{value * 1000:9.2f} ms"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark conversion, tessellation and serialization",
+    )
+    parser.add_argument("--scale", choices=list(SIZES), default="small")
+    parser.add_argument("--models", nargs="*", choices=[*MODELS, TRAVERSAL])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare with this JSON result file")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative slowdown that counts as regression (default 0.1)",
+    )
+    args = parser.parse_args(argv)
+
+    if tessellator.disk_cache is not None:
+        print("Warning: the disk cache is enabled, cold timings are not cold")
+
+    current = run(args.scale, args.models, args.repeat, args.workers)
+
+    for name, result in current["results"].items():
+        print(f"{name} (size {result['size']}, {result['instances']} instances)")
+        for metric in METRICS + ("peak_memory",):
+            if metric in result:
+                print(f"    {metric:22s}{_format(metric, result[metric])}")
+
+    if args.output is not None:
+        with open(args.output, "w") as fd:
+            json.dump(current, fd, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as fd:
+            baseline = json.load(fd)
+
+        rows = compare(current, baseline, args.threshold)
+        print(f"\nComparison with {args.baseline}")
+        for name, metric, base, value, ratio, regression in rows:
+            print(
+                f"{name:16s} {metric:22s}{_format(metric, base)} ->"
+                f"{_format(metric, value)}  x{ratio:5.2f}"
+                + ("  REGRESSION" if regression else "")
+            )
+        if any(row[-1] for row in rows):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,212 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Codecs for the numpy buffers sent to the viewer"""
+
+import base64
+import zlib
+
+import numpy as np
+
+#
+# Every codec is a pair of functions
+#   encode(array) -> (bytes like object, dict of parameters) or None
+#   decode(buffer, parameters) -> flat numpy array
+# encode returns None if the codec cannot handle the array, then it is sent raw.
+#
+
+
+def encode_raw(array):
+    return memoryview(array.ravel()), {}
+
+
+def decode_raw(buffer, params):
+    return np.frombuffer(buffer, dtype=params["dtype"])
+
+
+def encode_q16(array):
+    """Positions quantized to 16 bit inside their bounding box"""
+    if array.dtype.kind != "f" or array.size == 0 or array.size % 3 != 0:
+        return None
+
+    points = array.reshape(-1, 3)
+    lo = points.min(axis=0)
+    hi = points.max(axis=0)
+    extent = np.where(hi > lo, hi - lo, 1.0).astype(np.float64)
+    q = np.rint((points - lo) / extent * 65535).astype("<u2")
+    return memoryview(q.ravel()), {"min": lo.tolist(), "max": hi.tolist()}
+
+
+def decode_q16(buffer, params):
+    q = np.frombuffer(buffer, dtype="<u2").reshape(-1, 3)
+    lo = np.asarray(params["min"])
+    hi = np.asarray(params["max"])
+    points = lo + q / 65535 * (hi - lo)
+    return points.astype(params["dtype"]).ravel()
+
+
+def encode_oct16(array):
+    """Unit vectors in octahedral encoding with two 16 bit components"""
+    if array.dtype.kind != "f" or array.size == 0 or array.size % 3 != 0:
+        return None
+
+    n = array.reshape(-1, 3).astype(np.float64)
+    l1 = np.abs(n).sum(axis=1, keepdims=True)
+    # degenerated normals are encoded as +z
+    p = np.divide(n[:, :2], l1, out=np.zeros((len(n), 2)), where=l1 > 0)
+    sign = np.where(p >= 0, 1.0, -1.0)
+    lower = n[:, 2] < 0
+    p[lower] = (1 - np.abs(p[lower][:, ::-1])) * sign[lower]
+    q = np.rint(np.clip(p, -1, 1) * 32767).astype("<i2")
+    return memoryview(q.ravel()), {}
+
+
+def decode_oct16(buffer, params):
+    p = np.frombuffer(buffer, dtype="<i2").reshape(-1, 2) / 32767
+    z = 1 - np.abs(p).sum(axis=1)
+    sign = np.where(p >= 0, 1.0, -1.0)
+    lower = z < 0
+    p[lower] = (1 - np.abs(p[lower][:, ::-1])) * sign[lower]
+    n = np.column_stack([p, z])
+    n /= np.linalg.norm(n, axis=1, keepdims=True)
+    return n.astype(params["dtype"]).ravel()
+
+
+def encode_delta_varint(array):
+    """
+    Indices as zigzag encoded deltas of consecutive values in LEB128 varints.
+    The decoder is told to use uint16 if all indices fit.
+    """
+    if array.dtype.kind not in "iu" or array.size == 0:
+        return None
+
+    values = array.ravel().astype(np.int64)
+    delta = np.diff(values, prepend=0)
+    zigzag = ((delta << 1) ^ (delta >> 63)).astype(np.uint64)
+
+    counts = np.ones(len(zigzag), dtype=np.int64)
+    for k in range(1, 10):
+        counts += zigzag >= (1 << (7 * k))
+    starts = np.cumsum(counts) - counts
+
+    out = np.empty(counts.sum(), dtype=np.uint8)
+    for k in range(int(counts.max())):
+        mask = counts > k
+        byte = (zigzag[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (counts[mask] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[mask] + k] = byte | more
+
+    index_type = "uint16" if values.min() >= 0 and values.max() < 65536 else "uint32"
+    return memoryview(out), {"index_type": index_type}
+
+
+def decode_delta_varint(buffer, params):
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    value_ids = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = (np.arange(len(data)) - starts[value_ids]) * 7
+
+    zigzag = np.zeros(len(ends), dtype=np.uint64)
+    np.add.at(
+        zigzag,
+        value_ids,
+        (data & 0x7F).astype(np.uint64) << shifts.astype(np.uint64),
+    )
+    delta = (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(
+        np.int64
+    )
+    return np.cumsum(delta).astype(params.get("index_type", params["dtype"]))
+
+
+CODECS = {
+    "b64": (encode_raw, decode_raw),
+    "q16": (encode_q16, decode_q16),
+    "oct16": (encode_oct16, decode_oct16),
+    "delta-varint": (encode_delta_varint, decode_delta_varint),
+}
+
+# The codecs for the arrays of meshed instances and edges, by dict key
+MESH_CODECS = {
+    "vertices": "q16",
+    "edges": "q16",
+    "obj_vertices": "q16",
+    "normals": "oct16",
+    "triangles": "delta-varint",
+}
+
+
+def register_codec(name, encode, decode):
+    """
+    Register a codec for numpy_to_buffer_json.
+
+    @param name: The name of the codec, sent to the viewer
+    @param encode: The function encode(array) -> (buffer, parameters) or None
+    @param decode: The function decode(buffer, parameters) -> array
+    """
+    CODECS[name] = (encode, decode)
+
+
+def encode_array(array, codec="b64", compress=False):
+    """
+    Encode a numpy array for the viewer.
+
+    @param array: The numpy array
+    @param codec: The name of the codec, falls back to b64 if not applicable
+    @param compress: Deflate (zlib) the encoded buffer
+
+    @return: Tuple of the dict {shape, dtype, buffer, codec, ...} and the size
+             of the encoded buffer before base64
+    """
+    if not array.flags["C_CONTIGUOUS"]:
+        array = np.ascontiguousarray(array)
+
+    result = CODECS[codec][0](array) if codec != "b64" else None
+    if result is None:
+        codec = "b64"
+        result = encode_raw(array)
+    buffer, params = result
+
+    if compress:
+        buffer = zlib.compress(buffer)
+
+    encoded = {
+        "shape": array.shape,
+        "dtype": str(array.dtype),
+        "buffer": base64.b64encode(buffer).decode(),
+        "codec": codec,
+    }
+    encoded.update(params)
+    if compress:
+        encoded["compression"] = "deflate"
+
+    return encoded, memoryview(buffer).nbytes
+
+
+def decode_array(encoded):
+    """
+    Decode a numpy array encoded by encode_array.
+
+    @param encoded: The dict as created by encode_array
+
+    @return: The numpy array
+    """
+    buffer = base64.b64decode(encoded["buffer"])
+    if encoded.get("compression") == "deflate":
+        buffer = zlib.decompress(buffer)
+
+    array = CODECS[encoded["codec"]][1](buffer, encoded)
+    return array.reshape(encoded["shape"])
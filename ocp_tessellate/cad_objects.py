@@ -205,31 +205,30 @@ class OcpGroup:
         return self
 
     def to_state(self, parents=None):
-        parents = parents or ()
         result = {}
-        for i, obj in enumerate(self.objects):
-            if isinstance(obj, OcpGroup):
-                for k, v in obj.to_state((*parents, i)).items():
-                    result[k] = v
+        stack = [iter(self.objects)]
+        while stack:
+            obj = next(stack[-1], None)
+            if obj is None:
+                stack.pop()
+            elif isinstance(obj, OcpGroup):
+                stack.append(iter(obj.objects))
             else:
                 result[str(obj.id)] = obj.to_state()
         return result
 
     def count_shapes(self):
-        def c(pg):
-            count = 0
-            for p in pg.objects:
-                if isinstance(p, OcpGroup):
-                    count += c(p)
+        count = 0
+        stack = [self]
+        while stack:
+            for obj in stack.pop().objects:
+                if isinstance(obj, OcpGroup):
+                    stack.append(obj)
                 else:
                     count += 1
-            return count
-
-        return c(self)
+        return count
 
-    def collect(
-        self, path, instances, loc=None, discretize_edges=None, convert_vertices=None
-    ):
+    def _collect_group(self, path, loc):
         self.id = f"{path}/{self.name}"
 
         if loc is None and self.loc is None:
@@ -251,13 +250,33 @@ class OcpGroup:
 
         map = {"parts": [], "id": self.id}
 
-        for obj in self.objects:
-            mapping, mesh = obj.collect(
-                self.id, instances, combined_loc, discretize_edges, convert_vertices
-            )
-            result["parts"].append(mesh)
-            map["parts"].append(mapping)
-        return map, result
+        return map, result, combined_loc
+
+    def collect(
+        self, path, instances, loc=None, discretize_edges=None, convert_vertices=None
+    ):
+        # Depth first with an explicit stack instead of recursion, in the same
+        # order, so that deep hierarchies do not hit the recursion limit
+        root = None
+        stack = [(self, path, loc, None, None)]
+        while stack:
+            obj, path, loc, parent_map, parent_result = stack.pop()
+            if isinstance(obj, OcpGroup):
+                mapping, mesh, combined_loc = obj._collect_group(path, loc)
+                for child in reversed(obj.objects):
+                    stack.append((child, obj.id, combined_loc, mapping, mesh))
+            else:
+                mapping, mesh = obj.collect(
+                    path, instances, loc, discretize_edges, convert_vertices
+                )
+
+            if parent_map is None:
+                root = (mapping, mesh)
+            else:
+                parent_map["parts"].append(mapping)
+                parent_result["parts"].append(mesh)
+
+        return root
 
 
 class OcpWrapper:
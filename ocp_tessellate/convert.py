@@ -1,6 +1,6 @@
 import enum
 from hashlib import sha256
-from typing import Any, Dict, Iterable, List, Tuple, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple, Union
 
 from ocp_tessellate.cad_objects import (
     CoordAxis,
@@ -10,12 +10,20 @@ from ocp_tessellate.cad_objects import (
     OcpWrapper,
 )
 from ocp_tessellate.defaults import get_default, preset
+from ocp_tessellate.fingerprint import (
+    geometry_signature,
+    rigid_transform,
+    shape_digest,
+)
+from ocp_tessellate.mesh_optimizer import STATS_FIELDS, optimize_stats
 from ocp_tessellate.ocp_utils import *
+from ocp_tessellate.profiler import profiler
 from ocp_tessellate.tessellator import (
     compute_quality,
     convert_vertices,
     discretize_edges,
     tessellate,
+    tessellate_parallel_iter,
 )
 from ocp_tessellate.utils import *
 
@@ -136,7 +144,7 @@ def get_kind(typ: str) -> str:
 
 
 def unwrap(
-    obj: Union[TopoDS_Shape, List[TopoDS_Shape], ShapeLike, List[ShapeLike]]
+    obj: Union[TopoDS_Shape, List[TopoDS_Shape], ShapeLike, List[ShapeLike]],
 ) -> Union[TopoDS_Shape, List[TopoDS_Shape]]:
     """
     Unwrap the object or objects in a list  if it is wrapped.
@@ -154,29 +162,225 @@ def unwrap(
 
 def create_cache_id(obj: TopoDS_Shape) -> str:
     """
-    The TopoDS_Shape objects are serialized and hashed to create a unique id.
-    The current approach is to use the sha256 hash of the serialized object.
+    The TopoDS_Shape objects are hashed to create a unique id.
+    The digest is the sha256 hash of the serialized object, see
+    fingerprint.shape_digest for the memoization.
 
     @param obj: The object of type TopoDS_Shape or a subclass
 
     @return: The unique id of the object
     """
-    sha = sha256()
     objs = [obj] if not isinstance(obj, (tuple, list)) else obj
-    for o in objs:
-        sha.update(serialize(o.wrapped if is_wrapped(o) else o))
+    with profiler.span("hash", objects=len(objs)):
+        digests = [shape_digest(o.wrapped if is_wrapped(o) else o) for o in objs]
+    if len(digests) == 1:
+        return digests[0]
+
+    sha = sha256()
+    for digest in digests:
+        sha.update(digest.encode())
 
     return sha.hexdigest()
 
 
+# ================================ Type dispatch ================================ #
+
+# Handlers for user types, see register_handler: class -> handler
+_handlers: Dict[type, Any] = {}
+
+# Memoized dispatch table: (class, class of wrapped) -> list of (kind, check, handler)
+_dispatch: Dict[Tuple[type, type], List[Tuple[str, Any, Any]]] = {}
+
+_NOT_WRAPPED = object()
+_NO_ITEM = object()
+
+
+def register_handler(cls: type, handler: Union[Any, None]) -> None:
+    """
+    Register a handler for objects of a class (and its subclasses). Registered
+    handlers take precedence over the built-in handlers.
+    The handler is called as handler(converter, cad_obj, name, color, alpha, level)
+    and returns an OcpObject or OcpGroup, e.g. by calling converter.to_ocp with an
+    object of a known type, or None to skip the object.
+
+    @param cls: The class of the objects
+    @param handler: The handler function (None: remove the handler of cls)
+    """
+    if handler is None:
+        _handlers.pop(cls, None)
+    else:
+        _handlers[cls] = handler
+    _dispatch.clear()
+
+
+def _is_empty(cad_obj: Any) -> bool:
+    """
+    Check whether a wrapped object has no shape or an iterable has no items,
+    without materializing the items.
+
+    @param cad_obj: The object
+
+    @return: True if the object is empty
+    """
+    if is_wrapped(cad_obj):
+        if cad_obj.wrapped is None:
+            return True
+        if is_topods_shape(cad_obj.wrapped) and isinstance(cad_obj, Iterable):
+            # wrapped shapes iterate over the sub shapes of the TopoDS_Iterator
+            return not TopoDS_Iterator(cad_obj.wrapped).More()
+    if not isinstance(cad_obj, Iterable):
+        return False
+    if hasattr(cad_obj, "__len__"):
+        return len(cad_obj) == 0
+    return next(iter(cad_obj), _NO_ITEM) is _NO_ITEM
+
+
+def _is_generic_list(cad_obj: List) -> bool:
+    # ShapeLists with objects of the same type and no compounds are no generic lists
+    return not (
+        all(type(cad_obj[0]) == type(o) for o in cad_obj)
+        and not any(class_name(o) == "Compound" for o in cad_obj)
+    )
+
+
+def _is_build123d_assembly(cad_obj: Compound) -> bool:
+    return isinstance(cad_obj.children, (list, tuple)) and len(cad_obj.children) > 0
+
+
+def _classify(cad_obj: Any) -> List[Tuple[str, Any, Any]]:
+    """
+    Evaluate the type predicates for an object in the precedence of the handlers.
+    Predicates that only depend on the class of the object and of its wrapped
+    object are evaluated here, the others are returned as checks.
+
+    @param cad_obj: The representative object of its class
+
+    @return: The candidates as list of (kind, check, handler). The first candidate
+             whose check is None or check(cad_obj, unroll_compounds) is True wins.
+    """
+    for cls in type(cad_obj).__mro__:
+        if cls in _handlers:
+            return [("custom", None, _handlers[cls])]
+
+    if (
+        isinstance(cad_obj, enum.Enum)
+        or is_ocp_color(cad_obj)
+        or isinstance(cad_obj, (int, float, bool, str, np.number, np.ndarray))
+    ):
+        return [("skip", None, None)]
+
+    if is_vector(cad_obj) or is_gp_vec(cad_obj):
+        return [("vector", None, None)]
+
+    candidates = []
+
+    if (
+        not is_cadquery_sketch(cad_obj)
+        and not is_vertex(cad_obj)
+        and (is_wrapped(cad_obj) or isinstance(cad_obj, Iterable))
+    ):
+        candidates.append(("empty", lambda o, _: _is_empty(o), None))
+
+    if isinstance(cad_obj, (list, tuple)):
+        if is_build123d_shapelist(cad_obj):
+            candidates.append(("list", lambda o, _: _is_generic_list(o), None))
+        else:
+            return candidates + [("list", None, None)]
+
+    if is_compound(cad_obj):
+        candidates.append(
+            ("compound", lambda o, u: u or is_mixed_compound(o.wrapped), None)
+        )
+    elif is_topods_compound(cad_obj):
+        candidates.append(("compound", lambda o, u: u or is_mixed_compound(o), None))
+
+    if isinstance(cad_obj, dict):
+        return candidates + [("dict", None, None)]
+
+    if (is_build123d_compound(cad_obj) or is_build123d_shape(cad_obj)) and hasattr(
+        cad_obj, "children"
+    ):
+        candidates.append(
+            ("build123d_assembly", lambda o, _: _is_build123d_assembly(o), None)
+        )
+
+    if is_cadquery_assembly(cad_obj):
+        kind = "cadquery_assembly"
+    elif isinstance(cad_obj, OcpWrapper):
+        kind = "ocp_wrapper"
+    elif is_build123d_shapelist(cad_obj):
+        kind = "shape_list"
+    elif is_cadquery(cad_obj):
+        # empty workplanes are shown as planes
+        candidates.append(("workplane", lambda o, _: len(o.objects) > 0, None))
+        kind = "location_plane"
+    elif is_build123d_locationlist(cad_obj):
+        kind = "location_list"
+    elif is_build123d(cad_obj):
+        kind = "build123d_builder"
+    elif (
+        is_topods_shape(cad_obj)
+        or is_build123d_shape(cad_obj)
+        or is_cadquery_shape(cad_obj)
+    ):
+        kind = "shapes"
+    elif is_cadquery_sketch(cad_obj):
+        kind = "cadquery_sketch"
+    elif (
+        is_build123d_location(cad_obj)
+        or is_toploc_location(cad_obj)
+        or is_build123d_plane(cad_obj)
+        or is_gp_plane(cad_obj)
+    ):
+        kind = "location_plane"
+    elif is_build123d_axis(cad_obj) or is_gp_axis(cad_obj):
+        kind = "axis"
+    else:
+        kind = "unknown"
+
+    return candidates + [(kind, None, None)]
+
+
+def dispatch(cad_obj: Any, unroll_compounds: bool = False) -> Tuple[str, Any]:
+    """
+    Find the handler kind for an object. The type predicates are evaluated once per
+    class of the object and of its wrapped object and memoized.
+
+    @param cad_obj: The object
+    @param unroll_compounds: The flag to unroll compounds
+
+    @return: The kind and the registered handler (or None for built-in kinds)
+    """
+    key = (type(cad_obj), type(getattr(cad_obj, "wrapped", _NOT_WRAPPED)))
+    candidates = _dispatch.get(key)
+    if candidates is None:
+        candidates = _dispatch[key] = _classify(cad_obj)
+
+    for kind, check, handler in candidates:
+        if check is None or check(cad_obj, unroll_compounds):
+            return kind, handler
+
+    # not reached, the last candidate has no check
+    return "unknown", None
+
+
 class OcpConverter:
     """The class to filter obejcts and convert them to OcpObject and OcpGroup hierarchies."""
 
-    def __init__(self, progress: Union[Progress, None] = None):
+    def __init__(self, progress: Union[Progress, None] = None, dedup: bool = False):
         """The initializer of the OcpConverter.
         @param progress: The progress class to provide updates during the conversion
+        @param dedup: Also share instances between shapes with different TShapes
+                      that have the same geometry up to a rigid transformation
         """
         self.instances: List[TopoDS_Shape] = []
+        # index of self.instances by TShape hash: hash -> list of instance refs
+        self.instance_index: Dict[int, List[int]] = {}
+        self.dedup = dedup
+        # index of self.instances by geometry: signature -> list of (ref, points)
+        self.geometry_index: Dict[Tuple, List[Tuple[int, Any]]] = {}
+        self.occurrences = 0
+        self.meshes_saved = 0
         self.ocp = None
         self.progress = progress
         self.default_color = get_default("default_color")
@@ -188,8 +392,10 @@ class OcpConverter:
     ) -> Tuple[int, TopLoc_Location]:
         """
         Identify if the object is already available in the instances list based on
-        comparing their TShapes.
-        If not, create a new instance and add it to the list.
+        comparing their TShapes. Instances are looked up by the hash of their TShape.
+        With dedup, instances with the same geometry signature are checked next and
+        reused if a rigid transformation maps them onto the object. If not, create
+        a new instance and add it to the list.
 
         @param obj: The object of type TopoDS_Shape or a subclass
         @param cache_id: The unique id of the object
@@ -204,8 +410,9 @@ class OcpConverter:
         obj2 = downcast(obj.Moved(loc.Inverted()))
 
         # check if the same instance is already available
-        for i, instance in enumerate(self.instances):
-            if instance["obj"].TShape() == obj2.TShape():
+        key = tshape_hash(obj2)
+        for i in self.instance_index.get(key, ()):
+            if self.instances[i]["obj"].TShape() == obj2.TShape():
                 ref = i
 
                 if self.progress is not None:
@@ -213,11 +420,26 @@ class OcpConverter:
 
                 break
 
+        if ref is None and self.dedup:
+            signature, points = geometry_signature(obj2)
+            for i, instance_points in self.geometry_index.get(signature, ()):
+                trsf = rigid_transform(instance_points, points)
+                if trsf is not None:
+                    # obj2 is the instance moved by trsf
+                    ref = i
+                    loc = loc * TopLoc_Location(trsf)
+                    self.meshes_saved += 1
+                    break
+
         if ref is None:
             # append the new instance
             ref = len(self.instances)
             self.instances.append({"obj": obj2, "cache_id": cache_id, "name": name})
+            self.instance_index.setdefault(key, []).append(ref)
+            if self.dedup:
+                self.geometry_index.setdefault(signature, []).append((ref, points))
 
+        self.occurrences += 1
         return ref, loc
 
     def unify(
@@ -364,9 +586,9 @@ class OcpConverter:
         sketch_local: bool,
         helper_scale: float,
         level: int,
-    ) -> OcpGroup:
+    ) -> Iterator:
         """
-        Unroll the objects in an iterable and convert them to OcpObject and OcpGroup hierarchies.
+        Generator unrolling the objects in an iterable and converting them to OcpObject and OcpGroup hierarchies.
 
         @param objs: The list of objects
         @param obj_name: The name of the object
@@ -376,12 +598,12 @@ class OcpConverter:
         @param helper_scale: The scale of the helper objects
         @param level: The level of the hierarchy
 
-        @return: The OcpGroup hierarchy
+        @return: Generator returning the OcpGroup hierarchy
         """
         ocp_obj: OcpGroup = OcpGroup(name=obj_name)
         for name, obj in objs:
 
-            result = self.to_ocp(
+            result = yield self._nested(
                 obj,
                 names=[name],
                 colors=[color],
@@ -404,9 +626,9 @@ class OcpConverter:
         sketch_local: bool,
         helper_scale: float,
         level: int,
-    ) -> OcpGroup:
+    ) -> Iterator:
         """
-        Handle lists and tuples of objects.
+        Generator handling lists and tuples of objects.
 
         @param cad_obj: The list or tuple of objects
         @param obj_name: The name of the object
@@ -416,17 +638,19 @@ class OcpConverter:
         @param helper_scale: The scale of the helper objects
         @param level: The level of the hierarchy
 
-        @return: The OcpGroup hierarchy
+        @return: Generator returning the OcpGroup hierarchy
         """
         _debug(level, "handle_list_tuple", obj_name)
-        return self._unroll_iterable(
-            zip([None] * len(cad_obj), cad_obj),
-            get_name(cad_obj, obj_name, "List"),
-            color,
-            alpha,
-            sketch_local,
-            helper_scale,
-            level,
+        return (
+            yield from self._unroll_iterable(
+                zip([None] * len(cad_obj), cad_obj),
+                get_name(cad_obj, obj_name, "List"),
+                color,
+                alpha,
+                sketch_local,
+                helper_scale,
+                level,
+            )
         )
 
     def handle_dict(
@@ -438,9 +662,9 @@ class OcpConverter:
         sketch_local: bool,
         helper_scale: float,
         level: int,
-    ) -> OcpGroup:
+    ) -> Iterator:
         """
-        Handle dictionaries of objects.
+        Generator handling dictionaries of objects.
 
         @param cad_obj: The dictionary of objects
         @param obj_name: The name of the object
@@ -449,18 +673,20 @@ class OcpConverter:
         @param sketch_local: The flag to render the sketch_local
         @param helper_scale: The scale of the helper objects
 
-        @return: The OcpGroup hierarchy
+        @return: Generator returning the OcpGroup hierarchy
         """
         _debug(level, "handle_dict", obj_name)
 
-        return self._unroll_iterable(
-            cad_obj.items(),
-            get_name(cad_obj, obj_name, "Dict"),
-            color,
-            alpha,
-            sketch_local,
-            helper_scale,
-            level,
+        return (
+            yield from self._unroll_iterable(
+                cad_obj.items(),
+                get_name(cad_obj, obj_name, "Dict"),
+                color,
+                alpha,
+                sketch_local,
+                helper_scale,
+                level,
+            )
         )
 
     def handle_compound(
@@ -472,9 +698,9 @@ class OcpConverter:
         sketch_local: bool,
         helper_scale: float,
         level: int,
-    ) -> OcpGroup:
+    ) -> Iterator:
         """
-        Handle compounds and topods_compounds.
+        Generator handling compounds and topods_compounds.
 
         @param cad_obj: The compound or topods_compound
         @param obj_name: The name of the object
@@ -484,7 +710,7 @@ class OcpConverter:
         @param helper_scale: The scale of the helper objects
         @param level: The level of the hierarchy
 
-        @return: The OcpGroup hierarchy
+        @return: Generator returning the OcpGroup hierarchy
         """
         _debug(level, f"handle_compound", obj_name)
 
@@ -493,14 +719,16 @@ class OcpConverter:
         elif is_topods_compound(cad_obj):
             cad_obj = list(list_topods_compound(cad_obj))
 
-        return self._unroll_iterable(
-            zip([None] * len(cad_obj), cad_obj),
-            get_name(cad_obj, obj_name, "Compound"),
-            color,
-            alpha,
-            sketch_local,
-            helper_scale,
-            level,
+        return (
+            yield from self._unroll_iterable(
+                zip([None] * len(cad_obj), cad_obj),
+                get_name(cad_obj, obj_name, "Compound"),
+                color,
+                alpha,
+                sketch_local,
+                helper_scale,
+                level,
+            )
         )
 
     # ================================= Assemblies ================================== #
@@ -514,9 +742,9 @@ class OcpConverter:
         render_joints: bool,
         helper_scale: float,
         level: int,
-    ) -> OcpGroup:
+    ) -> Iterator:
         """
-        Handle build123d assemblies.
+        Generator handling build123d assemblies.
 
         @param cad_obj: The build123d assembly (Compound with children)
         @param obj_name: The name of the object
@@ -526,7 +754,7 @@ class OcpConverter:
         @param helper_scale: The scale of the helper objects
         @param level: The level of the hierarchy
 
-        @return: The OcpGroup hierarchy
+        @return: Generator returning the OcpGroup hierarchy
         """
         _debug(level, "handle_build123d_assembly", obj_name)
 
@@ -535,7 +763,7 @@ class OcpConverter:
         ocp_obj = OcpGroup(name=name, loc=location)
 
         for child in cad_obj.children:
-            sub_obj = self.to_ocp(
+            sub_obj = yield self._nested(
                 child,
                 names=[None if child.label == "" else child.label],
                 colors=[child.color if color is None else color],
@@ -573,9 +801,9 @@ class OcpConverter:
         render_mates: bool,
         helper_scale: float,
         level: int,
-    ) -> OcpGroup:
+    ) -> Iterator:
         """
-        Handle cadquery assemblies.
+        Generator handling cadquery assemblies.
 
         @param cad_obj: The cadquery assembly
         @param obj_name: The name of the object
@@ -585,14 +813,14 @@ class OcpConverter:
         @param helper_scale: The scale of the helper objects
         @param level: The level of the hierarchy
 
-        @return: The OcpGroup hierarchy
+        @return: Generator returning the OcpGroup hierarchy
         """
         _debug(level, "handle_cadquery_assembly", obj_name)
         name = get_name(cad_obj, obj_name, "Assembly")
 
         ocp_obj = OcpGroup(name=name, loc=get_location(cad_obj, as_none=False))
         if cad_obj.obj is not None:
-            sub_obj = self.to_ocp(
+            sub_obj = yield self._nested(
                 cad_obj.obj,
                 names=[cad_obj.name],
                 colors=[cad_obj.color if color is None else color],
@@ -627,7 +855,7 @@ class OcpConverter:
                     ocp_obj.add(mates)
 
         for child in cad_obj.children:
-            sub_obj = self.to_ocp(
+            sub_obj = yield self._nested(
                 child,
                 names=[child.name],
                 helper_scale=helper_scale,
@@ -1225,6 +1453,126 @@ class OcpConverter:
 
         @return: The OcpObject or OcpGroup hierarchy
         """
+        return self._run(
+            self._to_ocp(
+                *cad_objs,
+                names=names,
+                colors=colors,
+                alphas=alphas,
+                loc=loc,
+                render_mates=render_mates,
+                render_joints=render_joints,
+                helper_scale=helper_scale,
+                default_color=default_color,
+                show_parent=show_parent,
+                sketch_local=sketch_local,
+                unroll_compounds=unroll_compounds,
+                level=level,
+            )
+        )
+
+    def to_ocp_object(
+        self,
+        cad_obj: Union[
+            ShapeLike, Compound, Workplane, List, Dict, Assembly, OcpWrapper
+        ],
+        name: Union[str, None] = None,
+        color: Union[ColorLike, None] = None,
+        alpha: Union[float, None] = None,
+        render_mates: bool = False,
+        render_joints: bool = False,
+        helper_scale: float = 1.0,
+        show_parent: bool = False,
+        sketch_local: bool = False,
+        unroll_compounds: bool = False,
+        level=0,
+    ) -> Union[OcpGroup, OcpObject, None]:
+        """
+        Convert a single object to an OcpObject or OcpGroup hierarchy, i.e. without
+        the group that to_ocp puts around its objects.
+
+        @param cad_obj: The object
+        @param name: The name of the object
+        @param color: The color of the object
+        @param alpha: The alpha value of the object
+        @param render_mates: The flag to render the mates
+        @param render_joints: The flag to render the joints
+        @param helper_scale: The scale of the helper objects
+        @param show_parent: The flag to show the parent
+        @param sketch_local: The flag to render the sketch local
+        @param unroll_compounds: The flag to unroll compounds
+        @param level: The level of the hierarchy
+
+        @return: The OcpObject or OcpGroup hierarchy, None for skipped objects
+        """
+        return self._run(
+            self._to_ocp_object(
+                cad_obj,
+                name,
+                color,
+                alpha,
+                render_mates=render_mates,
+                render_joints=render_joints,
+                helper_scale=helper_scale,
+                show_parent=show_parent,
+                sketch_local=sketch_local,
+                unroll_compounds=unroll_compounds,
+                level=level,
+            )
+        )
+
+    @staticmethod
+    def _nested(*cad_objs, **kwargs) -> Tuple[Tuple, Dict]:
+        # the request of a handler to convert its children, see _run
+        return cad_objs, kwargs
+
+    def _run(self, call: Iterator) -> OcpGroup:
+        """
+        Run a conversion with an explicit stack instead of recursion. The container
+        handlers yield the to_ocp calls for their children (see _nested), which are
+        pushed onto the stack. Their results are sent back to the waiting handler.
+        Hence the depth of a hierarchy is not limited by the recursion limit.
+
+        @param call: The _to_ocp generator
+
+        @return: The OcpGroup hierarchy
+        """
+        stack = [call]
+        result = None
+        while stack:
+            try:
+                cad_objs, kwargs = stack[-1].send(result)
+            except StopIteration as ex:
+                stack.pop()
+                result = ex.value
+            else:
+                stack.append(self._to_ocp(*cad_objs, **kwargs))
+                result = None
+        return result
+
+    def _to_ocp(
+        self,
+        *cad_objs: Union[
+            ShapeLike, Compound, Workplane, List, Dict, Assembly, OcpWrapper
+        ],
+        names: Union[List[Union[str, None]], None] = None,
+        colors: Union[List[Union[ColorLike, None]], None] = None,
+        alphas: Union[List[Union[float, None]], None] = None,
+        loc: LocationLike = None,
+        render_mates: bool = False,
+        render_joints: bool = False,
+        helper_scale: float = 1.0,
+        default_color: Union[ColorLike, None] = None,
+        show_parent: bool = False,
+        sketch_local: bool = False,
+        unroll_compounds: bool = False,
+        level=0,
+    ) -> Iterator:
+        """
+        Generator converting a list of objects, see to_ocp for the parameters.
+
+        @return: Generator returning the OcpObject or OcpGroup hierarchy
+        """
         if loc is None:
             loc = identity_location()
         group = OcpGroup(loc=loc)
@@ -1266,191 +1614,203 @@ class OcpConverter:
         # =========================== Loop over all objects ========================== #
 
         for cad_obj, obj_name, color, alpha in zip(cad_objs, names, colors, alphas):  # type: ignore [arg-type]
-
-            # =================== Silently skip enums and known types =================== #
-            if (
-                isinstance(cad_obj, enum.Enum)
-                or is_ocp_color(cad_obj)
-                or isinstance(cad_obj, (int, float, bool, str, np.number, np.ndarray))
-            ):
+            ocp_obj = yield from self._to_ocp_object(
+                cad_obj,
+                obj_name,
+                color,
+                alpha,
+                render_mates=render_mates,
+                render_joints=render_joints,
+                helper_scale=helper_scale,
+                show_parent=show_parent,
+                sketch_local=sketch_local,
+                unroll_compounds=unroll_compounds,
+                level=level,
+            )
+            if ocp_obj is None:
                 continue
 
-            # =========================== Map Vector to Vertex ========================== #
+            if DEBUG:
+                print(f"{'  '*level}=>", ocp_obj)
 
-            if is_vector(cad_obj) or is_gp_vec(cad_obj):
-                if isinstance(cad_obj, Iterable):
-                    target = list(cad_obj)
-                elif hasattr(cad_obj, "toTuple"):
-                    target = cad_obj.toTuple()
-                else:
-                    target = cad_obj.XYZ().Coord()  # type: ignore [union-attr]
+            if not (isinstance(ocp_obj, OcpGroup) and ocp_obj.length == 0):
+                group.add(ocp_obj)
 
-                cad_obj = vertex(target)
+        group.make_unique_names()
 
-            # ========================= Empty list or compounds ========================= #
+        if group.length == 1 and isinstance(group.objects[0], OcpGroup):
+            group = group.cleanup()
 
-            if (
-                not is_cadquery_sketch(cad_obj)
-                and not is_vertex(cad_obj)
-                and (
-                    (is_wrapped(cad_obj) and cad_obj.wrapped is None)
-                    or (isinstance(cad_obj, Iterable) and len(list(cad_obj)) == 0)
-                )
-            ):
-                ocp_obj: Union[OcpGroup, OcpObject] = self.handle_empty_iterables(
-                    obj_name, level
-                )
+        return group
 
-            # ================================ Iterables ================================ #
+    def _to_ocp_object(
+        self,
+        cad_obj: Union[
+            ShapeLike, Compound, Workplane, List, Dict, Assembly, OcpWrapper
+        ],
+        obj_name: Union[str, None],
+        color: Union[ColorLike, None],
+        alpha: Union[float, None],
+        render_mates: bool = False,
+        render_joints: bool = False,
+        helper_scale: float = 1.0,
+        show_parent: bool = False,
+        sketch_local: bool = False,
+        unroll_compounds: bool = False,
+        level=0,
+    ) -> Iterator:
+        """
+        Generator converting a single object, see to_ocp_object for the parameters.
 
-            # Generic iterables (tuple, list, but not ShapeList)
-            elif isinstance(cad_obj, (list, tuple)) and not (
-                (
-                    is_build123d_shapelist(cad_obj)
-                    and all(type(cad_obj[0]) == type(o) for o in cad_obj)
-                )
-                and not any([class_name(o) == "Compound" for o in cad_obj])
-            ):
-                ocp_obj = self.handle_list_tuple(
-                    cad_obj, obj_name, color, alpha, sketch_local, helper_scale, level
-                )
-                if ocp_obj.length == 0:
-                    ocp_obj.add(self.handle_empty_iterables(obj_name, level))
-
-            # Compounds / topods_compounds
-            elif (
-                is_compound(cad_obj)
-                and (is_mixed_compound(cad_obj.wrapped) or unroll_compounds)
-            ) or (
-                is_topods_compound(cad_obj)
-                and (is_mixed_compound(cad_obj) or unroll_compounds)
-            ):
-                ocp_obj = self.handle_compound(
-                    cad_obj, obj_name, color, alpha, sketch_local, helper_scale, level
-                )
+        @return: Generator returning the OcpObject or OcpGroup hierarchy or None
+        """
+        kind, handler = dispatch(cad_obj, unroll_compounds)
 
-            # Dicts
-            elif isinstance(cad_obj, dict):
-                ocp_obj = self.handle_dict(
-                    cad_obj, obj_name, color, alpha, sketch_local, helper_scale, level
-                )
+        # =================== Silently skip enums and known types =================== #
 
-            # =============================== Assemblies ================================ #
-
-            elif is_build123d_assembly(cad_obj):
-                ocp_obj = self.handle_build123d_assembly(
-                    cad_obj,
-                    obj_name,
-                    color,
-                    alpha,
-                    render_joints,
-                    helper_scale,
-                    level,
-                )
+        if kind == "skip":
+            return None
 
-            elif is_cadquery_assembly(cad_obj):
-                ocp_obj = self.handle_cadquery_assembly(
-                    cad_obj,
-                    obj_name,
-                    color,
-                    alpha,
-                    render_mates,
-                    helper_scale,
-                    level,
-                )
-            # =============================== Conversions =============================== #
+        # =========================== Map Vector to Vertex ========================== #
 
-            # OcpWrapper (ImageFace, CoordSystem, CoordAxis, etc.)
-            elif isinstance(cad_obj, OcpWrapper):
-                ocp_obj = self.handle_ocp_wrapper(cad_obj, obj_name)
+        if kind == "vector":
+            if isinstance(cad_obj, Iterable):
+                target = list(cad_obj)
+            elif hasattr(cad_obj, "toTuple"):
+                target = cad_obj.toTuple()
+            else:
+                target = cad_obj.XYZ().Coord()  # type: ignore [union-attr]
 
-            # build123d ShapeList
-            elif is_build123d_shapelist(cad_obj):
-                ocp_obj = self.handle_shape_list(
-                    cad_obj, obj_name, color, alpha, show_parent, level
-                )
+            cad_obj = vertex(target)
+            kind, handler = dispatch(cad_obj, unroll_compounds)
 
-            # CadQuery Workplane objects
-            elif is_cadquery(cad_obj) and not is_cadquery_empty_workplane(cad_obj):
-                ocp_obj = self.handle_workplane(
-                    cad_obj, obj_name, color, alpha, show_parent, level
-                )
+        # ============================== Custom handlers ============================ #
 
-            # build123d LocationLists
-            elif is_build123d_locationlist(cad_obj):
-                ocp_obj = self.handle_location_list(
-                    cad_obj, obj_name, helper_scale, level
-                )
+        if kind == "custom":
+            ocp_obj = handler(self, cad_obj, obj_name, color, alpha, level)
+            if ocp_obj is None:
+                return None
 
-            # build123d BuildPart, BuildSketch, BuildLine
-            elif is_build123d(cad_obj):
-                ocp_obj = self.handle_build123d_builder(
-                    cad_obj, obj_name, color, alpha, sketch_local, render_joints, level
-                )
+        # ========================= Empty list or compounds ========================= #
 
-            # TopoDS_Shape, TopoDS_Compound, TopoDS_Edge, TopoDS_Face, TopoDS_Shell,
-            # TopoDS_Solid, TopoDS_Vertex, TopoDS_Wire,
-            # build123d Shape, Compound, Edge, Face, Shell, Solid, Vertex
-            # CadQuery shapes Solid, Shell, Face, Wire, Edge, Vertex
-            elif (
-                is_topods_shape(cad_obj)
-                or is_build123d_shape(cad_obj)
-                or is_cadquery_shape(cad_obj)
-            ):
-                ocp_obj = self.handle_shapes(
-                    cad_obj,
-                    obj_name,
-                    render_joints,
-                    show_parent,
-                    color,
-                    alpha,
-                    level,
-                )
+        elif kind == "empty":
+            ocp_obj: Union[OcpGroup, OcpObject] = self.handle_empty_iterables(
+                obj_name, level
+            )
 
-            # Cadquery sketches
-            elif is_cadquery_sketch(cad_obj):
-                ocp_obj = self.handle_cadquery_sketch(
-                    cad_obj, obj_name, color, alpha, level
-                )
+        # ================================ Iterables ================================ #
 
-            # build123d Location/Plane or TopLoc_Location or gp_Pln
-            elif (
-                is_build123d_location(cad_obj)
-                or is_toploc_location(cad_obj)
-                or is_build123d_plane(cad_obj)
-                or is_gp_plane(cad_obj)
-                or is_cadquery_empty_workplane(cad_obj)
-            ):
-                ocp_obj = self.handle_locations_planes(
-                    cad_obj, obj_name, helper_scale, level
-                )
+        # Generic iterables (tuple, list, but not ShapeList)
+        elif kind == "list":
+            ocp_obj = yield from self.handle_list_tuple(
+                cad_obj, obj_name, color, alpha, sketch_local, helper_scale, level
+            )
+            if ocp_obj.length == 0:
+                ocp_obj.add(self.handle_empty_iterables(obj_name, level))
 
-            # build123d Axis or gp_Ax1
-            elif is_build123d_axis(cad_obj) or is_gp_axis(cad_obj):
-                ocp_obj = self.handle_axis(
-                    cad_obj, obj_name, color, helper_scale, level
-                )
+        # Compounds / topods_compounds
+        elif kind == "compound":
+            ocp_obj = yield from self.handle_compound(
+                cad_obj, obj_name, color, alpha, sketch_local, helper_scale, level
+            )
 
-            else:
-                print(
-                    "Unknown object"
-                    + ("" if obj_name is None else f" '{obj_name}'")
-                    + f" of type {type(cad_obj)}"
-                )
-                continue
+        # Dicts
+        elif kind == "dict":
+            ocp_obj = yield from self.handle_dict(
+                cad_obj, obj_name, color, alpha, sketch_local, helper_scale, level
+            )
 
-            if DEBUG:
-                print(f"{'  '*level}=>", ocp_obj)
+        # =============================== Assemblies ================================ #
+
+        elif kind == "build123d_assembly":
+            ocp_obj = yield from self.handle_build123d_assembly(
+                cad_obj,
+                obj_name,
+                color,
+                alpha,
+                render_joints,
+                helper_scale,
+                level,
+            )
 
-            if not (isinstance(ocp_obj, OcpGroup) and ocp_obj.length == 0):
-                group.add(ocp_obj)
+        elif kind == "cadquery_assembly":
+            ocp_obj = yield from self.handle_cadquery_assembly(
+                cad_obj,
+                obj_name,
+                color,
+                alpha,
+                render_mates,
+                helper_scale,
+                level,
+            )
+        # =============================== Conversions =============================== #
 
-        group.make_unique_names()
+        # OcpWrapper (ImageFace, CoordSystem, CoordAxis, etc.)
+        elif kind == "ocp_wrapper":
+            ocp_obj = self.handle_ocp_wrapper(cad_obj, obj_name)
 
-        if group.length == 1 and isinstance(group.objects[0], OcpGroup):
-            group = group.cleanup()
+        # build123d ShapeList
+        elif kind == "shape_list":
+            ocp_obj = self.handle_shape_list(
+                cad_obj, obj_name, color, alpha, show_parent, level
+            )
 
-        return group
+        # CadQuery Workplane objects
+        elif kind == "workplane":
+            ocp_obj = self.handle_workplane(
+                cad_obj, obj_name, color, alpha, show_parent, level
+            )
+
+        # build123d LocationLists
+        elif kind == "location_list":
+            ocp_obj = self.handle_location_list(cad_obj, obj_name, helper_scale, level)
+
+        # build123d BuildPart, BuildSketch, BuildLine
+        elif kind == "build123d_builder":
+            ocp_obj = self.handle_build123d_builder(
+                cad_obj, obj_name, color, alpha, sketch_local, render_joints, level
+            )
+
+        # TopoDS_Shape, TopoDS_Compound, TopoDS_Edge, TopoDS_Face, TopoDS_Shell,
+        # TopoDS_Solid, TopoDS_Vertex, TopoDS_Wire,
+        # build123d Shape, Compound, Edge, Face, Shell, Solid, Vertex
+        # CadQuery shapes Solid, Shell, Face, Wire, Edge, Vertex
+        elif kind == "shapes":
+            ocp_obj = self.handle_shapes(
+                cad_obj,
+                obj_name,
+                render_joints,
+                show_parent,
+                color,
+                alpha,
+                level,
+            )
+
+        # Cadquery sketches
+        elif kind == "cadquery_sketch":
+            ocp_obj = self.handle_cadquery_sketch(
+                cad_obj, obj_name, color, alpha, level
+            )
+
+        # build123d Location/Plane or TopLoc_Location or gp_Pln or empty Workplane
+        elif kind == "location_plane":
+            ocp_obj = self.handle_locations_planes(
+                cad_obj, obj_name, helper_scale, level
+            )
+
+        # build123d Axis or gp_Ax1
+        elif kind == "axis":
+            ocp_obj = self.handle_axis(cad_obj, obj_name, color, helper_scale, level)
+
+        else:
+            print(
+                "Unknown object"
+                + ("" if obj_name is None else f" '{obj_name}'")
+                + f" of type {type(cad_obj)}"
+            )
+            return None
+
+        return ocp_obj
 
 
 #
@@ -1471,6 +1831,8 @@ def to_ocpgroup(
     show_sketch_local: bool = True,
     loc: LocationLike = None,
     progress: Union[Progress, None] = None,
+    dedup: bool = False,
+    report: bool = False,
 ) -> Tuple[OcpGroup, List[Any]]:
     """
     Central converter routine to convert a list of objects to an OcpGroup hierarchy.
@@ -1487,75 +1849,133 @@ def to_ocpgroup(
     @param show_sketch_local: The flag to render the sketch local
     @param loc: The location of the objects
     @param progress: The progress bar
+    @param dedup: Share instances between shapes with the same geometry up to a
+                  rigid transformation, also if they have different TShapes
+    @param report: Also return the instancing statistics
 
-    @return: The OcpGroup hierarchy
+    @return: The OcpGroup hierarchy and the instances, and with report a dict with
+             the number of occurrences, instances and meshes saved by dedup
     """
-    converter = OcpConverter(progress=progress)
-    ocp_group = converter.to_ocp(
-        *cad_objs,
-        names=names,
-        colors=colors,
-        alphas=alphas,
-        loc=loc,
-        render_mates=render_mates,
-        render_joints=render_joints,
-        helper_scale=helper_scale,
-        default_color=default_color,
-        show_parent=show_parent,
-        sketch_local=show_sketch_local,
-    )
+    converter = OcpConverter(progress=progress, dedup=dedup)
+    with profiler.span("convert", objects=len(cad_objs)) as span:
+        ocp_group = converter.to_ocp(
+            *cad_objs,
+            names=names,
+            colors=colors,
+            alphas=alphas,
+            loc=loc,
+            render_mates=render_mates,
+            render_joints=render_joints,
+            helper_scale=helper_scale,
+            default_color=default_color,
+            show_parent=show_parent,
+            sketch_local=show_sketch_local,
+        )
+        span.set(
+            instances=len(converter.instances), meshes_saved=converter.meshes_saved
+        )
+
+    if report:
+        stats = {
+            "occurrences": converter.occurrences,
+            "instances": len(converter.instances),
+            "meshes_saved": converter.meshes_saved,
+        }
+        return ocp_group, converter.instances, stats
 
     return ocp_group, converter.instances
 
 
-def tessellate_group(
+def tessellate_group_iter(
     group: OcpGroup,
     instances: List[TopoDS_Shape],
     kwargs: Union[Dict, None] = None,
     progress: Union[Progress, None] = None,
     timeit: bool = False,
-) -> Tuple[List, Dict, Dict, Dict]:
+    workers: Union[int, None] = None,
+    known: Union[Dict[str, Tuple[Dict, float]], None] = None,
+    collect: Union[Callable, None] = None,
+) -> Iterator[Tuple[Union[int, None], Any]]:
     """
-    Tessellate a OcpGroup and instances as converted by to_ocp_group.
+    Tessellate a OcpGroup and instances as converted by to_ocp_group and yield
+    every meshed instance as soon as it is available.
 
     @param group: The OcpGroup
     @param instances: The instances of the group
     @param kwargs: The keyword arguments
     @param progress: The progress bar
     @param timeit: The flag to measure the time
-
-    @return: The meshed instances, the shapes, and the mapping
+    @param workers: The number of processes to tessellate the instances in parallel
+                    (None or 1: tessellate sequentially in this process)
+    @param known: Already meshed instances as dict cache_id -> (mesh, quality).
+                  These instances are neither measured nor tessellated again,
+                  newly meshed instances are added to the dict
+    @param collect: Function (group, instances, discretize_edges, convert_vertices)
+                    returning the mapping and the shapes tree
+                    (None: collect the whole group, see OcpGroup.collect)
+
+    @return: Generator of (ref, mesh) tuples, one per instance, in the order they
+             are finished. The last tuple is (None, (shapes, mapping)), with the
+             bounding box of the group in shapes["bb"]
     """
 
-    def get_bb_max(shapes, meshed_instances, loc=None, bbox=None):
-        for shape in shapes["parts"]:
-            new_loc = loc if shape["loc"] is None else loc * tq_to_loc(*shape["loc"])
-            if shape.get("parts") is None:
-                if shape["type"] == "shapes":
-                    # Solids, shells and faces are instances and need to calculate
-                    # the bounding box at the accumulated location
-                    ind = shape["shape"]["ref"]
-                    vertices = meshed_instances[ind]["vertices"]
-                    bb = np_bbox(vertices, *loc_to_tq(new_loc))
-                else:
-                    # wires, edges, vertices already have a bounding box
-                    bb = shape["bb"].to_dict()
-                    # delete the BoundingBox object, it can't be serialized
-                    del shape["bb"]
+    def get_bb_max(shapes, meshed_instances, loc=None):
+        # Solids, shells and faces are instances: the corners of their local
+        # bounding box are computed once per instance and then transformed to the
+        # accumulated location of all occurrences in one pass
+        corners = {}
+        refs = []
+        matrices = []
+        bbs = []
+
+        def walk(shapes, loc):
+            # explicit stack instead of recursion for deep hierarchies
+            stack = [(shapes, loc)]
+            while stack:
+                shapes, loc = stack.pop()
+                for shape in shapes["parts"]:
+                    new_loc = (
+                        loc if shape["loc"] is None else loc * tq_to_loc(*shape["loc"])
+                    )
+                    if shape.get("parts") is not None:
+                        stack.append((shape, new_loc))
+
+                    elif shape["type"] == "shapes":
+                        ind = shape["shape"]["ref"]
+                        if ind not in corners:
+                            corners[ind] = aabb_corners(
+                                meshed_instances[ind]["vertices"]
+                            )
+                        if corners[ind] is not None:
+                            refs.append(ind)
+                            matrices.append(loc_to_matrix(new_loc))
+                    else:
+                        # wires, edges, vertices already have a bounding box
+                        bbs.append(shape["bb"].to_dict())
+                        # delete the BoundingBox object, it can't be serialized
+                        del shape["bb"]
+
+        walk(shapes, loc)
+
+        if refs:
+            index = {
+                ind: i for i, ind in enumerate(corners) if corners[ind] is not None
+            }
+            local = np.stack([c for c in corners.values() if c is not None])
+            bbs.append(
+                np_bbox_transformed(
+                    local[[index[ind] for ind in refs]], np.stack(matrices)
+                )
+            )
 
-                if bbox is None:
-                    bbox = bb
-                else:
-                    bbox = {
-                        "xmin": min(bbox["xmin"], bb["xmin"]),
-                        "xmax": max(bbox["xmax"], bb["xmax"]),
-                        "ymin": min(bbox["ymin"], bb["ymin"]),
-                        "ymax": max(bbox["ymax"], bb["ymax"]),
-                        "zmin": min(bbox["zmin"], bb["zmin"]),
-                        "zmax": max(bbox["zmax"], bb["zmax"]),
-                    }
-            else:
-                bbox = get_bb_max(shape, meshed_instances, new_loc, bbox)
+        bbox = {
+            "xmin": min(bb["xmin"] for bb in bbs),
+            "xmax": max(bb["xmax"] for bb in bbs),
+            "ymin": min(bb["ymin"] for bb in bbs),
+            "ymax": max(bb["ymax"] for bb in bbs),
+            "zmin": min(bb["zmin"] for bb in bbs),
+            "zmax": max(bb["zmax"] for bb in bbs),
+        }
 
         # Increase bounding box dimensions that are too small
         # Will only be used to calculate the viewing box size of the group
@@ -1567,7 +1987,7 @@ def tessellate_group(
         return bbox
 
     def _discretize_edges(obj, name, id_):
-        with Timer(timeit, name, "bounding box:", 2) as t:
+        with Timer(timeit, name, "bounding box:", 2, span="bbox") as t:
             deviation = preset("deviation", kwargs.get("deviation"))
             edge_accuracy = preset("edge_accuracy", kwargs.get("edge_accuracy"))
 
@@ -1576,7 +1996,7 @@ def tessellate_group(
             deflection = quality / 100 if edge_accuracy is None else edge_accuracy
             t.info = str(bb)
 
-        with Timer(timeit, name, "discretize:  ", 2) as t:
+        with Timer(timeit, name, "discretize:  ", 2, span="discretize") as t:
             t.info = f"quality: {quality}, deflection: {deflection}"
             disc_edges = discretize_edges(obj, deflection, id_)
 
@@ -1591,22 +2011,39 @@ def tessellate_group(
     if kwargs is None:
         kwargs = {}
 
-    mapping, shapes = group.collect(
-        "", instances, None, _discretize_edges, _convert_vertices
-    )
+    if collect is None:
+        mapping, shapes = group.collect(
+            "", instances, None, _discretize_edges, _convert_vertices
+        )
+    else:
+        mapping, shapes = collect(
+            group, instances, _discretize_edges, _convert_vertices
+        )
 
-    meshed_instances = []
+    meshed_instances = [None] * len(instances)
 
     deviation = preset("deviation", kwargs.get("deviation"))
     angular_tolerance = preset("angular_tolerance", kwargs.get("angular_tolerance"))
 
     render_edges = preset("render_edges", kwargs.get("render_edges"))
     render_normals = preset("render_normals", kwargs.get("render_normals"))
+    weld_tolerance = preset("weld_tolerance", kwargs.get("weld_tolerance"))
 
     max_accuracy = 0.0
+    parallel = workers is not None and workers > 1
+    tasks = []
+    task_refs = []
 
     for i, instance in enumerate(instances):
-        with Timer(timeit, f"instance({i})", "compute quality:", 2) as t:
+        if known is not None and instance["cache_id"] in known:
+            mesh, quality = known[instance["cache_id"]]
+            if quality > max_accuracy:
+                max_accuracy = quality
+            meshed_instances[i] = mesh
+            yield i, mesh
+            continue
+
+        with Timer(timeit, f"instance({i})", "compute quality:", 2, span="bbox") as t:
             shape = instance["obj"]
             # A first rough estimate of the bounding box.
             # Will be too large, but is sufficient for computing the quality
@@ -1618,8 +2055,17 @@ def tessellate_group(
             if quality > max_accuracy:
                 max_accuracy = quality
 
+        if parallel:
+            tasks.append((shape, instance["cache_id"], quality))
+            task_refs.append(i)
+            continue
+
         with Timer(
-            timeit, f"instance({i}):{instance['name']}", "tessellate:     ", 2
+            timeit,
+            f"instance({i}):{instance['name']}",
+            "tessellate:     ",
+            2,
+            span="mesh",
         ) as t:
             mesh = tessellate(
                 shape,
@@ -1631,14 +2077,36 @@ def tessellate_group(
                 compute_edges=render_edges,
                 progress=None if timeit else progress,
                 shape_id="n/a",
+                weld_tolerance=weld_tolerance,
             )
-            meshed_instances.append(mesh)
+            meshed_instances[i] = mesh
             t.info = (
                 f"{{quality:{quality:.4f}, angular_tolerance:{angular_tolerance:.2f}}}"
             )
+        if known is not None:
+            known[instance["cache_id"]] = (mesh, quality)
+        yield i, mesh
+
+    if parallel:
+        with Timer(timeit, "", f"tessellate ({workers} workers):", 2, span="mesh") as t:
+            for j, mesh in tessellate_parallel_iter(
+                tasks,
+                deviation=deviation,
+                angular_tolerance=angular_tolerance,
+                compute_edges=render_edges,
+                workers=workers,
+                progress=None if timeit else progress,
+                weld_tolerance=weld_tolerance,
+            ):
+                i = task_refs[j]
+                meshed_instances[i] = mesh
+                if known is not None:
+                    known[tasks[j][1]] = (mesh, tasks[j][2])
+                yield i, mesh
+            t.info = f"{{instances:{len(tasks)}}}"
 
     shapes["normal_len"] = max_accuracy / deviation * 4 if render_normals else 0
-    with Timer(timeit, "", "compute bounding box:", 2) as t:
+    with Timer(timeit, "", "compute bounding box:", 2, span="bbox") as t:
         top_loc = (
             identity_location() if shapes["loc"] is None else tq_to_loc(*shapes["loc"])
         )
@@ -1646,6 +2114,56 @@ def tessellate_group(
 
         t.info = str(BoundingBox(shapes["bb"]))
 
+    yield None, (shapes, mapping)
+
+
+def tessellate_group(
+    group: OcpGroup,
+    instances: List[TopoDS_Shape],
+    kwargs: Union[Dict, None] = None,
+    progress: Union[Progress, None] = None,
+    timeit: bool = False,
+    workers: Union[int, None] = None,
+    report: bool = False,
+) -> Tuple[List, Dict, Dict, Dict]:
+    """
+    Tessellate a OcpGroup and instances as converted by to_ocp_group.
+
+    @param group: The OcpGroup
+    @param instances: The instances of the group
+    @param kwargs: The keyword arguments
+    @param progress: The progress bar
+    @param timeit: The flag to measure the time, also records the spans of the
+                   call up to this level (see Profiler.run)
+    @param workers: The number of processes to tessellate the instances in parallel
+                    (None or 1: tessellate sequentially in this process)
+    @param report: Also return the mesh optimization statistics
+
+    @return: The meshed instances, the shapes, and the mapping, and with report a
+             dict with the number of optimized meshes, their vertices and bytes
+             before and after and the bytes saved (see weld_tolerance)
+    """
+    meshed_instances = [None] * len(instances)
+    with profiler.run(timeit):
+        with profiler.span("tessellate_group", instances=len(instances)):
+            for ref, result in tessellate_group_iter(
+                group, instances, kwargs, progress, timeit, workers
+            ):
+                if ref is None:
+                    shapes, mapping = result
+                else:
+                    meshed_instances[ref] = result
+
+    if report:
+        stats = dict.fromkeys(("optimized",) + STATS_FIELDS + ("bytes_saved",), 0)
+        for mesh in meshed_instances:
+            mesh_stats = optimize_stats(mesh)
+            if mesh_stats is not None:
+                stats["optimized"] += 1
+                for key, value in mesh_stats.items():
+                    stats[key] += value
+        return meshed_instances, shapes, mapping, stats
+
     return meshed_instances, shapes, mapping
 
 
@@ -1667,6 +2185,8 @@ def to_assembly(
     show_sketch_local: bool = True,
     loc: LocationLike = None,
     progress: Union[Progress, None] = None,
+    dedup: bool = False,
+    report: bool = False,
 ) -> Tuple[OcpGroup, List[Any]]:
     """
     Compatibility wrapper for the converter routine to convert a list of
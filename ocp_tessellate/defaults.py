@@ -51,6 +51,7 @@ class Defaults:
         - optimal_bb:         Use optimal bounding box (default=False)
         - render_normals:     Render vertex normals(default=False)
         - render_edges:       Render edges  (default=True)
+        - weld_tolerance:     Weld vertices across faces and reorder the mesh for the GPU (default=None, i.e. off)
         - render_mates:       Render mates (for MAssemblies, default=False)
         - render_joints:      Render build12d joints (default=False)
         - helper_scale:         Scale of rendered mates (for MAssemblies, default=1)
@@ -120,6 +121,7 @@ class Defaults:
             "optimal_bb": False,
             "render_normals": False,
             "render_edges": True,
+            "weld_tolerance": None,
             "render_mates": False,
             "render_joints": False,
             "helper_scale": 1,
@@ -280,6 +282,7 @@ def tessellation_args(config):
             "optimal_bb",
             "render_normals",
             "render_edges",
+            "weld_tolerance",
             "render_mates",
             "render_joints",
             "helper_scale",
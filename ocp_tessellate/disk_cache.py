@@ -0,0 +1,257 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Persistent tessellation cache"""
+
+import json
+import os
+import tempfile
+from hashlib import sha256
+
+import numpy as np
+
+MAGIC = b"OCPTMESH"
+VERSION = 1
+ALIGNMENT = 64
+SUFFIX = ".mesh"
+# eviction shrinks the cache to this fraction of maxsize
+LOW_WATERMARK = 0.9
+
+
+def _align(offset, alignment=ALIGNMENT):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+class DiskCache:
+    """
+    A size limited, least recently used cache of meshes in a directory.
+
+    Every entry is a single file with a small JSON header followed by the raw
+    arrays of the mesh, so that entries can be memory mapped. Entries are written
+    to a temporary file first and then renamed, hence several processes can share
+    the same cache directory.
+    """
+
+    def __init__(self, directory, maxsize):
+        """
+        @param directory: The cache directory, will be created if needed
+        @param maxsize: The maximum size of all entries in bytes
+        """
+        self.directory = directory
+        self.maxsize = maxsize
+        os.makedirs(directory, exist_ok=True)
+        # running estimate of the size of all entries, see _add_size
+        self._size = None
+
+    def _path(self, key):
+        digest = sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}{SUFFIX}")
+
+    def _remove(self, path):
+        try:
+            size = os.stat(path).st_size
+            os.unlink(path)
+        except OSError:  # removed by another process or still mapped
+            return
+        if self._size is not None:
+            self._size -= size
+
+    def _add_size(self, size, keep):
+        """
+        Add size bytes to the running size and evict if it exceeds maxsize. The
+        running size starts with a scan of the directory, other processes sharing
+        the directory are accounted for at the next eviction scan only.
+        """
+        if self._size is None:
+            self._size = self.currsize
+        else:
+            self._size += size
+        if self._size > self.maxsize:
+            self.evict(keep)
+
+    def get(self, key, default=None):
+        """
+        Get the mesh for key as dict of read only, memory mapped arrays.
+
+        @param key: The cache key
+        @param default: The value returned if key is not in the cache
+
+        @return: The mesh or default
+        """
+        path = self._path(key)
+        try:
+            block = np.memmap(path, dtype=np.uint8, mode="r")
+        except (FileNotFoundError, ValueError):
+            return default
+
+        try:
+            if bytes(block[:8]) != MAGIC:
+                raise ValueError("not a mesh file")
+
+            size = int(block[8:16].view("<u8")[0])
+            header = json.loads(bytes(block[16 : 16 + size]))
+            if header["version"] != VERSION:
+                raise ValueError(f"version {header['version']}")
+            if header["key"] != repr(key):
+                return default  # hash collision, keep the other entry
+
+            mesh = {}
+            for name, dtype, shape, start in header["layout"]:
+                dtype = np.dtype(dtype)
+                nbytes = int(np.prod(shape)) * dtype.itemsize
+                if start + nbytes > len(block):
+                    raise ValueError("truncated")
+                mesh[name] = block[start : start + nbytes].view(dtype).reshape(shape)
+
+        except (ValueError, KeyError, TypeError, IndexError):
+            # a truncated or corrupt entry is a miss, remove it
+            del block
+            self._remove(path)
+            return default
+
+        try:
+            # mark the entry as recently used
+            os.utime(path)
+        except OSError:
+            pass
+
+        return mesh
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def __setitem__(self, key, mesh):
+        """
+        Store the mesh (a dict of numpy arrays) under key.
+
+        @param key: The cache key
+        @param mesh: The mesh
+        """
+        arrays = {name: np.ascontiguousarray(value) for name, value in mesh.items()}
+
+        layout = []
+        offset = 0
+        for name, value in arrays.items():
+            layout.append([name, value.dtype.str, list(value.shape), offset])
+            offset = _align(offset + value.nbytes)
+
+        # the data offsets need to be known before the header size, so shift them
+        # by a header size estimate and grow it until the header fits
+        header_size = ALIGNMENT
+        while True:
+            shifted = [[n, d, s, o + header_size] for n, d, s, o in layout]
+            header = json.dumps(
+                {"version": VERSION, "key": repr(key), "layout": shifted}
+            ).encode()
+            if 16 + len(header) <= header_size:
+                break
+            header_size = _align(16 + len(header))
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(MAGIC)
+                f.write(np.uint64(len(header)).astype("<u8").tobytes())
+                f.write(header)
+                for (name, _, _, start), value in zip(shifted, arrays.values()):
+                    f.seek(start)
+                    f.write(memoryview(value.ravel()).cast("B"))
+                size = f.tell()
+            path = self._path(key)
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        self._add_size(size - replaced, path)
+
+    def entries(self):
+        """
+        Get all cache entries, least recently used first.
+
+        @return: list of (path, size, atime) tuples
+        """
+        result = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:  # removed by another process
+                        continue
+                    result.append((entry.path, stat.st_size, stat.st_mtime))
+        return sorted(result, key=lambda e: e[2])
+
+    @property
+    def currsize(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used entries until the cache fits LOW_WATERMARK
+        of maxsize, so that the directory is scanned again after a number of
+        inserts only and not after every insert.
+
+        @param keep: The path of an entry not to remove, e.g. the one just written
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.maxsize:
+            for path, size, _ in entries:
+                if total <= self.maxsize * LOW_WATERMARK:
+                    break
+                if path == keep:
+                    continue
+                try:
+                    os.unlink(path)
+                except OSError:  # removed by another process or still mapped
+                    continue
+                total -= size
+        self._size = total
+
+    def clear(self):
+        """Remove all cache entries"""
+        for path, _, _ in self.entries():
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        self._size = None
+
+
+def create_disk_cache():
+    """
+    Create the persistent cache as configured by the environment variables
+
+    - OCP_DISK_CACHE_SIZE_MB: the maximum size of the cache, 0 or unset disables it
+    - OCP_DISK_CACHE_DIR: the cache directory (default ~/.cache/ocp_tessellate)
+
+    @return: The DiskCache or None if disabled
+    """
+    size = int(os.environ.get("OCP_DISK_CACHE_SIZE_MB", "0"))
+    if size <= 0:
+        return None
+
+    directory = os.environ.get("OCP_DISK_CACHE_DIR")
+    if directory is None:
+        directory = os.path.join(os.path.expanduser("~"), ".cache", "ocp_tessellate")
+
+    return DiskCache(directory, size * 1024 * 1024)
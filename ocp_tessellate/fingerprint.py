@@ -0,0 +1,282 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Content based fingerprints of shapes, used as tessellation cache ids"""
+
+import weakref
+from hashlib import sha256
+
+import numpy as np
+from OCP.BRep import BRep_Tool
+from OCP.BRepAdaptor import BRepAdaptor_Curve, BRepAdaptor_Surface
+from OCP.BRepGProp import BRepGProp
+from OCP.BRepTools import BRepTools
+from OCP.gp import gp_Trsf
+from OCP.GProp import GProp_GProps
+from OCP.TopAbs import TopAbs_EDGE, TopAbs_FACE, TopAbs_SOLID, TopAbs_VERTEX
+from OCP.TopExp import TopExp
+from OCP.TopoDS import TopoDS
+from OCP.TopTools import TopTools_IndexedMapOfShape
+
+from .ocp_utils import serialize
+
+# Digests are memoized per TShape, for every location and orientation of it:
+# TShape -> _Memo. The keys are weak. A TShape wrapper only lives as long as a Python
+# object refers to it, so every shape object hashed anchors its TShape in _anchors.
+# The memo never keeps shapes alive.
+#
+# In place changes (e.g. BRep_Builder updates or adding to a compound) set the
+# Modified flag of the changed TShape. The flags are used as dirty bits: a memo is
+# only valid while its TShape and all sub TShapes are unmodified, and the flags are
+# cleared when a shape is hashed again. Sub TShapes can be shared by several hashed
+# shapes, so clearing the flag of a sub TShape drops the memos of all its owners.
+_digests = weakref.WeakKeyDictionary()
+_owners = weakref.WeakKeyDictionary()
+_anchors = weakref.WeakKeyDictionary()
+
+# the number of locations and orientations memoized per TShape
+MAX_PLACEMENTS = 256
+
+
+class _Memo:
+    def __init__(self, subshapes):
+        # the sub TShapes (without the key) and (hash, orientation) -> (loc, digest)
+        self.subshapes = subshapes
+        self.placements = {}
+
+    def is_valid(self, tshape):
+        return not tshape.Modified() and not any(
+            sub.Modified() for sub in self.subshapes
+        )
+
+
+_STATE_FLAGS = ("Free", "Locked", "Modified", "Checked")
+
+
+def _tshapes(obj):
+    # the unique TShapes of the shape and all its sub shapes, the shape first
+    shape_map = TopTools_IndexedMapOfShape()
+    TopExp.MapShapes_s(obj, shape_map)
+    return list(
+        dict.fromkeys(
+            shape_map.FindKey(i).TShape() for i in range(1, shape_map.Extent() + 1)
+        )
+    )
+
+
+def _serialize(obj, tshapes):
+    # Free, Locked, Modified and Checked describe the state of a TShape, not its
+    # geometry, and are changed e.g. by meshing or by adding the shape to a compound.
+    # Serialize with all of them unset, so that the digest does not depend on them
+    changed = []
+    for t in tshapes:
+        state = (t.Free(), t.Locked(), t.Modified(), t.Checked())
+        if any(state):
+            changed.append((t, state))
+            for flag, value in zip(_STATE_FLAGS, state):
+                if value:
+                    getattr(t, flag)(False)
+    try:
+        return serialize(obj)
+    finally:
+        for t, state in changed:
+            for flag, value in zip(_STATE_FLAGS, state):
+                if value:
+                    getattr(t, flag)(True)
+
+
+def full_digest(obj):
+    """
+    The sha256 hash of the serialized BRep of the shape, without triangulation
+    and without the state flags of the TShapes.
+
+    @param obj: The object of type TopoDS_Shape
+
+    @return: The hex digest
+    """
+    return sha256(_serialize(obj, _tshapes(obj))).hexdigest()
+
+
+def _map(shape, typ):
+    shape_map = TopTools_IndexedMapOfShape()
+    TopExp.MapShapes_s(shape, typ, shape_map)
+    return shape_map
+
+
+def shape_digest(obj):
+    """
+    The digest of a shape (see full_digest), memoized per TShape, location and
+    orientation. A memoized digest is reused until the TShape or one of its sub
+    TShapes is modified in place.
+
+    @param obj: The object of type TopoDS_Shape
+
+    @return: The hex digest
+    """
+    tshape = obj.TShape()
+    location = obj.Location()
+    placement = (location.HashCode(2**31 - 1), obj.Orientation())
+
+    memo = _digests.get(tshape)
+    if memo is not None and memo.is_valid(tshape):
+        entry = memo.placements.get(placement)
+        if entry is not None and entry[0].IsEqual(location):
+            _anchors[obj] = tshape
+            return entry[1]
+    else:
+        tshapes = _tshapes(obj)
+        for t in tshapes:
+            if t.Modified():
+                # the memos of all shapes containing t might be outdated
+                for owner in list(_owners.get(t, ())):
+                    _digests.pop(owner, None)
+                t.Modified(False)
+        for t in tshapes:
+            _owners.setdefault(t, weakref.WeakSet()).add(tshape)
+        memo = _digests[tshape] = _Memo(tshapes[1:])
+
+    digest = sha256(_serialize(obj, [tshape] + memo.subshapes)).hexdigest()
+    if len(memo.placements) >= MAX_PLACEMENTS:
+        del memo.placements[next(iter(memo.placements))]
+    memo.placements[placement] = (location, digest)
+    _anchors[obj] = tshape
+    return digest
+
+
+# relative precision of the geometry signature and of the rigid transform check
+GEOMETRY_PRECISION = 1e-6
+
+
+def _quantize(values, step):
+    return tuple(int(v) for v in np.round(np.asarray(values, dtype=np.float64) / step))
+
+
+def geometry_signature(obj):
+    """
+    A signature of the shape that does not change under rigid transformations,
+    and the reference points to compute the transformation between two shapes
+    with the same signature: the vertices, the edge mid points and the center of
+    mass, in the order of the topology maps. The signature contains topology
+    counts, geometry types, parameters and tolerances, and the distances of the
+    reference points to the center of mass instead of their coordinates.
+
+    @param obj: The object of type TopoDS_Shape
+
+    @return: The signature (a tuple) and the (n, 3) array of reference points
+    """
+    vertex_map = _map(obj, TopAbs_VERTEX)
+    edge_map = _map(obj, TopAbs_EDGE)
+    face_map = _map(obj, TopAbs_FACE)
+
+    properties = GProp_GProps()
+    if _map(obj, TopAbs_SOLID).Extent() > 0:
+        BRepGProp.VolumeProperties_s(obj, properties)
+    else:
+        BRepGProp.SurfaceProperties_s(obj, properties)
+    center = properties.CentreOfMass()
+
+    types = [
+        obj.ShapeType().value,
+        obj.Orientation().value,
+        vertex_map.Extent(),
+        edge_map.Extent(),
+        face_map.Extent(),
+    ]
+    params = []
+    tolerances = []
+    points = []
+
+    for i in range(1, vertex_map.Extent() + 1):
+        vertex = TopoDS.Vertex_s(vertex_map.FindKey(i))
+        points.append(BRep_Tool.Pnt_s(vertex).Coord())
+        tolerances.append(BRep_Tool.Tolerance_s(vertex))
+
+    for i in range(1, edge_map.Extent() + 1):
+        edge = TopoDS.Edge_s(edge_map.FindKey(i))
+        tolerances.append(BRep_Tool.Tolerance_s(edge))
+        types.append(edge.Orientation().value)
+        if BRep_Tool.Degenerated_s(edge):
+            types.append(-1)
+        else:
+            curve = BRepAdaptor_Curve(edge)
+            first, last = curve.FirstParameter(), curve.LastParameter()
+            types.append(curve.GetType().value)
+            params.extend((first, last))
+            points.append(curve.Value((first + last) / 2).Coord())
+
+    for i in range(1, face_map.Extent() + 1):
+        face = TopoDS.Face_s(face_map.FindKey(i))
+        tolerances.append(BRep_Tool.Tolerance_s(face))
+        types.append(face.Orientation().value)
+        types.append(BRepAdaptor_Surface(face, False).GetType().value)
+        params.extend(BRepTools.UVBounds_s(face))
+
+    points.append(center.Coord())
+    points = np.asarray(points, dtype=np.float64)
+    distances = np.linalg.norm(points - points[-1], axis=1)
+    scale = max(float(distances.max()), 1.0)
+
+    signature = (
+        tuple(types),
+        _quantize(params, GEOMETRY_PRECISION * scale),
+        _quantize(tolerances, GEOMETRY_PRECISION),
+        _quantize(distances, GEOMETRY_PRECISION * scale),
+        _quantize([properties.Mass()], GEOMETRY_PRECISION * scale**3),
+    )
+    return signature, points
+
+
+def rigid_transform(source, target):
+    """
+    The rotation and translation that maps the source points onto the target
+    points (Kabsch algorithm), if they are congruent.
+
+    @param source: The (n, 3) array of points
+    @param target: The (n, 3) array of corresponding points
+
+    @return: The gp_Trsf or None if no rigid transformation maps the points or if
+             the points are collinear and the rotation is not unique
+    """
+    if source.shape != target.shape:
+        return None
+
+    source_center = source.mean(axis=0)
+    target_center = target.mean(axis=0)
+    u, s, vt = np.linalg.svd((source - source_center).T @ (target - target_center))
+
+    scale = max(float(np.abs(source - source_center).max()), 1.0)
+    if s[1] < GEOMETRY_PRECISION * scale**2:
+        return None
+
+    # no reflections
+    d = np.sign(np.linalg.det(vt.T @ u.T))
+    rotation = vt.T @ np.diag([1.0, 1.0, d]) @ u.T
+    translation = target_center - rotation @ source_center
+
+    error = np.abs(source @ rotation.T + translation - target).max()
+    if error > GEOMETRY_PRECISION * scale:
+        return None
+
+    trsf = gp_Trsf()
+    trsf.SetValues(*np.hstack([rotation, translation[:, None]]).ravel().tolist())
+    return trsf
+
+
+def clear_fingerprints():
+    """Clear the memoized digests"""
+    _digests.clear()
+    _owners.clear()
+    _anchors.clear()
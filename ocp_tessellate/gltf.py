@@ -0,0 +1,455 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Binary glTF (GLB) export of tessellated groups"""
+
+import io
+import json
+import struct
+
+import numpy as np
+from webcolors import hex_to_rgb
+
+from .defaults import get_default
+from .ocp_utils import identity_location, loc_to_tq, tq_to_loc
+from .utils import Color
+
+GLB_MAGIC = 0x46546C67  # "glTF"
+CHUNK_JSON = 0x4E4F534A  # "JSON"
+CHUNK_BIN = 0x004E4942  # "BIN\0"
+
+# accessor component types and buffer view targets
+FLOAT = 5126
+UNSIGNED_INT = 5125
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+# primitive modes
+POINTS = 0
+LINES = 1
+TRIANGLES = 4
+
+# rotates the Z up CAD coordinate system into the Y up glTF coordinate system
+Z_UP_TO_Y_UP = [-np.sqrt(0.5), 0.0, 0.0, np.sqrt(0.5)]
+
+INSTANCING = "EXT_mesh_gpu_instancing"
+UNLIT = "KHR_materials_unlit"
+
+
+def _pad(size):
+    return (4 - size % 4) % 4
+
+
+def _linear(web_color):
+    # glTF colors are linear, web colors are sRGB
+    c = np.asarray(hex_to_rgb(web_color), dtype=np.float64) / 255
+    c = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    return [round(float(v), 6) for v in c]
+
+
+class _GlbBuilder:
+    """Collects the glTF document and references to the arrays of the BIN chunk"""
+
+    def __init__(self):
+        self.gltf = {
+            "asset": {"version": "2.0", "generator": "ocp_tessellate"},
+            "scene": 0,
+            "scenes": [{"nodes": []}],
+            "nodes": [],
+            "meshes": [],
+            "materials": [],
+            "accessors": [],
+            "bufferViews": [],
+            "buffers": [],
+        }
+        self.arrays = []
+        self.offset = 0
+        self.extensions = set()
+        self.required = set()
+        self.materials = {}
+        self.meshes = {}
+        self.accessors = {}
+
+    def add_accessor(self, array, typ, target=None, with_bounds=False):
+        """
+        Add the array as buffer view and accessor. The array is referenced, not copied.
+
+        @param array: The float32 or uint32 numpy array, shaped (n, components)
+        @param typ: The glTF accessor type (SCALAR, VEC3, ...)
+        @param target: The buffer view target
+        @param with_bounds: Add min and max (required for positions)
+
+        @return: The accessor index
+        """
+        array = np.ascontiguousarray(array)
+        self.arrays.append(array)
+
+        view = {"buffer": 0, "byteOffset": self.offset, "byteLength": array.nbytes}
+        if target is not None:
+            view["target"] = target
+        self.gltf["bufferViews"].append(view)
+        self.offset += array.nbytes + _pad(array.nbytes)
+
+        accessor = {
+            "bufferView": len(self.gltf["bufferViews"]) - 1,
+            "componentType": FLOAT if array.dtype == np.float32 else UNSIGNED_INT,
+            "count": len(array),
+            "type": typ,
+        }
+        if with_bounds:
+            accessor["min"] = array.min(axis=0).tolist()
+            accessor["max"] = array.max(axis=0).tolist()
+        self.gltf["accessors"].append(accessor)
+
+        return len(self.gltf["accessors"]) - 1
+
+    def instance_accessors(self, ref, mesh):
+        """
+        The accessors of a meshed instance, created once per instance.
+
+        @param ref: The reference of the instance
+        @param mesh: The meshed instance
+
+        @return: dict of accessor indices (position, normal, indices, edges)
+        """
+        accessors = self.accessors.get(ref)
+        if accessors is not None:
+            return accessors
+
+        accessors = {}
+        vertices = np.asarray(mesh["vertices"]).reshape(-1, 3)
+        triangles = np.asarray(mesh["triangles"]).ravel()
+        if len(vertices) > 0 and len(triangles) > 0:
+            accessors["position"] = self.add_accessor(
+                vertices, "VEC3", ARRAY_BUFFER, with_bounds=True
+            )
+            accessors["normal"] = self.add_accessor(
+                np.asarray(mesh["normals"]).reshape(-1, 3), "VEC3", ARRAY_BUFFER
+            )
+            # int32 indices are never negative, hence their bytes are valid uint32
+            accessors["indices"] = self.add_accessor(
+                triangles.astype(np.int32, copy=False).view(np.uint32),
+                "SCALAR",
+                ELEMENT_ARRAY_BUFFER,
+            )
+
+        edges = mesh.get("edges")
+        if edges is not None and np.size(edges) > 0:
+            accessors["edges"] = self.add_accessor(
+                np.asarray(edges).reshape(-1, 3),
+                "VEC3",
+                ARRAY_BUFFER,
+                with_bounds=True,
+            )
+
+        self.accessors[ref] = accessors
+        return accessors
+
+    def material(self, color, alpha=1.0, double_sided=False, unlit=False):
+        """
+        The material for color and alpha, created once per combination.
+
+        @param color: The web color
+        @param alpha: The alpha value
+        @param double_sided: Render the back faces
+        @param unlit: The material of lines and points
+
+        @return: The material index
+        """
+        key = (color, alpha, double_sided, unlit)
+        index = self.materials.get(key)
+        if index is not None:
+            return index
+
+        material = {
+            "pbrMetallicRoughness": {
+                "baseColorFactor": _linear(color) + [float(alpha)],
+                "metallicFactor": 0.0,
+                "roughnessFactor": 0.65,
+            },
+            "doubleSided": double_sided,
+        }
+        if alpha < 1.0:
+            material["alphaMode"] = "BLEND"
+        if unlit:
+            material["extensions"] = {UNLIT: {}}
+            self.extensions.add(UNLIT)
+
+        index = len(self.gltf["materials"])
+        self.gltf["materials"].append(material)
+        self.materials[key] = index
+        return index
+
+    def add_mesh(self, name, primitives):
+        self.gltf["meshes"].append({"name": name, "primitives": primitives})
+        return len(self.gltf["meshes"]) - 1
+
+    def shape_mesh(self, ref, mesh, part, edge_color):
+        """
+        The glTF mesh of an occurrence of an instance. Occurrences with the same
+        materials share the mesh, all meshes of an instance share the accessors.
+
+        @param ref: The reference of the instance
+        @param mesh: The meshed instance
+        @param part: The part of the shapes tree
+        @param edge_color: The web color of the edges
+
+        @return: The mesh index or None if the instance has no geometry
+        """
+        color = part["color"]
+        if isinstance(color, (list, tuple)):
+            color = color[0]
+        alpha = 1.0 if part.get("alpha") is None else part["alpha"]
+
+        key = (ref, color, alpha, part.get("renderback", False))
+        if key in self.meshes:
+            return self.meshes[key]
+
+        accessors = self.instance_accessors(ref, mesh)
+        primitives = []
+        if "position" in accessors:
+            primitives.append(
+                {
+                    "attributes": {
+                        "POSITION": accessors["position"],
+                        "NORMAL": accessors["normal"],
+                    },
+                    "indices": accessors["indices"],
+                    "material": self.material(
+                        color, alpha, part.get("renderback", False)
+                    ),
+                    "mode": TRIANGLES,
+                }
+            )
+        if "edges" in accessors:
+            primitives.append(
+                {
+                    "attributes": {"POSITION": accessors["edges"]},
+                    "material": self.material(edge_color, unlit=True),
+                    "mode": LINES,
+                }
+            )
+
+        index = None if not primitives else self.add_mesh(part["name"], primitives)
+        self.meshes[key] = index
+        return index
+
+    def line_mesh(self, part):
+        """
+        The glTF mesh of an edges or vertices part.
+
+        @param part: The part of the shapes tree
+
+        @return: The mesh index or None if the part is empty
+        """
+        if part["type"] == "edges":
+            positions, mode = part["shape"]["edges"], LINES
+        else:
+            positions, mode = part["shape"]["obj_vertices"], POINTS
+
+        positions = np.asarray(positions).reshape(-1, 3)
+        if len(positions) == 0:
+            return None
+
+        attributes = {
+            "POSITION": self.add_accessor(
+                positions, "VEC3", ARRAY_BUFFER, with_bounds=True
+            )
+        }
+
+        color = part["color"]
+        if isinstance(color, (list, tuple)):
+            # one color per edge (or vertex), expanded to the vertices
+            if part["type"] == "edges":
+                repeats = 2 * np.asarray(part["shape"]["segments_per_edge"])
+            else:
+                repeats = 1
+            colors = np.asarray([_linear(c) for c in color], dtype=np.float32)
+            attributes["COLOR_0"] = self.add_accessor(
+                np.repeat(colors, repeats, axis=0), "VEC3", ARRAY_BUFFER
+            )
+            color = "#ffffff"
+
+        primitive = {
+            "attributes": attributes,
+            "material": self.material(color, unlit=True),
+            "mode": mode,
+        }
+        return self.add_mesh(part["name"], [primitive])
+
+    def add_node(self, node, parent=None):
+        index = len(self.gltf["nodes"])
+        self.gltf["nodes"].append(node)
+        if parent is None:
+            self.gltf["scenes"][0]["nodes"].append(index)
+        else:
+            self.gltf["nodes"][parent].setdefault("children", []).append(index)
+        return index
+
+    def instancing_node(self, mesh_index, tqs):
+        """
+        A node that draws the mesh once per transformation with
+        EXT_mesh_gpu_instancing.
+
+        @param mesh_index: The mesh index
+        @param tqs: list of (translation, quaternion) tuples
+        """
+        t = np.asarray([tq[0] for tq in tqs], dtype=np.float32)
+        q = np.asarray([tq[1] for tq in tqs], dtype=np.float32)
+        extension = {
+            "attributes": {
+                "TRANSLATION": self.add_accessor(t, "VEC3"),
+                "ROTATION": self.add_accessor(q, "VEC4"),
+            }
+        }
+        self.extensions.add(INSTANCING)
+        self.required.add(INSTANCING)
+        return {"mesh": mesh_index, "extensions": {INSTANCING: extension}}
+
+    def write(self, fd):
+        """
+        Write the GLB container. The arrays are written directly from memory.
+
+        @param fd: The binary file object
+        """
+        gltf = self.gltf
+        if self.extensions:
+            gltf["extensionsUsed"] = sorted(self.extensions)
+        if self.required:
+            gltf["extensionsRequired"] = sorted(self.required)
+        if self.offset > 0:
+            gltf["buffers"] = [{"byteLength": self.offset}]
+
+        # glTF forbids empty arrays
+        for key in [k for k, v in gltf.items() if isinstance(v, list) and not v]:
+            del gltf[key]
+
+        header = json.dumps(gltf, separators=(",", ":")).encode()
+        header += b" " * _pad(len(header))
+
+        total = 12 + 8 + len(header)
+        if self.offset > 0:
+            total += 8 + self.offset
+
+        fd.write(struct.pack("<III", GLB_MAGIC, 2, total))
+        fd.write(struct.pack("<II", len(header), CHUNK_JSON))
+        fd.write(header)
+        if self.offset > 0:
+            fd.write(struct.pack("<II", self.offset, CHUNK_BIN))
+            for array in self.arrays:
+                fd.write(memoryview(array).cast("B"))
+                fd.write(b"\0" * _pad(array.nbytes))
+
+
+def _tq(loc):
+    t, q = loc_to_tq(loc)
+    return [float(v) for v in t], [float(v) for v in q]
+
+
+def _node_transform(node, tq):
+    if tq is None:
+        return node
+    t, q = tq
+    if any(v != 0 for v in t):
+        node["translation"] = [float(v) for v in t]
+    if any(v != 0 for v in q[:3]):
+        node["rotation"] = [float(v) for v in q]
+    return node
+
+
+def export_glb(meshed_instances, shapes, filename=None, instancing=False, y_up=True):
+    """
+    Export the result of tessellate_group as binary glTF.
+
+    Every meshed instance is written once, all occurrences reference its buffer
+    views. Without instancing, the group hierarchy is kept as node tree with the
+    group locations as node transforms. With instancing, all occurrences of an
+    instance with the same material are drawn by one node using the extension
+    EXT_mesh_gpu_instancing with their accumulated locations.
+
+    @param meshed_instances: The meshed instances as returned by tessellate_group
+    @param shapes: The shapes tree as returned by tessellate_group
+    @param filename: The name of the GLB file (None: return the bytes)
+    @param instancing: Use EXT_mesh_gpu_instancing for the shapes
+    @param y_up: Rotate the Z up CAD coordinates into the Y up glTF coordinates
+
+    @return: The GLB bytes if filename is None, else None
+    """
+    builder = _GlbBuilder()
+    edge_color = get_default("default_edgecolor")
+    if not isinstance(edge_color, str):
+        edge_color = Color(edge_color).web_color
+
+    top_loc = (
+        identity_location() if shapes["loc"] is None else tq_to_loc(*shapes["loc"])
+    )
+    root_loc = tq_to_loc((0, 0, 0), Z_UP_TO_Y_UP) if y_up else identity_location()
+    if not instancing:
+        root_loc = root_loc * top_loc
+    root = builder.add_node(_node_transform({"name": shapes["name"]}, _tq(root_loc)))
+
+    occurrences = {}  # mesh index -> list of world (t, q), for instancing
+
+    def walk(group, parent, loc):
+        for part in group["parts"]:
+            part_loc = None if part["loc"] is None else tq_to_loc(*part["loc"])
+            if instancing:
+                world = loc if part_loc is None else loc * part_loc
+
+            if part.get("parts") is not None:
+                if instancing:
+                    walk(part, parent, world)
+                else:
+                    node = _node_transform({"name": part["name"]}, part["loc"])
+                    walk(part, builder.add_node(node, parent), None)
+                continue
+
+            if part["type"] == "shapes":
+                ref = part["shape"]["ref"]
+                mesh_index = builder.shape_mesh(
+                    ref, meshed_instances[ref], part, edge_color
+                )
+                if mesh_index is None:
+                    continue
+                if instancing:
+                    occurrences.setdefault(mesh_index, []).append(_tq(world))
+                    continue
+            else:
+                mesh_index = builder.line_mesh(part)
+                if mesh_index is None:
+                    continue
+
+            node = {"name": part["name"], "mesh": mesh_index}
+            node = _node_transform(node, _tq(world) if instancing else part["loc"])
+            builder.add_node(node, parent)
+
+    if instancing:
+        walk(shapes, root, top_loc)
+        for mesh_index, tqs in occurrences.items():
+            node = builder.instancing_node(mesh_index, tqs)
+            node["name"] = builder.gltf["meshes"][mesh_index]["name"]
+            builder.add_node(node, root)
+    else:
+        walk(shapes, root, None)
+
+    if filename is None:
+        fd = io.BytesIO()
+        builder.write(fd)
+        return fd.getvalue()
+
+    with open(filename, "wb") as fd:
+        builder.write(fd)
+    return None
@@ -0,0 +1,198 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Cost aware in memory cache of meshes"""
+
+import functools
+import heapq
+import itertools
+import sys
+import time
+
+import numpy as np
+from cachetools import Cache
+
+
+def mesh_nbytes(mesh):
+    """
+    The memory used by a mesh, i.e. the bytes of its arrays plus the dict.
+
+    @param mesh: dict of numpy arrays
+    @return: The size in bytes
+    """
+    return sys.getsizeof(mesh) + sum(
+        v.nbytes if isinstance(v, np.ndarray) else sys.getsizeof(v)
+        for v in mesh.values()
+    )
+
+
+class CostAwareCache(Cache):
+    """
+    A size limited cache with GreedyDual-Size eviction: every entry has the
+    priority clock + cost / size, where cost is the time it took to compute the
+    entry. Eviction removes the entry with the lowest priority and advances the
+    clock to it, so entries that are cheap to recompute per byte are evicted first
+    and entries that are not used any more age out.
+    """
+
+    def __init__(self, maxsize, getsizeof=mesh_nbytes):
+        """
+        @param maxsize: The maximum size in bytes
+        @param getsizeof: The function to measure the size of an entry
+        """
+        super().__init__(maxsize, getsizeof)
+        self.__clock = 0.0
+        self.__heap = []
+        self.__counter = itertools.count()
+        self.__priority = {}
+        self.__cost = {}
+        self.__size = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        """Reset hits, misses, evictions and saved time"""
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.time_saved = 0.0
+
+    def __touch(self, key):
+        priority = self.__clock + self.__cost[key] / max(self.__size[key], 1)
+        self.__priority[key] = priority
+        heapq.heappush(self.__heap, (priority, next(self.__counter), key))
+
+        # drop outdated heap entries from time to time
+        if len(self.__heap) > 2 * len(self.__priority) + 64:
+            self.__heap = [
+                (p, next(self.__counter), k) for k, p in self.__priority.items()
+            ]
+            heapq.heapify(self.__heap)
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.__touch(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def set(self, key, value, cost=None):
+        """
+        Add an entry with the time it took to compute it.
+
+        @param key: The key
+        @param value: The value
+        @param cost: The compute time in seconds (None: keep the cost of an
+                     existing entry, else 0)
+        """
+        if cost is None:
+            cost = self.__cost.get(key, 0.0)
+        super().__setitem__(key, value)
+        self.__cost[key] = cost
+        self.__size[key] = self.getsizeof(value)
+        self.__touch(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        del self.__priority[key]
+        del self.__cost[key]
+        del self.__size[key]
+
+    def popitem(self):
+        """Remove and return the entry with the lowest priority"""
+        while self.__heap:
+            priority, _, key = heapq.heappop(self.__heap)
+            if self.__priority.get(key) == priority:
+                self.__clock = priority
+                value = super().__getitem__(key)
+                del self[key]
+                self.evictions += 1
+                return (key, value)
+        raise KeyError(f"{type(self).__name__} is empty")
+
+    def clear(self):
+        """Remove all entries, without counting them as evictions"""
+        for key in list(self.keys()):
+            del self[key]
+        self.__heap.clear()
+        self.__clock = 0.0
+
+    def lookup(self, key):
+        """
+        Get the entry for key and count the hit or miss.
+
+        @param key: The key
+        @return: The value or None
+        """
+        value = self.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.time_saved += self.__cost[key]
+        return value
+
+    def cost(self, key):
+        return self.__cost[key]
+
+    def stats(self):
+        """
+        The cache statistics.
+
+        @return: dict with hits, misses, evictions, entries, currsize and maxsize
+                 in bytes, hit_ratio and the saved compute time in seconds
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self),
+            "currsize": self.currsize,
+            "maxsize": self.maxsize,
+            "hit_ratio": self.hits / lookups if lookups > 0 else 0.0,
+            "time_saved": self.time_saved,
+        }
+
+
+def cost_cached(cache, key):
+    """
+    Decorator like cachetools.cached that records the compute time of every entry
+    as its cost in a CostAwareCache.
+
+    @param cache: The CostAwareCache
+    @param key: The key function, called with the arguments of the function
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            k = key(*args, **kwargs)
+            value = cache.lookup(k)
+            if value is not None:
+                return value
+
+            start = time.perf_counter()
+            value = func(*args, **kwargs)
+            try:
+                cache.set(k, value, cost=time.perf_counter() - start)
+            except ValueError:
+                pass  # value too large
+            return value
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,285 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Vertex welding and GPU friendly reordering of meshed instances"""
+
+import numpy as np
+
+CACHE_SIZE = 16
+NORMAL_TOLERANCE = 1e-3
+# the statistics kept as int64 array in mesh["optimize_stats"], see optimize_stats
+STATS_FIELDS = ("vertices_before", "vertices_after", "bytes_before", "bytes_after")
+# tipsify is a Python loop (~6us per triangle), larger meshes keep their order
+MAX_REORDER_TRIANGLES = 100_000
+
+
+def _mesh_bytes(mesh):
+    return sum(np.asarray(mesh[k]).nbytes for k in ("vertices", "normals", "triangles"))
+
+
+def weld(vertices, normals, triangles, tolerance, normal_tolerance=NORMAL_TOLERANCE):
+    """
+    Merge vertices with the same position and normal. Vertices are snapped to a grid
+    of size tolerance (normal_tolerance for the normals), so merged vertices are at
+    most tolerance * sqrt(3) apart.
+
+    @param vertices: The (n, 3) vertex array
+    @param normals: The (n, 3) normal array or None
+    @param triangles: The (m, 3) triangle array
+    @param tolerance: The position tolerance
+    @param normal_tolerance: The normal tolerance
+
+    @return: The welded vertices, normals and the remapped triangles
+    """
+    keys = [np.floor(vertices / tolerance + 0.5)]
+    if normals is not None:
+        keys.append(np.floor(normals / normal_tolerance + 0.5))
+    keys = np.ascontiguousarray(np.hstack(keys).astype(np.int64))
+
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+
+    return (
+        vertices[first],
+        None if normals is None else normals[first],
+        inverse[triangles].astype(np.int32),
+    )
+
+
+def tipsify(triangles, triangles_per_face, num_vertices, cache_size=CACHE_SIZE):
+    """
+    Reorder the triangles of every face for vertex cache locality
+    (Sander, Nehab, Barczak: Fast Triangle Reordering for Vertex Locality and
+    Reduced Overdraw). Triangles never move to another face.
+
+    @param triangles: The (m, 3) triangle array, sorted by face
+    @param triangles_per_face: The number of triangles of every face
+    @param num_vertices: The number of vertices
+    @param cache_size: The size of the simulated FIFO vertex cache
+
+    @return: The new order of the triangles
+    """
+    # vertex -> triangle adjacency in compressed sparse row format
+    flat = triangles.ravel()
+    adjacency = np.argsort(flat, kind="stable") // 3
+    counts = np.bincount(flat, minlength=num_vertices)
+    starts = np.concatenate([[0], np.cumsum(counts)]).tolist()
+    adjacency = adjacency.tolist()
+
+    face_ids = np.repeat(np.arange(len(triangles_per_face)), triangles_per_face)
+    face_starts = np.concatenate([[0], np.cumsum(triangles_per_face)]).tolist()
+
+    tris = triangles.tolist()
+    faces = face_ids.tolist()
+    live = counts.tolist()
+    cache_time = [-cache_size - 1] * num_vertices
+    emitted = [False] * len(tris)
+    order = []
+
+    timestamp = 0
+    for face in range(len(triangles_per_face)):
+        start, end = face_starts[face], face_starts[face + 1]
+        if start == end:
+            continue
+        face_vertices = list(dict.fromkeys(flat[3 * start : 3 * end].tolist()))
+        cursor = 0
+        dead_end = []
+        f = face_vertices[0]
+
+        while f >= 0:
+            candidates = []
+            for t in adjacency[starts[f] : starts[f + 1]]:
+                if emitted[t] or faces[t] != face:
+                    continue
+                emitted[t] = True
+                order.append(t)
+                for v in tris[t]:
+                    dead_end.append(v)
+                    candidates.append(v)
+                    live[v] -= 1
+                    if timestamp - cache_time[v] > cache_size:
+                        cache_time[v] = timestamp
+                        timestamp += 1
+
+            # next fanning vertex: the one that stays longest in the cache
+            f = -1
+            best = -1
+            for v in candidates:
+                if live[v] > 0:
+                    priority = 0
+                    if timestamp - cache_time[v] + 2 * live[v] <= cache_size:
+                        priority = timestamp - cache_time[v]
+                    if priority > best:
+                        f, best = v, priority
+
+            if f == -1:
+                while dead_end:
+                    v = dead_end.pop()
+                    if live[v] > 0 and _has_face_triangle(
+                        v, face, adjacency, starts, emitted, faces
+                    ):
+                        f = v
+                        break
+            if f == -1:
+                while cursor < len(face_vertices):
+                    v = face_vertices[cursor]
+                    cursor += 1
+                    if live[v] > 0 and _has_face_triangle(
+                        v, face, adjacency, starts, emitted, faces
+                    ):
+                        f = v
+                        break
+
+    return np.asarray(order, dtype=np.int64)
+
+
+def _has_face_triangle(v, face, adjacency, starts, emitted, faces):
+    for t in adjacency[starts[v] : starts[v + 1]]:
+        if not emitted[t] and faces[t] == face:
+            return True
+    return False
+
+
+def cache_miss_ratio(triangles, cache_size=CACHE_SIZE):
+    """
+    The average number of vertex cache misses per triangle (ACMR) of a FIFO cache.
+
+    @param triangles: The triangle array
+    @param cache_size: The size of the FIFO cache
+
+    @return: The ACMR, between 0.5 (ideal) and 3
+    """
+    flat = np.asarray(triangles).ravel().tolist()
+    if not flat:
+        return 0.0
+
+    fifo = []
+    cached = set()
+    misses = 0
+    for v in flat:
+        if v not in cached:
+            misses += 1
+            fifo.append(v)
+            cached.add(v)
+            if len(fifo) > cache_size:
+                cached.discard(fifo.pop(0))
+    return misses / (len(flat) / 3)
+
+
+def optimize_mesh(
+    mesh,
+    tolerance=1e-6,
+    normal_tolerance=NORMAL_TOLERANCE,
+    max_reorder=MAX_REORDER_TRIANGLES,
+):
+    """
+    Weld the vertices across faces that share position and normal, reorder the
+    triangles of every face for vertex cache locality and renumber the vertices in
+    the order they are fetched. The triangles stay grouped by face and
+    triangles_per_face is updated, so face picking still works.
+    If the normals are not per vertex, the vertices and normals are left unchanged
+    and only the triangles are reordered.
+
+    @param mesh: The mesh as returned by tessellate
+    @param tolerance: The position tolerance for welding
+    @param normal_tolerance: The normal tolerance for welding
+    @param max_reorder: Meshes with more triangles are not reordered (None: no limit)
+
+    @return: The optimized mesh (a new dict) and a dict with statistics. The
+             statistics are also kept in the mesh, see optimize_stats
+    """
+    vertices = np.asarray(mesh["vertices"], dtype=np.float32).reshape(-1, 3)
+    triangles = np.asarray(mesh["triangles"], dtype=np.int32).reshape(-1, 3)
+    normals = np.asarray(mesh["normals"], dtype=np.float32).reshape(-1, 3)
+    # without normals weld by position, with unmatched normals do not weld at all
+    welded = len(normals) in (0, len(vertices))
+    if len(normals) != len(vertices):
+        normals = None
+    triangles_per_face = np.asarray(mesh["triangles_per_face"], dtype=np.int32)
+
+    result = dict(mesh)
+    stats = {
+        "vertices_before": len(vertices),
+        "bytes_before": _mesh_bytes(mesh),
+        "welded": welded and len(triangles) > 0,
+        "reordered": False,
+    }
+
+    if len(triangles) > 0 and welded:
+        face_ids = np.repeat(np.arange(len(triangles_per_face)), triangles_per_face)
+
+        vertices, normals, triangles = weld(
+            vertices, normals, triangles, tolerance, normal_tolerance
+        )
+
+        # welding can collapse tiny triangles
+        valid = (
+            (triangles[:, 0] != triangles[:, 1])
+            & (triangles[:, 1] != triangles[:, 2])
+            & (triangles[:, 0] != triangles[:, 2])
+        )
+        triangles = triangles[valid]
+        face_ids = face_ids[valid]
+        triangles_per_face = np.bincount(
+            face_ids, minlength=len(triangles_per_face)
+        ).astype(np.int32)
+
+    if len(triangles) > 0 and (max_reorder is None or len(triangles) <= max_reorder):
+        triangles = triangles[tipsify(triangles, triangles_per_face, len(vertices))]
+        stats["reordered"] = True
+
+    if len(triangles) > 0 and welded:
+        # renumber the vertices in the order of their first use
+        flat = triangles.ravel()
+        _, first = np.unique(flat, return_index=True)
+        used = flat[np.sort(first)]
+        new_ids = np.empty(len(vertices), dtype=np.int32)
+        new_ids[used] = np.arange(len(used), dtype=np.int32)
+        vertices = vertices[used]
+        normals = None if normals is None else normals[used]
+        triangles = new_ids[triangles]
+
+    result["vertices"] = np.ascontiguousarray(vertices, dtype=np.float32).ravel()
+    result["triangles"] = np.ascontiguousarray(triangles, dtype=np.int32).ravel()
+    if normals is not None:
+        result["normals"] = np.ascontiguousarray(normals, dtype=np.float32).ravel()
+    result["triangles_per_face"] = triangles_per_face
+
+    stats["vertices_after"] = len(vertices)
+    stats["bytes_after"] = _mesh_bytes(result)
+    stats["bytes_saved"] = stats["bytes_before"] - stats["bytes_after"]
+    result["optimize_stats"] = np.array(
+        [stats[field] for field in STATS_FIELDS], dtype=np.int64
+    )
+
+    return result, stats
+
+
+def optimize_stats(mesh):
+    """
+    The statistics of an optimized mesh, also for meshes taken from a cache.
+
+    @param mesh: The mesh as returned by optimize_mesh
+
+    @return: Dict with vertices and bytes before and after and the bytes saved,
+             or None if the mesh is not optimized
+    """
+    values = mesh.get("optimize_stats")
+    if values is None:
+        return None
+    stats = dict(zip(STATS_FIELDS, np.asarray(values).tolist()))
+    stats["bytes_saved"] = stats["bytes_before"] - stats["bytes_after"]
+    return stats
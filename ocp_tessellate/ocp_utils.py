@@ -19,6 +19,7 @@ import itertools
 import os
 import sys
 import tempfile
+import weakref
 from collections.abc import Iterable
 
 import numpy as np
@@ -116,6 +117,12 @@ def ocp_hash(obj):
         return ()
 
 
+def tshape_hash(obj):
+    # HashCode combines TShape and Location, so drop the location to only hash the
+    # TShape. Different TShapes can collide, compare TShape() to be sure
+    return obj.Located(TopLoc_Location()).HashCode(MAX_HASH_KEY)
+
+
 downcast_LUT = {
     TopAbs_VERTEX: TopoDS.Vertex_s,
     TopAbs_EDGE: TopoDS.Edge_s,
@@ -586,16 +593,67 @@ def unroll_topods_compound(compound, typ=None):
     return result, typ
 
 
+# type_name of the downcasted shapes by shape type
+_type_names = {
+    TopAbs_COMPSOLID: "CompSolid",
+    TopAbs_SOLID: "Solid",
+    TopAbs_SHELL: "Shell",
+    TopAbs_FACE: "Face",
+    TopAbs_WIRE: "Wire",
+    TopAbs_EDGE: "Edge",
+    TopAbs_VERTEX: "Vertex",
+}
+
+# compound types by TShape: TShape -> type. The keys are weak, so that the cache
+# does not keep compounds alive. A TShape wrapper only lives as long as a Python
+# object refers to it, so every compound looked up anchors its TShape.
+compound_type_cache = weakref.WeakKeyDictionary()
+_compound_anchors = weakref.WeakKeyDictionary()
+
+
+def _compound_type(compound):
+    # depth first with a stack of iterators, so the first two leaves are compared
+    # without visiting the rest of the compound
+    typ = None
+    stack = [TopoDS_Iterator(compound)]
+    while stack:
+        iterator = stack[-1]
+        if not iterator.More():
+            stack.pop()
+            continue
+        obj = iterator.Value()
+        iterator.Next()
+        shape_type = obj.ShapeType()
+        if shape_type == TopAbs_COMPOUND:
+            stack.append(TopoDS_Iterator(obj))
+        elif typ is None:
+            typ = _type_names[shape_type]
+        elif typ != _type_names[shape_type]:
+            return "mixed"
+    return typ
+
+
 def is_mixed_compound(compound):
     return get_compound_type(compound) == "mixed"
 
 
 def get_compound_type(compound):
-    if is_topods_compound(compound):
-        _, typ = unroll_topods_compound(compound)
+    """
+    Get the type of the leaves of a (nested) compound. The traversal stops at the
+    second type and the result is cached by TShape.
+
+    @param compound: The TopoDS_Compound or a wrapped compound
+    @return: The type name, e.g. "Solid", "mixed" or None for empty compounds
+    """
+    if not is_topods_shape(compound):
+        compound = compound.wrapped
+
+    tshape = compound.TShape()
+    if tshape in compound_type_cache:
+        typ = compound_type_cache[tshape]
     else:
-        _, typ = unroll_compound(compound)
-
+        typ = compound_type_cache[tshape] = _compound_type(compound)
+    _compound_anchors[compound] = tshape
     return typ
 
 
@@ -708,6 +766,19 @@ def loc_to_tq(loc):
     return ((t.X(), t.Y(), t.Z()), (q.X(), q.Y(), q.Z(), q.W()))
 
 
+def loc_to_matrix(loc):
+    if loc is None:
+        return np.identity(4)
+
+    T = loc.Transformation()
+    m = np.identity(4)
+    for r in range(3):
+        for c in range(4):
+            # Value() includes the scale factor of the transformation
+            m[r, c] = T.Value(r + 1, c + 1)
+    return m
+
+
 def identity_location():
     return TopLoc_Location(gp_Trsf())
 
@@ -1112,6 +1183,51 @@ def np_bbox(p, t, q):
     }
 
 
+def aabb_corners(p):
+    """
+    The 8 corners of the axis aligned bounding box of a flat vertex array.
+
+    @param p: The vertex array
+    @return: The (8, 3) corner array or None for an empty vertex array
+    """
+    if p.size == 0:
+        return None
+
+    n_p = p.reshape(-1, 3)
+    lo = n_p.min(axis=0)
+    hi = n_p.max(axis=0)
+    return np.array(
+        [
+            [x, y, z]
+            for x in (lo[0], hi[0])
+            for y in (lo[1], hi[1])
+            for z in (lo[2], hi[2])
+        ]
+    )
+
+
+def np_bbox_transformed(corners, matrices):
+    """
+    The bounding box of many transformed boxes, computed in one pass.
+
+    @param corners: The (k, 8, 3) corner array of the boxes
+    @param matrices: The (k, 4, 4) transformation matrices
+    @return: The bounding box as dict
+    """
+    world = np.einsum("kij,knj->kni", matrices[:, :3, :3], corners)
+    world += matrices[:, None, :3, 3]
+    bbmin = world.min(axis=(0, 1))
+    bbmax = world.max(axis=(0, 1))
+    return {
+        "xmin": bbmin[0],
+        "xmax": bbmax[0],
+        "ymin": bbmin[1],
+        "ymax": bbmax[1],
+        "zmin": bbmin[2],
+        "zmax": bbmax[2],
+    }
+
+
 def length(edge_or_wire):
     if isinstance(edge_or_wire, TopoDS_Edge):
         c = BRepAdaptor_Curve(edge_or_wire)
@@ -0,0 +1,237 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Columnar scene output with one set of packed buffers per tessellation run"""
+
+import numpy as np
+
+from .utils import Color
+
+PACKED_VERSION = 1
+
+# the arrays of meshes, edges and vertices, and their types in the packed buffers
+BUFFER_TYPES = {
+    "vertices": np.float32,
+    "normals": np.float32,
+    "triangles": np.int32,
+    "triangles_per_face": np.int32,
+    "face_types": np.int32,
+    "edges": np.float32,
+    "segments_per_edge": np.int32,
+    "edge_types": np.int32,
+    "obj_vertices": np.float32,
+    # RGBA per edge or vertex of parts with one color per edge or vertex
+    "colors": np.float32,
+}
+
+# line width and point size of edge and vertex parts without one
+DEFAULT_WIDTH = 1
+
+# geometry kinds
+MESH = 0
+EDGES = 1
+VERTICES = 2
+
+
+def tq_to_matrices(t, q):
+    """
+    Convert translations and unit quaternions to transformation matrices.
+
+    @param t: The (n, 3) array of translations
+    @param q: The (n, 4) array of quaternions (x, y, z, w)
+
+    @return: The (n, 4, 4) array of matrices
+    """
+    x, y, z, w = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    m = np.zeros((len(t), 4, 4))
+    m[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    m[:, 0, 1] = 2 * (x * y - z * w)
+    m[:, 0, 2] = 2 * (x * z + y * w)
+    m[:, 1, 0] = 2 * (x * y + z * w)
+    m[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    m[:, 1, 2] = 2 * (y * z - x * w)
+    m[:, 2, 0] = 2 * (x * z - y * w)
+    m[:, 2, 1] = 2 * (y * z + x * w)
+    m[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    m[:, :3, 3] = t
+    m[:, 3, 3] = 1
+    return m
+
+
+def _matrix(tq):
+    if tq is None:
+        return np.identity(4)
+    return tq_to_matrices(np.asarray([tq[0]]), np.asarray([tq[1]]))[0]
+
+
+def _rgba(color, alpha):
+    # edges can have one color per edge, the occurrence gets the first one and the
+    # geometry all of them in the colors buffer
+    if isinstance(color, (list, tuple)):
+        color = color[0]
+    c = Color(color)
+    return (c.r / 255, c.g / 255, c.b / 255, c.a if alpha is None else alpha)
+
+
+def pack_scene(meshed_instances, shapes):
+    """
+    Pack the result of tessellate_group into a few contiguous arrays:
+
+    - buffers: every mesh, edge and vertex array concatenated to one array per
+      key of BUFFER_TYPES
+    - geometries: one row per meshed instance (the rows 0 .. n-1, so geometry
+      index and instance ref are the same) and per edge and vertex part, with
+      the kind (MESH, EDGES, VERTICES) and the offsets and counts tables, i.e.
+      the start and length of the geometry in every buffer in array elements,
+      with the columns in the order of BUFFER_TYPES. Triangles index the
+      vertices of their geometry, i.e. they start at 0 for every geometry.
+      Edge and vertex parts with a list of colors have one RGBA row per edge or
+      vertex in the colors buffer, all other geometries none
+    - occurrences: one row per part of the shapes tree with the geometry index,
+      the 4x4 transformation accumulated over all groups, the RGBA color (the
+      first one for a list of colors), the state, renderback, the line width or
+      point size (0 for meshes, DEFAULT_WIDTH if not set) and the id and name of
+      the part
+
+    @param meshed_instances: The meshed instances as returned by tessellate_group
+    @param shapes: The shapes tree as returned by tessellate_group
+
+    @return: dict with version, buffers, geometries, occurrences, bb and normal_len
+    """
+    arrays = {key: [] for key in BUFFER_TYPES}
+    kinds = []
+
+    def add_geometry(kind, data):
+        kinds.append(kind)
+        for key, values in arrays.items():
+            value = None if data is None else data.get(key)
+            values.append(
+                np.empty(0, dtype=BUFFER_TYPES[key])
+                if value is None
+                else np.asarray(value, dtype=BUFFER_TYPES[key]).ravel()
+            )
+
+    for mesh in meshed_instances:
+        add_geometry(MESH, mesh)
+
+    refs = []
+    parents = []  # index into group_matrices
+    tqs = []
+    colors = []
+    states = []
+    renderback = []
+    widths = []
+    ids = []
+    names = []
+
+    # depth first in the order of the tree, with an explicit stack
+    group_matrices = [_matrix(shapes["loc"])]
+    stack = [(iter(shapes["parts"]), 0)]
+    while stack:
+        parts, index = stack[-1]
+        part = next(parts, None)
+        if part is None:
+            stack.pop()
+            continue
+
+        if part.get("parts") is not None:
+            group_matrices.append(group_matrices[index] @ _matrix(part["loc"]))
+            stack.append((iter(part["parts"]), len(group_matrices) - 1))
+            continue
+
+        if part["type"] == "shapes":
+            refs.append(part["shape"]["ref"])
+            width = 0
+        else:
+            refs.append(len(kinds))
+            kind = EDGES if part["type"] == "edges" else VERTICES
+            data = part["shape"]
+            if isinstance(part["color"], (list, tuple)):
+                alpha = part.get("alpha")
+                data = dict(data, colors=[_rgba(c, alpha) for c in part["color"]])
+            add_geometry(kind, data)
+            width = part.get("width" if kind == EDGES else "size")
+            if width is None:
+                width = DEFAULT_WIDTH
+
+        parents.append(index)
+        tqs.append(((0, 0, 0), (0, 0, 0, 1)) if part["loc"] is None else part["loc"])
+        colors.append(_rgba(part["color"], part.get("alpha")))
+        states.append(part["state"])
+        renderback.append(part.get("renderback", False))
+        widths.append(width)
+        ids.append(part["id"])
+        names.append(part["name"])
+
+    # one row per geometry, one column per key of BUFFER_TYPES
+    counts = np.array(
+        [[len(v) for v in values] for values in arrays.values()], dtype=np.int64
+    ).T.reshape(len(kinds), len(BUFFER_TYPES))
+    offsets = np.cumsum(counts, axis=0) - counts
+    buffers = {
+        key: np.concatenate(values) if values else np.empty(0, dtype=BUFFER_TYPES[key])
+        for key, values in arrays.items()
+    }
+
+    if tqs:
+        t = np.asarray([tq[0] for tq in tqs], dtype=np.float64)
+        q = np.asarray([tq[1] for tq in tqs], dtype=np.float64)
+        transforms = np.asarray(group_matrices)[parents] @ tq_to_matrices(t, q)
+    else:
+        transforms = np.empty((0, 4, 4))
+
+    occurrences = {
+        "ref": np.asarray(refs, dtype=np.int32),
+        "transform": transforms.astype(np.float32),
+        "color": np.asarray(colors, dtype=np.float32).reshape(-1, 4),
+        "state": np.asarray(states, dtype=np.int8).reshape(-1, 2),
+        "renderback": np.asarray(renderback, dtype=bool),
+        "width": np.asarray(widths, dtype=np.float32),
+        "id": ids,
+        "name": names,
+    }
+
+    return {
+        "version": PACKED_VERSION,
+        "buffers": buffers,
+        "geometries": {
+            "kind": np.asarray(kinds, dtype=np.int8),
+            "offsets": offsets,
+            "counts": counts,
+        },
+        "occurrences": occurrences,
+        "bb": shapes.get("bb"),
+        "normal_len": shapes.get("normal_len"),
+    }
+
+
+def geometry(scene, index):
+    """
+    The arrays of one geometry of a packed scene, as views into the buffers.
+
+    @param scene: The packed scene as returned by pack_scene
+    @param index: The geometry index, e.g. an occurrence ref
+
+    @return: dict with the non empty arrays of the geometry
+    """
+    offsets = scene["geometries"]["offsets"][index]
+    counts = scene["geometries"]["counts"][index]
+    result = {}
+    for column, key in enumerate(BUFFER_TYPES):
+        if counts[column] > 0:
+            start = offsets[column]
+            result[key] = scene["buffers"][key][start : start + counts[column]]
+    return result
@@ -0,0 +1,276 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Hierarchical profiler with Chrome trace export"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class _NullSpan:
+    """The span returned while profiling is disabled, it does nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A named, timed section with attributes. Spans nest by their start and end"""
+
+    __slots__ = ("profiler", "name", "attrs", "start", "depth")
+
+    def __init__(self, profiler, name, attrs):
+        self.profiler = profiler
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        self.depth = len(stack)
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        end = time.perf_counter()
+        stack = self.profiler._stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        self.profiler._record(self, end)
+        return False
+
+    def set(self, **attrs):
+        """Add attributes to the span, e.g. results only known at the end"""
+        self.attrs.update(attrs)
+
+
+class Profiler:
+    """
+    Records nested spans. Disabled by default, then span() returns a shared no-op
+    context manager.
+
+    Usage:
+        profiler.enable()
+        with profiler.span("mesh", instance=3):
+            ...
+        print(profiler.summary())
+        profiler.to_chrome_trace("trace.json")  # open in chrome://tracing or Perfetto
+
+    The timeit flag of tessellate_group and TessellationSession also records the
+    spans of the call, see run.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        # the max level of the Timer spans recorded (None: all)
+        self.level = None
+        self.events = []
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+
+    def enable(self):
+        self.enabled = True
+        self.level = None
+
+    def disable(self):
+        self.enabled = False
+        self.level = None
+
+    @contextmanager
+    def run(self, timeit):
+        """
+        Record the spans of one call with the timeit flag, if the profiler is not
+        enabled anyway. The spans of the previous call are removed first and kept
+        until the next call. Timers record their spans up to the timeit level, the
+        levels they are printed for.
+
+        @param timeit: True (all levels), False (no recording) or the max level
+        """
+        level = timeit_level(timeit)
+        if self.enabled or level < 0:
+            yield
+            return
+
+        self.clear()
+        self.enabled = True
+        self.level = level
+        try:
+            yield
+        finally:
+            self.disable()
+
+    def records(self, level):
+        """
+        Check whether spans of the given Timer level are recorded
+
+        @param level: The level of the Timer
+        @return: True if recorded
+        """
+        return self.enabled and (self.level is None or level <= self.level)
+
+    def clear(self):
+        """Remove all recorded spans"""
+        self.events = []
+        self._origin = time.perf_counter()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, span, end):
+        self.events.append(
+            (
+                span.name,
+                span.start,
+                end - span.start,
+                span.depth,
+                threading.get_ident(),
+                span.attrs,
+            )
+        )
+
+    def span(self, name, /, **attrs):
+        """
+        A context manager timing the enclosed code.
+
+        @param name: The name of the span
+        @param attrs: Attributes of the span, e.g. the instance name
+        @return: The span (or NULL_SPAN if disabled)
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attrs)
+
+    def to_chrome_trace(self, filename=None):
+        """
+        Export the spans in the Chrome trace event format.
+
+        @param filename: The name of the JSON file (None: return the trace dict)
+        @return: The trace dict if filename is None
+        """
+        pid = os.getpid()
+        trace = {
+            "traceEvents": [
+                {
+                    "name": name,
+                    "cat": "ocp_tessellate",
+                    "ph": "X",
+                    "ts": (start - self._origin) * 1e6,
+                    "dur": duration * 1e6,
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {k: _jsonable(v) for k, v in attrs.items()},
+                }
+                for name, start, duration, _, tid, attrs in self.events
+            ],
+            "displayTimeUnit": "ms",
+        }
+        if filename is None:
+            return trace
+
+        with open(filename, "w") as fd:
+            json.dump(trace, fd)
+        return None
+
+    def aggregate(self):
+        """
+        Aggregate the spans by name.
+
+        @return: dict name -> {count, total, self, max} with times in seconds, where
+                 self excludes the time of directly nested spans
+        """
+        result = {}
+        # time of the direct children per span, by (thread, depth) of the parent
+        children = {}
+        for name, start, duration, depth, tid, _ in sorted(
+            self.events, key=lambda e: (e[4], e[1] + e[2])
+        ):
+            entry = result.setdefault(
+                name, {"count": 0, "total": 0.0, "self": 0.0, "max": 0.0}
+            )
+            entry["count"] += 1
+            entry["total"] += duration
+            entry["max"] = max(entry["max"], duration)
+            # spans end before their parent, so their time is already collected
+            entry["self"] += duration - children.pop((tid, depth + 1), 0.0)
+            if depth > 0:
+                children[(tid, depth)] = children.get((tid, depth), 0.0) + duration
+        return result
+
+    def summary(self):
+        """
+        A table of the aggregated spans, sorted by total time.
+
+        @return: The table as string
+        """
+        rows = sorted(self.aggregate().items(), key=lambda e: -e[1]["total"])
+        width = max([len(name) for name, _ in rows] + [4])
+        lines = [
+            f"{'span':<{width}} {'count':>7} {'total s':>10} {'self s':>10} "
+            f"{'mean ms':>10} {'max ms':>10}"
+        ]
+        for name, e in rows:
+            lines.append(
+                f"{name:<{width}} {e['count']:>7} {e['total']:>10.4f} "
+                f"{e['self']:>10.4f} {e['total'] / e['count'] * 1000:>10.3f} "
+                f"{e['max'] * 1000:>10.3f}"
+            )
+        return "\n".join(lines)
+
+
+def timeit_level(timeit):
+    """
+    The max level of the timeit flag
+
+    @param timeit: True (all levels), False (none) or the max level
+    @return: The level, -1 for none
+    """
+    if isinstance(timeit, bool):
+        return 99 if timeit else -1
+    return timeit
+
+
+def _jsonable(value):
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+profiler = Profiler()
+
+
+def enable_profiling():
+    profiler.enable()
+
+
+def disable_profiling():
+    profiler.disable()
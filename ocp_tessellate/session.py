@@ -0,0 +1,460 @@
+#
+# Copyright 2023 Bernhard Walter
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Incremental re-tessellation of a changing scene"""
+
+from hashlib import sha256
+
+import numpy as np
+
+from .cad_objects import OcpGroup
+from .convert import OcpConverter, tessellate_group_iter
+from .fingerprint import shape_digest
+from .ocp_utils import (
+    identity_location,
+    is_cadquery,
+    is_topods_shape,
+    loc_to_tq,
+    tshape_hash,
+)
+from .profiler import profiler
+from .utils import Timer, make_unique
+
+
+def object_signature(cad_obj):
+    """
+    A digest of the content of an object as passed to TessellationSession.update:
+    the shape digests of all shapes plus their type, label, color and children,
+    walking through lists, tuples, dicts and CadQuery workplanes. Shape digests are
+    memoized, so the signature of an unchanged object is cheap.
+
+    @param cad_obj: The object
+
+    @return: The hex digest, or None for objects whose content can't be captured
+             (e.g. builders, assemblies, sketches), they are converted every time
+    """
+    h = sha256()
+    stack = [cad_obj]
+    while stack:
+        obj = stack.pop()
+        if is_topods_shape(obj):
+            h.update(f"S{shape_digest(obj)}".encode())
+
+        elif hasattr(obj, "wrapped") and is_topods_shape(obj.wrapped):
+            if len(getattr(obj, "joints", None) or ()) > 0:
+                return None
+            children = getattr(obj, "children", None) or ()
+            attributes = (
+                type(obj).__name__,
+                getattr(obj, "label", None),
+                getattr(obj, "color", None),
+                len(children),
+            )
+            h.update(f"W{shape_digest(obj.wrapped)}{attributes!r}".encode())
+            stack.extend(reversed(children))
+
+        elif isinstance(obj, (list, tuple)):
+            h.update(f"L{type(obj).__name__}{len(obj)}".encode())
+            stack.extend(reversed(obj))
+
+        elif isinstance(obj, dict):
+            h.update(f"D{list(obj)!r}".encode())
+            stack.extend(reversed(obj.values()))
+
+        elif is_cadquery(obj) and len(obj.objects) > 0:
+            h.update(f"Q{len(obj.objects)}".encode())
+            stack.extend(reversed(obj.objects))
+
+        else:
+            return None
+
+    return h.hexdigest()
+
+
+def _relink(collected, remap, instances):
+    """
+    Copy a collected subtree, i.e. its dicts but not the arrays, with the instance
+    refs mapped to the instances of the scene. The copy can be changed (e.g. by the
+    bounding box computation) without changing the collected subtree.
+    """
+    mapping, shapes = dict(collected[0]), dict(collected[1])
+    stack = [(mapping, shapes)]
+    while stack:
+        part_map, part = stack.pop()
+        if part.get("parts") is not None:
+            part_map["parts"] = [dict(p) for p in part_map["parts"]]
+            part["parts"] = [dict(p) for p in part["parts"]]
+            stack.extend(zip(part_map["parts"], part["parts"]))
+        elif part["type"] == "shapes":
+            ref = remap[part["shape"]["ref"]]
+            part["shape"] = {"ref": ref}
+            part_map["shape"] = instances[ref]
+    return mapping, shapes
+
+
+def _shape_signature(part, instances):
+    if part["type"] == "shapes":
+        return instances[part["shape"]["ref"]]["cache_id"]
+
+    h = sha256()
+    for key, value in sorted(part["shape"].items()):
+        h.update(key.encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    return h.hexdigest()
+
+
+def flatten_parts(shapes, instances, path_locs=()):
+    """
+    Flatten the tessellated shapes tree to the leaf parts and a signature per part.
+    The signature covers the instance content, the locations of the part and of
+    all of its parents and all render attributes.
+
+    @param shapes: The shapes tree as returned by tessellate_group
+    @param instances: The instances of the group
+    @param path_locs: The locations of the parents
+
+    @return: dict id -> (part, signature)
+    """
+    result = {}
+    for part in shapes["parts"]:
+        locs = path_locs + (part["loc"],)
+        if part.get("parts") is not None:
+            result.update(flatten_parts(part, instances, locs))
+        else:
+            attributes = tuple(
+                (key, repr(value))
+                for key, value in sorted(part.items())
+                if key not in ("id", "loc", "bb", "shape")
+            )
+            signature = (locs, attributes, _shape_signature(part, instances))
+            result[part["id"]] = (part, signature)
+    return result
+
+
+class TessellationSession:
+    """
+    Re-convert and re-tessellate a changing scene and report what changed against
+    the previous update.
+
+    Every object passed to update is converted on its own. An object with the same
+    signature (see object_signature), name, color and alpha as in the previous
+    update is neither converted nor collected again, i.e. its hierarchy, instances,
+    discretized edges and vertices are reused. Instances already meshed in the
+    previous update (same cache_id or, for moved objects, same TShape) are neither
+    measured nor tessellated again. Hence an update pays for the signatures of all
+    objects and for the conversion and tessellation of the edited objects only.
+
+    Instances are shared between objects by TShape, like to_ocpgroup does. With
+    dedup, geometry equivalent instances are only shared within an object.
+    """
+
+    def __init__(
+        self, kwargs=None, progress=None, timeit=False, workers=None, dedup=False
+    ):
+        """
+        @param kwargs: The tessellation keyword arguments (deviation, ...)
+        @param progress: The progress bar
+        @param timeit: The flag to measure the time
+        @param workers: The number of processes to tessellate in parallel
+        @param dedup: Share instances of geometry equivalent shapes, see to_ocpgroup
+        """
+        self.kwargs = {} if kwargs is None else kwargs
+        self.progress = progress
+        self.timeit = timeit
+        self.workers = workers
+        self.dedup = dedup
+        self.reset()
+
+    def reset(self):
+        """Forget the previous scene, the next update reports all parts as added"""
+        self.group = None
+        self.instances = []
+        self.meshed_instances = []
+        self.shapes = None
+        self.mapping = None
+        self.known = {}
+        self.tshapes = {}
+        self.parts = {}
+        # (signature, name, color, alpha, options) -> converted objects, see _convert
+        self.objects = {}
+
+    def set_kwargs(self, kwargs):
+        """
+        Change the tessellation keyword arguments. Since they change all meshes,
+        the session is reset.
+
+        @param kwargs: The tessellation keyword arguments
+        """
+        self.kwargs = kwargs
+        self.reset()
+
+    def _convert(self, cad_objs, names, colors, alphas, options):
+        """
+        Convert the objects that changed since the previous update.
+
+        @return: The list of converted objects (dicts with the ocp hierarchy, its
+                 name, its instances and its collected subtrees by context) and
+                 the indices of the objects that were converted again
+        """
+        for label, values in (("names", names), ("colors", colors), ("alphas", alphas)):
+            if values is not None and len(values) != len(cad_objs):
+                raise ValueError(
+                    f"Length of {label} does not match the number of objects"
+                )
+
+        names = [None] * len(cad_objs) if names is None else make_unique(names)
+        colors = [None] * len(cad_objs) if colors is None else colors
+        alphas = [None] * len(cad_objs) if alphas is None else alphas
+        default_color = options.pop("default_color")
+        options_key = repr(sorted(options.items())) + repr(default_color)
+
+        converted = []
+        objects = {}
+        result = []
+        # an entry is used once per update, equal objects have one entry each
+        previous = {key: list(entries) for key, entries in self.objects.items()}
+        for i, (cad_obj, name, color, alpha) in enumerate(
+            zip(cad_objs, names, colors, alphas)
+        ):
+            signature = object_signature(cad_obj)
+            key = (signature, name, repr(color), alpha, options_key)
+
+            entry = None
+            if signature is not None and previous.get(key):
+                entry = previous[key].pop(0)
+
+            if entry is None:
+                converter = OcpConverter(progress=self.progress, dedup=self.dedup)
+                if default_color is not None:
+                    converter.default_color = default_color
+                ocp_obj = converter.to_ocp_object(
+                    cad_obj, name, color, alpha, **options
+                )
+                entry = {
+                    "ocp": ocp_obj,
+                    "name": None if ocp_obj is None else ocp_obj.name,
+                    "instances": converter.instances,
+                    "collected": {},
+                }
+                converted.append(i)
+
+            if signature is not None:
+                objects.setdefault(key, []).append(entry)
+            result.append(entry)
+
+        self.objects = objects
+        return result, converted
+
+    def update(
+        self,
+        *cad_objs,
+        names=None,
+        colors=None,
+        alphas=None,
+        render_mates=False,
+        render_joints=False,
+        helper_scale=1.0,
+        default_color=None,
+        show_parent=False,
+        show_sketch_local=True,
+        loc=None,
+    ):
+        """
+        Convert and tessellate the changed objects and compare the scene to the
+        previous update. The parameters are the ones of to_ocpgroup.
+
+        @param cad_objs: The objects, as accepted by to_ocpgroup
+        @param names: The list of names for the objects
+        @param colors: The list of colors for the objects
+        @param alphas: The list of alpha values for the objects
+        @param render_mates: The flag to render the mates
+        @param render_joints: The flag to render the joints
+        @param helper_scale: The scale of the helper objects
+        @param default_color: The default color of the objects
+        @param show_parent: The flag to show the parent
+        @param show_sketch_local: The flag to render the sketch local
+        @param loc: The location of the objects
+
+        @return: dict with
+                 - added: dict id -> part of the new parts
+                 - removed: list of ids of the parts that are gone
+                 - modified: dict id -> part of the changed parts
+                 - converted: list of indices of the objects that were converted
+                 - new_instances: list of refs of the instances that were meshed
+                 - meshed_instances, shapes, mapping: as returned by tessellate_group
+        """
+        options = {
+            "render_mates": render_mates,
+            "render_joints": render_joints,
+            "helper_scale": helper_scale,
+            "default_color": default_color,
+            # the parents are not part of the object signature
+            "show_parent": show_parent,
+            "sketch_local": show_sketch_local,
+        }
+        # timeit also records the spans of the update, see Profiler.run
+        with profiler.run(self.timeit):
+            return self._update(cad_objs, names, colors, alphas, options, loc)
+
+    def _update(self, cad_objs, names, colors, alphas, options, loc):
+        show_parent = options["show_parent"]
+        with Timer(self.timeit, "", "to_ocpgroup", 0):
+            entries, converted = self._convert(cad_objs, names, colors, alphas, options)
+            if show_parent:
+                # the signature does not cover the parents, never reuse the objects
+                self.objects = {}
+
+            # the scene as to_ocpgroup builds it
+            group = OcpGroup(loc=identity_location() if loc is None else loc)
+            entries = [
+                entry
+                for entry in entries
+                if entry["ocp"] is not None
+                and not (
+                    isinstance(entry["ocp"], OcpGroup) and entry["ocp"].length == 0
+                )
+            ]
+            for entry in entries:
+                entry["ocp"].name = entry["name"]
+                group.add(entry["ocp"])
+            group.make_unique_names()
+            single = group.length == 1 and isinstance(group.objects[0], OcpGroup)
+            if single:
+                group = group.cleanup()
+
+            # instances of all objects, shared by TShape
+            instances = []
+            index = {}
+            remaps = []
+            for entry in entries:
+                remap = []
+                for instance in entry["instances"]:
+                    obj = instance["obj"]
+                    key = tshape_hash(obj)
+                    for ref in index.get(key, ()):
+                        if instances[ref]["obj"].TShape() == obj.TShape():
+                            break
+                    else:
+                        ref = len(instances)
+                        instances.append(instance)
+                        index.setdefault(key, []).append(ref)
+                    remap.append(ref)
+                remaps.append(remap)
+
+        def collect(group, instances, discretize_edges, convert_vertices):
+            # collect only the objects that were converted or moved in the tree
+            if single:
+                mapping, shapes, loc, path = None, None, None, ""
+            else:
+                mapping, shapes, loc = group._collect_group("", None)
+                path = group.id
+
+            for entry, remap in zip(entries, remaps):
+                ocp = entry["ocp"]
+                context = (path, ocp.name, loc_to_tq(loc))
+                collected = entry["collected"].get(context)
+                if collected is None:
+                    collected = ocp.collect(
+                        path,
+                        entry["instances"],
+                        loc,
+                        discretize_edges,
+                        convert_vertices,
+                    )
+                    entry["collected"] = {context: collected}
+
+                part_map, part = _relink(collected, remap, instances)
+                if single:
+                    return part_map, part
+                mapping["parts"].append(part_map)
+                shapes["parts"].append(part)
+
+            return mapping, shapes
+
+        # a moved object gets a new cache_id, but its relocated instance still
+        # shares the TShape with the previous instance and hence its mesh
+        for instance in instances:
+            if instance["cache_id"] not in self.known:
+                obj = instance["obj"]
+                for tshape, cache_id in self.tshapes.get(tshape_hash(obj), ()):
+                    if tshape == obj.TShape() and cache_id in self.known:
+                        self.known[instance["cache_id"]] = self.known[cache_id]
+                        break
+
+        previous_ids = set(self.known)
+        meshed_instances = [None] * len(instances)
+        new_instances = []
+
+        with Timer(self.timeit, "", "tessellate_group", 0):
+            for ref, result in tessellate_group_iter(
+                group,
+                instances,
+                self.kwargs,
+                progress=self.progress,
+                timeit=self.timeit,
+                workers=self.workers,
+                known=self.known,
+                collect=collect,
+            ):
+                if ref is None:
+                    shapes, mapping = result
+                else:
+                    meshed_instances[ref] = result
+                    if instances[ref]["cache_id"] not in previous_ids:
+                        new_instances.append(ref)
+
+        # only keep the meshes of the current scene
+        current_ids = {instance["cache_id"] for instance in instances}
+        self.known = {
+            key: value for key, value in self.known.items() if key in current_ids
+        }
+
+        self.tshapes = {}
+        for instance in instances:
+            obj = instance["obj"]
+            self.tshapes.setdefault(tshape_hash(obj), []).append(
+                (obj.TShape(), instance["cache_id"])
+            )
+
+        parts = flatten_parts(shapes, instances)
+
+        added = {}
+        modified = {}
+        for id_, (part, signature) in parts.items():
+            previous = self.parts.get(id_)
+            if previous is None:
+                added[id_] = part
+            elif previous[1] != signature:
+                modified[id_] = part
+        removed = [id_ for id_ in self.parts if id_ not in parts]
+
+        self.group = group
+        self.instances = instances
+        self.meshed_instances = meshed_instances
+        self.shapes = shapes
+        self.mapping = mapping
+        self.parts = parts
+
+        return {
+            "added": added,
+            "removed": removed,
+            "modified": modified,
+            "converted": converted,
+            "new_instances": sorted(new_instances),
+            "meshed_instances": meshed_instances,
+            "shapes": shapes,
+            "mapping": mapping,
+        }
@@ -1,6 +1,12 @@
+import hashlib
+import json
+import mmap
 import os
+import re
 import time
 import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 try:
     import cadquery as cq
@@ -26,29 +32,165 @@ except:
     pass
 
 import OCP
+from OCP.IFSelect import IFSelect_RetDone
 from OCP.Quantity import Quantity_ColorRGBA
 from OCP.STEPCAFControl import STEPCAFControl_Reader
 from OCP.STEPControl import STEPControl_Reader
 from OCP.TCollection import TCollection_AsciiString, TCollection_ExtendedString
 from OCP.TDataStd import TDataStd_Name
-from OCP.TDF import TDF_ChildIterator, TDF_Label, TDF_LabelSequence
+from OCP.TDF import TDF_ChildIterator, TDF_Label, TDF_LabelSequence, TDF_Tool
 from OCP.TDocStd import TDocStd_Document
 from OCP.TopAbs import TopAbs_COMPOUND, TopAbs_COMPSOLID, TopAbs_FACE, TopAbs_SOLID
 from OCP.TopExp import TopExp_Explorer
 from OCP.TopLoc import TopLoc_Location
+from OCP.TopTools import TopTools_IndexedMapOfShape
 from OCP.XCAFDoc import (
     XCAFDoc_ColorCurv,
     XCAFDoc_ColorGen,
     XCAFDoc_ColorSurf,
+    XCAFDoc_ColorTool,
     XCAFDoc_DocumentTool,
 )
 
-# from ocp_tessellate.ocp_utils import deserialize, loc_to_tq, serialize, tq_to_loc
+from ocp_tessellate.ocp_utils import (
+    deserialize,
+    loc_to_tq,
+    make_compound,
+    serialize,
+    tq_to_loc,
+)
 from ocp_tessellate.utils import warn
-from ocp_tessellate.ocp_utils import make_compound
 
 DEFAULT_COLOR = (0.8, 0.8, 0.8, 1)
 
+#
+# Binary assembly cache (.jq files):
+#   magic (8 bytes) | header size (uint64, little endian) | JSON header | BRep blobs
+# The header holds the signature of the STEP file, the assembly tree with names,
+# colors and locations as tq tuples, and offset and length of the BRep buffer
+# (BinTools format) of every distinct shape. Blobs start at aligned offsets and
+# are only read when a shape is accessed.
+#
+
+CACHE_MAGIC = b"OCPTSTEP"
+CACHE_VERSION = 1
+CACHE_ALIGNMENT = 64
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def _align(offset, alignment=CACHE_ALIGNMENT):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def file_hash(filename):
+    """
+    Get the sha256 hex digest of a file
+    :param filename: name of the file
+    :return: str
+    """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as fd:
+        for chunk in iter(lambda: fd.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_signature(filename, with_hash=True):
+    """
+    Get size, modification time and optionally the hash of a file
+    :param filename: name of the file
+    :param with_hash: compute the sha256 of the file content
+    :return: dict
+    """
+    stat = os.stat(filename)
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "sha256": file_hash(filename) if with_hash else None,
+    }
+
+
+def _update_cache_header(cache_filename, header, limit=None):
+    """
+    Rewrite the header of a cache file in place, if it fits in front of the blobs
+    :param cache_filename: name of the cache file
+    :param header: the new header
+    :param limit: offset of the first blob (None: no blobs)
+    :return: True if the header was written
+    """
+    header = json.dumps(header).encode()
+    if limit is not None and 16 + len(header) > limit:
+        return False
+    try:
+        with open(cache_filename, "r+b") as fd:
+            fd.seek(8)
+            fd.write(len(header).to_bytes(8, "little"))
+            fd.write(header)
+    except OSError:  # e.g. a read only cache
+        return False
+    return True
+
+
+class LazyAssemblyObject(dict):
+    """
+    An assembly object whose values for some keys are only computed when one of
+    them is accessed first, e.g. the shape deserialized from a memory mapped cache
+    or shape, color and sub shapes of a lazily loaded STEP file. The computed
+    values are kept.
+    """
+
+    def __init__(self, resolve=None, keys=("shape",), **kwargs):
+        """
+        :param resolve: function returning a dict with the values for keys
+        :param keys: the keys resolved by resolve
+        :param kwargs: the values of the assembly object
+        """
+        super().__init__(**kwargs)
+        self._resolver = resolve
+        self._lazy_keys = keys
+
+    def resolve(self):
+        """Compute the lazy values now"""
+        if self._resolver is not None:
+            resolver, self._resolver = self._resolver, None
+            super().update(resolver())
+
+    @property
+    def resolved(self):
+        return self._resolver is None
+
+    def __getitem__(self, key):
+        if key in self._lazy_keys:
+            self.resolve()
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        if key in self._lazy_keys:
+            self.resolve()
+        return super().get(key, default)
+
+    def __setitem__(self, key, value):
+        if key in self._lazy_keys:
+            self.resolve()
+        super().__setitem__(key, value)
+
+
+class _CacheBlobs:
+    """Shapes of a memory mapped cache file, deserialized once per blob"""
+
+    def __init__(self, buffer, layout):
+        self.buffer = buffer
+        self.layout = layout
+        self.shapes = {}
+
+    def shape(self, index):
+        shape = self.shapes.get(index)
+        if shape is None:
+            start, length = self.layout[index]
+            shape = deserialize(bytes(self.buffer[start : start + length]))
+            self.shapes[index] = shape
+        return shape
+
 
 def clean_string(s):
     return (
@@ -60,14 +202,167 @@ def clean_string(s):
     )
 
 
+def unique_names(objs):
+    """
+    Create unique names for sibling AssemblyObjects by postfixing the enumerator
+    index of the name
+    :param objs: list of AssemblyObjects
+    :return: generator of (unique name, AssemblyObject) tuples
+    """
+    names = {}
+    for obj in objs:
+        name = obj["name"]
+        names[name] = 0 if names.get(name) is None else names[name] + 1
+        yield f"{name}_{names[name]}", obj
+
+
+def serialize_assemblies(assemblies):
+    """
+    Convert AssemblyObjects to a JSON serializable tree and BinTools buffers. Every
+    distinct shape is stored once, so shapes shared by several assembly objects
+    stay shared after deserialization
+    :param assemblies: list of AssemblyObjects
+    :return: the tree with buffer indices as shapes and the list of buffers
+    """
+    buffers = []
+    index = {}  # HashCode -> [(shape, buffer index)]
+
+    def add_shape(shape):
+        if shape is None:
+            return None
+        candidates = index.setdefault(shape.HashCode(2**31 - 1), [])
+        for other, i in candidates:
+            if other.IsEqual(shape):
+                return i
+        buffers.append(serialize(shape))
+        candidates.append((shape, len(buffers) - 1))
+        return len(buffers) - 1
+
+    def walk(objs):
+        if objs is None:
+            return None
+        return [
+            {
+                "name": obj["name"],
+                "loc": None if obj["loc"] is None else loc_to_tq(obj["loc"]),
+                "color": None if obj["color"] is None else list(obj["color"]),
+                "shape": add_shape(obj["shape"]),
+                "shapes": walk(obj["shapes"]),
+                "prototype": obj.get("prototype"),
+                "child_count": obj.get("child_count"),
+            }
+            for obj in objs
+        ]
+
+    return walk(assemblies), buffers
+
+
+def deserialize_assemblies(tree, blobs):
+    """
+    Convert a tree created by serialize_assemblies back to AssemblyObjects, whose
+    shapes are deserialized on first access
+    :param tree: the serialized tree
+    :param blobs: the _CacheBlobs with the buffers
+    :return: list of LazyAssemblyObjects
+    """
+
+    def walk(objs):
+        if objs is None:
+            return None
+        return [
+            LazyAssemblyObject(
+                (
+                    None
+                    if obj["shape"] is None
+                    else lambda index=obj["shape"]: {"shape": blobs.shape(index)}
+                ),
+                name=obj["name"],
+                loc=None if obj["loc"] is None else tq_to_loc(*obj["loc"]),
+                color=None if obj["color"] is None else tuple(obj["color"]),
+                shape=None,
+                shapes=walk(obj["shapes"]),
+                **{
+                    key: obj[key]
+                    for key in ("prototype", "child_count")
+                    if obj.get(key) is not None
+                },
+            )
+            for obj in objs
+        ]
+
+    return walk(tree)
+
+
+def _read_step_remote(args):
+    """
+    Worker function: read and parse a STEP file and return the serialized tree,
+    or the error if the file cannot be read
+    """
+    filename, options = args
+    timings = {}
+    total = time.perf_counter()
+    try:
+        start = time.perf_counter()
+        reader = StepReader(**options)
+        reader.read_document(filename)
+        timings["read"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        reader.assemblies = reader.get_subshapes()
+        timings["parse"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tree, buffers = serialize_assemblies(reader.assemblies)
+        layout = []
+        offset = 0
+        for buffer in buffers:
+            layout.append([offset, len(buffer)])
+            offset += len(buffer)
+        data = b"".join(buffers)
+        timings["serialize"] = time.perf_counter() - start
+
+        return {"tree": tree, "data": data, "layout": layout, "timings": timings}
+
+    except Exception as ex:
+        return {"error": f"{type(ex).__name__}: {ex}", "timings": timings}
+
+    finally:
+        timings["total"] = time.perf_counter() - total
+
+
 class StepReader:
-    def __init__(self, analyse_faces=True, split_compounds=True, use_colors=True):
+    def __init__(
+        self, analyse_faces=True, split_compounds=True, use_colors=True, lazy=False
+    ):
+        """
+        :param analyse_faces: use the face colors if all faces have the same color
+        :param split_compounds: split compounds with sub shape labels into solids
+        :param use_colors: read the colors of the STEP file
+        :param lazy: only index names, locations and hierarchy on load and resolve
+            shapes, colors and sub shapes of parts when they are accessed
+        """
         self.analyse_faces = analyse_faces
         self.split_compounds = split_compounds
         self.use_colors = use_colors
+        self.lazy = lazy
+        self.doc = None
         self.shape_tool = None
         self.color_tool = None
         self.assemblies = None
+        self.prototypes = None
+        self._unresolved = {}
+        self.timings = {"color_index": 0.0, "color_analysis": 0.0}
+        self._color_maps = None
+        self._has_face_colors = False
+        self._cache_file = None
+
+    def _options(self):
+        # the options the assembly tree depends on
+        return {
+            "analyse_faces": self.analyse_faces,
+            "split_compounds": self.split_compounds,
+            "use_colors": self.use_colors,
+        }
 
     def _create_assembly_object(
         self, name, loc=None, color=None, shape=None, children=None
@@ -102,6 +397,86 @@ class StepReader:
         else:
             return "Component"
 
+    def _label_color(self, label):
+        """
+        Get the first of the general, surface and curve color of a TDF_Label
+        :param label: TDF_label of a STEP file
+        :return: 4 tuple (RGBA) or None
+        """
+        col = Quantity_ColorRGBA()
+        if (
+            XCAFDoc_ColorTool.GetColor_s(label, XCAFDoc_ColorGen, col)
+            or XCAFDoc_ColorTool.GetColor_s(label, XCAFDoc_ColorSurf, col)
+            or XCAFDoc_ColorTool.GetColor_s(label, XCAFDoc_ColorCurv, col)
+        ):
+            rgb = col.GetRGB()
+            return (rgb.Red(), rgb.Green(), rgb.Blue(), col.Alpha())
+        return None
+
+    def build_color_index(self):
+        """
+        Index the colors of all top level shapes, assembly components and sub shapes
+        of the document in one pass. The index is searched in the same order as
+        XCAFDoc_ShapeTool.Search, so lookups return the same colors as querying the
+        color tool for every shape
+        """
+        start = time.perf_counter()
+
+        self._color_maps = {
+            kind: (TopTools_IndexedMapOfShape(), [])
+            for kind in ("top", "component", "subshape")
+        }
+        self._has_face_colors = False
+
+        def add(kind, label):
+            shape = self.shape_tool.GetShape_s(label)
+            shapes, colors = self._color_maps[kind]
+            if shape.IsNull() or shapes.Contains(shape):
+                return
+            color = self._label_color(label)
+            shapes.Add(shape)
+            colors.append(color)
+            if color is not None and shape.ShapeType() == TopAbs_FACE:
+                self._has_face_colors = True
+
+        labels = TDF_LabelSequence()
+        self.shape_tool.GetShapes(labels)
+        for i in range(1, labels.Length() + 1):
+            label = labels.Value(i)
+            add("top", label)
+
+            if self.shape_tool.IsAssembly_s(label):
+                components = TDF_LabelSequence()
+                self.shape_tool.GetComponents_s(label, components)
+                for j in range(1, components.Length() + 1):
+                    add("component", components.Value(j))
+
+            sub_labels = TDF_LabelSequence()
+            self.shape_tool.GetSubShapes_s(label, sub_labels)
+            for j in range(1, sub_labels.Length() + 1):
+                add("subshape", sub_labels.Value(j))
+
+        self.timings["color_index"] = time.perf_counter() - start
+
+    def _lookup_color(self, shape):
+        def find(kind, shape):
+            shapes, colors = self._color_maps[kind]
+            index = shapes.FindIndex(shape)
+            return (True, colors[index - 1]) if index > 0 else (False, None)
+
+        # same order as XCAFDoc_ShapeTool.Search
+        if not shape.Location().IsIdentity():
+            for kind in ("top", "component"):
+                found, color = find(kind, shape)
+                if found:
+                    return color
+
+        found, color = find("top", shape.Located(TopLoc_Location()))
+        if found:
+            return color
+
+        return find("subshape", shape)[1]
+
     def get_color(self, shape):
         """
         Get color of a TDF_Label object:
@@ -109,40 +484,35 @@ class StepReader:
         - if self.analyse_faces, get all colors of all faces. if all faces have the same color, return it, else return the shape color
         Note: This is BEST EFFORT only. Jupyter-CadQuery does not support different colors for the faces of a solid/compound.
               So for many STEP files with colored faces, the result will not be correct and depend on the structure of the STEP labels
+        Colors are looked up in the index created by build_color_index
         :param label: TDF_label or TopoDS_Shape of a STEP file
         :return: str
         """
-
-        def to_list(c):
-            return (c.GetRGB().Red(), c.GetRGB().Green(), c.GetRGB().Blue(), c.Alpha())
-
-        def get_col(obj):
-            col = Quantity_ColorRGBA()
-            if (
-                self.color_tool.GetColor(obj, XCAFDoc_ColorGen, col)
-                or self.color_tool.GetColor(obj, XCAFDoc_ColorSurf, col)
-                or self.color_tool.GetColor(obj, XCAFDoc_ColorCurv, col)
-            ):
-                return to_list(col)
-
         if not self.use_colors:
             return DEFAULT_COLOR
 
-        shape_color = get_col(shape)
+        start = time.perf_counter()
+
+        if self._color_maps is None:
+            self.build_color_index()
+
+        shape_color = self._lookup_color(shape)
 
         colors = []
-        if self.analyse_faces:
+        if self.analyse_faces and self._has_face_colors:
 
             # Find all face colors
             exp = TopExp_Explorer(shape, TopAbs_FACE)
             while exp.More():
-                color = get_col(exp.Current())
+                color = self._lookup_color(exp.Current())
                 if color is not None:
                     colors.append(color)
                 exp.Next()
 
             colors = list(set(colors))
 
+        self.timings["color_analysis"] += time.perf_counter() - start
+
         # If all faces have the same color, use this as shape color
         if len(colors) == 1:
             return colors[0]
@@ -193,9 +563,70 @@ class StepReader:
 
         return shapes
 
+    def get_prototype(self, ref_label):
+        """
+        Get the prototype of a referred label, i.e. its name, shape, color and
+        sub shapes. Every referred label is resolved only once, all occurrences
+        share the prototype. In lazy mode parts are only indexed, see
+        resolve_prototype
+        :param ref_label: referred TDF_label of a STEP file
+        :return: dict with id, name, color, shape and shapes
+        """
+        entry = TCollection_AsciiString()
+        TDF_Tool.Entry_s(ref_label, entry)
+        key = entry.ToCString()
+
+        prototype = self.prototypes.get(key)
+        if prototype is not None:
+            return prototype
+
+        prototype = self._create_assembly_object(self.get_name(ref_label))
+        prototype["id"] = len(self.prototypes)
+        self.prototypes[key] = prototype
+
+        if self.shape_tool.IsAssembly_s(ref_label):
+            prototype["shapes"] = self.get_subshapes(ref_label)
+        else:
+            self._unresolved[prototype["id"]] = ref_label
+            if not self.lazy:
+                self.resolve_prototype(prototype)
+
+        return prototype
+
+    def resolve_prototype(self, prototype):
+        """
+        Resolve shape, color and sub shapes of a part prototype
+        :param prototype: the prototype as created by get_prototype
+        :return: dict with color, shape and shapes
+        """
+        ref_label = self._unresolved.pop(prototype["id"], None)
+        if ref_label is not None:
+            name = prototype["name"]
+            shape = self.get_shape(ref_label)
+
+            if (
+                self.split_compounds
+                and shape.ShapeType() in [TopAbs_COMPOUND, TopAbs_COMPSOLID]
+                and ref_label.HasChild()
+            ):
+                sub_shapes = self.get_shape_details(ref_label, name, TopLoc_Location())
+                if len(sub_shapes) == 0:
+                    prototype["shape"] = shape
+                    prototype["color"] = self.get_color(shape)
+                else:
+                    prototype["shapes"] = sub_shapes
+
+            else:
+                prototype["shape"] = shape
+                prototype["color"] = self.get_color(shape)
+
+        return {key: prototype[key] for key in ("color", "shape", "shapes")}
+
     def get_subshapes(self, label=None, loc=None):
         """
-        Get sub shapes of STEP assemblies
+        Get sub shapes of STEP assemblies.
+        Occurrences of the same referred label only differ in location, they share
+        name, color, shape and sub shapes of their prototype, see get_prototype
         :param label: TDF_label of a STEP file
         :param loc: object location (TopLoc_Location)
         :return: list of AssemblyObjects
@@ -204,6 +635,8 @@ class StepReader:
         if label is None:
             # Get all non referenced top level labels
             self.shape_tool.GetFreeShapes(labels)
+            self.prototypes = {}
+            self._unresolved = {}
         else:
             # get all sub-components of the label
             self.shape_tool.GetComponents_s(label, labels)
@@ -219,37 +652,57 @@ class StepReader:
             else:
                 ref_label = sub_label
 
-            is_assembly = self.shape_tool.IsAssembly_s(ref_label)
+            # Get location from the sub_label and everything else from the prototype
+            prototype = self.get_prototype(ref_label)
+            if prototype["id"] in self._unresolved:
+                sub_shape = LazyAssemblyObject(
+                    lambda prototype=prototype: self.resolve_prototype(prototype),
+                    ("color", "shape", "shapes"),
+                    **self._create_assembly_object(
+                        prototype["name"], self.get_location(sub_label)
+                    ),
+                )
+            else:
+                sub_shape = self._create_assembly_object(
+                    prototype["name"],
+                    self.get_location(sub_label),
+                    prototype["color"],
+                    prototype["shape"],
+                    prototype["shapes"],
+                )
+            sub_shape["prototype"] = prototype["id"]
+            sub_shape["child_count"] = self.shape_tool.NbComponents_s(ref_label)
 
-            # Get location from the sub_label and everything else from the referenced label
-            loc = self.get_location(sub_label)
-            name = self.get_name(ref_label)
-            shape = self.get_shape(ref_label)
+            result.append(sub_shape)
 
-            sub_shape = self._create_assembly_object(name, loc)
+        return result
 
-            if is_assembly:
-                sub_shape["shapes"] = self.get_subshapes(ref_label)
+    def read_document(self, filename):
+        """
+        Read a STEP file into a new XCAF document and index its colors
+        :param filename: name of the STEP file
+        """
+        fmt = TCollection_ExtendedString("CadQuery-XCAF")
+        doc = TDocStd_Document(fmt)
+        # keep the document, the tools are only valid as long as it exists
+        self.doc = doc
 
-            elif (
-                self.split_compounds
-                and shape.ShapeType() in [TopAbs_COMPOUND, TopAbs_COMPSOLID]
-                and ref_label.HasChild()
-            ):
-                sub_shapes = self.get_shape_details(ref_label, name, TopLoc_Location())
-                if len(sub_shapes) == 0:
-                    sub_shape["shape"] = shape
-                    sub_shape["color"] = self.get_color(shape)
-                else:
-                    sub_shape["shapes"] = sub_shapes
+        self.shape_tool = XCAFDoc_DocumentTool.ShapeTool_s(doc.Main())
+        self.color_tool = XCAFDoc_DocumentTool.ColorTool_s(doc.Main())
 
-            else:
-                sub_shape["shape"] = shape
-                sub_shape["color"] = self.get_color(shape)
+        reader = STEPCAFControl_Reader()
+        reader.SetNameMode(True)
+        reader.SetColorMode(True)
+        reader.SetLayerMode(True)
 
-            result.append(sub_shape)
+        if reader.ReadFile(filename) != IFSelect_RetDone:
+            raise ValueError(f"STEP File {filename} could not be loaded")
+        reader.Transfer(doc)
 
-        return result
+        self.timings = {"color_index": 0.0, "color_analysis": 0.0}
+        self._color_maps = None
+        if self.use_colors and not self.lazy:
+            self.build_color_index()
 
     def load(self, filename, cache_name=None, clear_cache=False):
         """
@@ -269,10 +722,11 @@ class StepReader:
                     print("Cache cleared")
                 else:
                     print("Loading from cache ... ", flush=True, end="")
-                    self.load_assembly(cache_filename)
-                    print("done")
-                    print(f"duration: {time.time() - start:5.1f} s")
-                    return
+                    if self.load_assembly(cache_filename, filename):
+                        print("done")
+                        print(f"duration: {time.time() - start:5.1f} s")
+                        return
+                    print("outdated")
 
         if not os.path.exists(filename):
             raise FileNotFoundError(filename)
@@ -280,19 +734,7 @@ class StepReader:
         print("Reading STEP file ... ", flush=True, end="")
         time.sleep(0.01)  # ensure output is shown
 
-        fmt = TCollection_ExtendedString("CadQuery-XCAF")
-        doc = TDocStd_Document(fmt)
-
-        self.shape_tool = XCAFDoc_DocumentTool.ShapeTool_s(doc.Main())
-        self.color_tool = XCAFDoc_DocumentTool.ColorTool_s(doc.Main())
-
-        reader = STEPCAFControl_Reader()
-        reader.SetNameMode(True)
-        reader.SetColorMode(True)
-        reader.SetLayerMode(True)
-
-        reader.ReadFile(filename)
-        reader.Transfer(doc)
+        self.read_document(filename)
 
         print("parsing Assembly ... ", flush=True, end="")
 
@@ -303,34 +745,248 @@ class StepReader:
 
         if cache_name is not None:
             print("Saving to cache ... ", flush=True, end="")
-            self.save_assembly(cache_filename)
+            self.save_assembly(cache_filename, filename)
             print("done")
 
-    def to_cadquery(self, path=None):
+    def load_files(self, filenames, workers=None):
         """
-        Convert internal AssemblyObjects format to CadQuery Assemblies
-        :return: cadquery.Assembly
+        Load several STEP files in parallel, each in its own worker process.
+        The workers send the assembly trees with the shapes as BinTools buffers,
+        which are deserialized on first access. The result is one assembly object
+        per file, named after the file, in self.assemblies. Files that cannot be
+        read or crash their worker are skipped and reported
+        :param filenames: list of STEP file names
+        :param workers: the number of worker processes (None: number of cpus)
+        :return: dict with the timings per file (read, parse, serialize and total
+            in seconds, measured in the worker) and the errors per file
         """
+        options = self._options()
+        results = {}
+        timings = {}
+        errors = {}
+
+        def collect(filename, result):
+            timings[filename] = result["timings"]
+            if "error" in result:
+                errors[filename] = result["error"]
+                warn(f"Skipping {filename}: {result['error']}")
+            else:
+                results[filename] = result
+
+        def run(filenames, workers):
+            # returns the files that were lost with a broken pool
+            unfinished = set()
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(_read_step_remote, (filename, options)): filename
+                    for filename in filenames
+                }
+                for future in as_completed(futures):
+                    filename = futures[future]
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool:
+                        unfinished.add(filename)
+                        continue
+                    except Exception as ex:  # e.g. a result that can't be pickled
+                        result = {"error": f"{type(ex).__name__}: {ex}", "timings": {}}
+                    collect(filename, result)
+            return [filename for filename in filenames if filename in unfinished]
+
+        start = time.perf_counter()
+
+        # A crashed worker (segfault, out of memory) breaks the pool and fails all
+        # pending files with it. Retry them one by one in a pool of their own, so
+        # that only the file that crashes its worker is skipped
+        for filename in run(filenames, workers):
+            if run([filename], 1):
+                collect(
+                    filename,
+                    {"error": "BrokenProcessPool: the worker crashed", "timings": {}},
+                )
 
-        def to_workplane(obj):
-            return cq.Workplane(obj=cq.Solid(obj))
+        self.assemblies = []
+        for filename in filenames:
+            result = results.get(filename)
+            if result is None:
+                continue
+            blobs = _CacheBlobs(result["data"], result["layout"])
+            name = clean_string(os.path.splitext(os.path.basename(filename))[0])
+            self.assemblies.append(
+                self._create_assembly_object(
+                    name,
+                    TopLoc_Location(),
+                    children=deserialize_assemblies(result["tree"], blobs),
+                )
+            )
 
-        def walk(objs, name=None, loc=None):
-            a = cq.Assembly(name=name, loc=loc)
-            names = {}
-            for obj in objs:
-                name = obj["name"]
+        return {
+            "timings": timings,
+            "errors": errors,
+            "duration": time.perf_counter() - start,
+        }
 
-                # Create a unique name by postfixing the enumerator index if needed
-                if names.get(name) is None:
-                    names[name] = 0
-                else:
-                    names[name] += 1
-                name = f"{obj['name']}_{names[name]}"
+    def save_assembly(self, cache_filename, filename=None):
+        """
+        Save self.assemblies to a binary cache file. Every distinct shape is stored
+        once as BinTools buffer, so shapes shared by several assembly objects stay
+        shared after loading. The reader options are stored with the tree
+        :param cache_filename: name of the cache file
+        :param filename: name of the STEP file the cache is created from
+        """
+        tree, buffers = serialize_assemblies(self.assemblies)
+
+        relative = []
+        offset = 0
+        for buffer in buffers:
+            relative.append([offset, len(buffer)])
+            offset = _align(offset + len(buffer))
+
+        source = None if filename is None else file_signature(filename)
+
+        # blob offsets depend on the header size, so grow it until the header fits
+        header_size = CACHE_ALIGNMENT
+        while True:
+            layout = [[o + header_size, n] for o, n in relative]
+            header = json.dumps(
+                {
+                    "version": CACHE_VERSION,
+                    "source": source,
+                    "options": self._options(),
+                    "assemblies": tree,
+                    "layout": layout,
+                }
+            ).encode()
+            if 16 + len(header) <= header_size:
+                break
+            header_size = _align(16 + len(header))
+
+        tmp_filename = f"{cache_filename}.tmp"
+        try:
+            with open(tmp_filename, "wb") as fd:
+                fd.write(CACHE_MAGIC)
+                fd.write(len(header).to_bytes(8, "little"))
+                fd.write(header)
+                for (start, _), buffer in zip(layout, buffers):
+                    fd.seek(start)
+                    fd.write(buffer)
+            os.replace(tmp_filename, cache_filename)
+        except BaseException:
+            if os.path.exists(tmp_filename):
+                os.unlink(tmp_filename)
+            raise
+
+    def load_assembly(self, cache_filename, filename=None):
+        """
+        Load self.assemblies from a binary cache file. The file is memory mapped and
+        the shapes are only deserialized when they are accessed.
+        The cache is outdated if the STEP file has a different size, or a different
+        modification time and a different sha256 hash. If only the modification time
+        differs, it is updated in the cache. A cache created with other reader
+        options (analyse_faces, split_compounds, use_colors) and corrupt cache files
+        count as outdated
+        :param cache_filename: name of the cache file
+        :param filename: name of the STEP file to validate the cache against
+            (None or a missing file: do not validate)
+        :return: True if loaded, False if the cache is outdated or invalid
+        """
+        try:
+            with open(cache_filename, "rb") as fd:
+                buffer = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # unreadable or empty file
+            return False
+
+        # a corrupt or truncated cache file is treated like an outdated one
+        try:
+            assemblies = self._read_cache(buffer, cache_filename, filename)
+        except (ValueError, KeyError, TypeError, IndexError):
+            assemblies = None
+
+        if assemblies is None:
+            buffer.close()
+            return False
+
+        self.assemblies = assemblies
+        self._cache_file = buffer
+        return True
+
+    def _read_cache(self, buffer, cache_filename, filename):
+        if buffer[:8] != CACHE_MAGIC:
+            return None
+
+        size = int.from_bytes(buffer[8:16], "little")
+        if 16 + size > len(buffer):
+            return None
+        header = json.loads(buffer[16 : 16 + size])
+        if header["version"] != CACHE_VERSION:
+            return None
+        if header["options"] != self._options():
+            return None
+
+        layout = header["layout"]
+        for start, length in layout:
+            if start < 16 + size or start + length > len(buffer):
+                return None
+
+        source = header["source"]
+        if filename is not None and source is not None and os.path.exists(filename):
+            current = file_signature(filename, with_hash=False)
+            if current["size"] != source["size"]:
+                return None
+            if current["mtime"] != source["mtime"]:
+                if file_hash(filename) != source["sha256"]:
+                    return None
+                # same content, store the new mtime to skip hashing next time
+                header["source"] = {**source, "mtime": current["mtime"]}
+                limit = min((start for start, _ in layout), default=None)
+                _update_cache_header(cache_filename, header, limit)
+
+        blobs = _CacheBlobs(buffer, layout)
+        return deserialize_assemblies(header["assemblies"], blobs)
+
+    def find(self, path):
+        """
+        Find an assembly object by its unique name as used by to_cadquery,
+        subtree_to_cadquery and to_build123d. In lazy mode, parts are only resolved
+        to search their sub shapes if path can be the name of one of them
+        :param path: the unique name, e.g. "screw_3"
+        :return: the AssemblyObject or None
+        """
+        stack = [(obj["name"], obj) for obj in reversed(self.assemblies)]
+        while stack:
+            name, obj = stack.pop()
+            if name == path:
+                return obj
+            # sub shapes of a part are named <name>_<index>_<enumerator>
+            if (
+                isinstance(obj, LazyAssemblyObject)
+                and not obj.resolved
+                and re.fullmatch(rf"{re.escape(obj['name'])}_\d+_\d+", path) is None
+            ):
+                continue
+            if obj["shapes"] is not None:
+                stack.extend(reversed(list(unique_names(obj["shapes"]))))
+        return None
+
+    def _cadquery_walker(self, share_shapes):
+        # with share_shapes one cadquery Shape per shape, so that all occurrences of
+        # a prototype are converted to the same instance
+        cq_shapes = {}
+
+        def to_leaf(shape):
+            if not share_shapes:
+                return cq.Workplane(obj=cq.Solid(shape))
+            cq_shape = cq_shapes.get(id(shape))
+            if cq_shape is None:
+                cq_shape = cq_shapes[id(shape)] = cq.Shape.cast(shape)
+            return cq_shape
 
+        def walk(objs, name=None, loc=None):
+            a = cq.Assembly(name=name, loc=loc)
+            for name, obj in unique_names(objs):
                 a.add(
                     (
-                        to_workplane(obj["shape"])
+                        to_leaf(obj["shape"])
                         if obj["shapes"] is None
                         else walk(obj["shapes"])
                     ),
@@ -341,12 +997,28 @@ class StepReader:
 
             return a
 
+        return to_leaf, walk
+
+    def _check_assemblies(self):
         if len(self.assemblies) == 0 or (
             self.assemblies[0]["shapes"] is not None
             and len(self.assemblies[0]["shapes"]) == 0
         ):
             raise ValueError("Empty assembly list")
 
+    def to_cadquery(self, path=None, share_shapes=False):
+        """
+        Convert internal AssemblyObjects format to CadQuery Assemblies
+        :param path: for several assemblies, return the obj of this object of the
+            converted group, see cadquery.Assembly.objects
+        :param share_shapes: add one cadquery Shape per distinct shape instead of a
+            new Workplane per occurrence, so that all occurrences of a prototype are
+            one instance when tessellated
+        :return: cadquery.Assembly
+        """
+        _, walk = self._cadquery_walker(share_shapes)
+        self._check_assemblies()
+
         if len(self.assemblies) == 1:
             assembly = self.assemblies[0]
             return walk(
@@ -368,33 +1040,51 @@ class StepReader:
 
         return result
 
+    def subtree_to_cadquery(self, path, share_shapes=True):
+        """
+        Convert only the object with the given unique name to CadQuery. In lazy
+        mode only the parts of this sub tree are resolved
+        :param path: the unique name of the object, see find
+        :param share_shapes: see to_cadquery
+        :return: cadquery.Assembly for an assembly, else the cadquery Shape
+            (a Workplane if share_shapes is False)
+        """
+        to_leaf, walk = self._cadquery_walker(share_shapes)
+        self._check_assemblies()
+
+        obj = self.find(path)
+        if obj is None:
+            raise KeyError(path)
+        if obj["shapes"] is None:
+            return to_leaf(obj["shape"])
+        return walk(obj["shapes"], path, cq.Location(obj["loc"]))
+
     def to_build123d(self):
         """
         Convert internal AssemblyObjects format to build123d Assemblies
         :return: buiild123d assembly
         """
 
-        def walk(objs, label=None, loc=None):
-            a = []
-            names = {}
-            for obj in objs:
-                label = obj["name"]
+        # one build123d object per shape, clones share its TShape
+        b3d_shapes = {}
 
-                # Create a unique name by postfixing the enumerator index if needed
-                if names.get(label) is None:
-                    names[label] = 0
-                else:
-                    names[label] += 1
-                label = f"{obj['name']}_{names[label]}"
+        def to_compound(obj):
+            compound = b3d_shapes.get(id(obj))
+            if compound is None:
+                compound = b3d_shapes[id(obj)] = Compound(obj)
+            return compound
 
+        def walk(objs, label=None, loc=None):
+            a = []
+            for name, obj in unique_names(objs):
                 a.append(
                     clone(
                         (
-                            Compound(obj["shape"])
+                            to_compound(obj["shape"])
                             if obj["shapes"] is None
                             else walk(obj["shapes"])
                         ),
-                        label=label,
+                        label=name,
                         color=None if obj["color"] is None else Color(*obj["color"]),
                         location=Location(obj.get("loc")),
                     )
@@ -404,11 +1094,7 @@ class StepReader:
                 result.location = loc
             return result
 
-        if len(self.assemblies) == 0 or (
-            self.assemblies[0]["shapes"] is not None
-            and len(self.assemblies[0]["shapes"]) == 0
-        ):
-            raise ValueError("Empty assembly list")
+        self._check_assemblies()
 
         if len(self.assemblies) == 1:
             assembly = self.assemblies[0]
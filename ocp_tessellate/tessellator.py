@@ -17,10 +17,14 @@
 """Tessellator class"""
 
 import os
-import sys
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import chain
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 
 import numpy as np
-from cachetools import LRUCache, cached
 from OCP.BRep import BRep_Tool
 from OCP.BRepAdaptor import BRepAdaptor_Curve
 from OCP.BRepGProp import BRepGProp_Face
@@ -29,12 +33,15 @@ from OCP.BRepTools import BRepTools
 from OCP.GCPnts import GCPnts_QuasiUniformAbscissa, GCPnts_QuasiUniformDeflection
 
 # pylint: disable=no-name-in-module,import-error
-from OCP.gp import gp_Pnt, gp_Vec
+from OCP.gp import gp_Pnt, gp_Pnt2d, gp_Vec
+from OCP.Poly import Poly_Triangle
 from OCP.TopAbs import TopAbs_Orientation, TopAbs_SOLID
 from OCP.TopExp import TopExp_Explorer
 from OCP.TopLoc import TopLoc_Location
 
 from .ocp_utils import (
+    deserialize,
+    downcast,
     get_edge_type,
     get_edges,
     get_face_type,
@@ -43,8 +50,13 @@ from .ocp_utils import (
     get_vertices,
     is_line,
     length,
+    loc_to_matrix,
     make_compound,
+    serialize,
 )
+from .disk_cache import create_disk_cache
+from .mesh_cache import CostAwareCache, cost_cached
+from .mesh_optimizer import optimize_mesh
 from .trace import Trace
 from .utils import Timer, round_sig
 
@@ -88,6 +100,7 @@ def make_key(
     debug=False,
     progress=None,
     shape_id=None,
+    weld_tolerance=None,
 ):  # pylint: disable=unused-argument
     # quality is a measure of bounding box and deviation, hence can be ignored (and should due to accuracy issues
     # shape_id is also ignored
@@ -103,6 +116,9 @@ def make_key(
         compute_edges,
         compute_faces,
     )
+    if weld_tolerance is not None:
+        # optimized meshes are cached next to the raw meshes
+        key += (weld_tolerance,)
 
     if progress is not None and cache.get(key) is not None:
         progress.update("c")
@@ -110,23 +126,29 @@ def make_key(
     return key
 
 
-def get_size(obj):
-    size = sys.getsizeof(obj)
-    if isinstance(obj, dict):
-        size += sum([get_size(v) + len(k) for k, v in obj.items()])
-    elif isinstance(obj, np.ndarray):
-        size += obj.size * obj.dtype.itemsize
-    elif isinstance(obj, (tuple, list)):
-        size += sum([get_size(i) for i in obj])
-    return size
-
-
 cache_size = os.environ.get("OCP_CACHE_SIZE_MB")
 if cache_size is None:
     cache_size = 256 * 1024 * 1024
 else:
     cache_size = int(cache_size) * 1024 * 1024
-cache = LRUCache(maxsize=cache_size, getsizeof=get_size)
+cache = CostAwareCache(maxsize=cache_size)
+
+# Second level cache on disk, disabled unless OCP_DISK_CACHE_SIZE_MB is set
+disk_cache = create_disk_cache()
+
+
+def disk_key(
+    cache_key,
+    deviation,
+    angular_tolerance,
+    compute_edges,
+    compute_faces,
+    weld_tolerance=None,
+):
+    if disk_cache is None or cache_key is None:
+        return None
+    key = (cache_key, deviation, angular_tolerance, compute_edges, compute_faces)
+    return key if weld_tolerance is None else key + (weld_tolerance,)
 
 
 def face_mapper(shape, id):
@@ -210,11 +232,13 @@ class Tessellator:
         trace = Trace(LOG_FILE)
 
         if compute_faces:
-            with Timer(debug, "", "get nodes, triangles and normals", 3):
+            with Timer(
+                debug, "", "get nodes, triangles and normals", 3, span="extract faces"
+            ):
                 self.tessellate(trace)
 
         if compute_edges:
-            with Timer(debug, "", "get edges", 3):
+            with Timer(debug, "", "get edges", 3, span="extract edges"):
                 self.compute_edges(trace)
 
         for ind, v in enumerate(get_vertices(shape)):
@@ -232,55 +256,76 @@ class Tessellator:
         n_buf = gp_Vec()
         loc_buf = TopLoc_Location()
 
+        vertices = []
+        triangles = []
+        normals = []
+
+        pnt_coord = gp_Pnt.Coord
+        pnt2d_coord = gp_Pnt2d.Coord
+        triangle_get = Poly_Triangle.Get
+
         offset = -1
 
         # every line below is selected for performance. Do not introduce functions to "beautify" the code
         for ind, face in enumerate(get_faces(self.shape)):
             trace.face(f"{self.shape_id}/faces/faces_{ind}", face)
-            if face.Orientation() == TopAbs_Orientation.TopAbs_REVERSED:
-                i1, i2 = 2, 1
-            else:
-                i1, i2 = 1, 2
-
+            is_reversed = face.Orientation() == TopAbs_Orientation.TopAbs_REVERSED
             internal = face.Orientation() == TopAbs_Orientation.TopAbs_INTERNAL
 
             self.face_types.append(get_face_type(face).value)
 
             poly = BRep_Tool.Triangulation_s(face, loc_buf)
             if poly is not None:
-                Trsf = loc_buf.Transformation()
-
-                # add vertices
-                flat = []
-                for i in range(1, poly.NbNodes() + 1):
-                    flat.extend(poly.Node(i).Transformed(Trsf).Coord())
-                self.vertices.extend(flat)
-
-                # add triangles
-                flat = []
-                for i in range(1, poly.NbTriangles() + 1):
-                    coord = poly.Triangle(i).Get()
-                    flat.extend(
-                        (coord[0] + offset, coord[i1] + offset, coord[i2] + offset)
-                    )
-                self.triangles.extend(flat)
-                self.triangles_per_face.append(poly.NbTriangles())
+                nb_nodes = poly.NbNodes()
+                nb_triangles = poly.NbTriangles()
+
+                # add vertices: bulk read the node table and apply the face location
+                # as one matrix multiplication
+                nodes = np.array(
+                    list(map(pnt_coord, map(poly.Node, range(1, nb_nodes + 1)))),
+                    dtype=np.float64,
+                ).reshape(-1, 3)
+                if not loc_buf.IsIdentity():
+                    m = loc_to_matrix(loc_buf)
+                    nodes = nodes @ m[:3, :3].T + m[:3, 3]
+                vertices.append(nodes)
+
+                # add triangles: bulk read the triangle table, then flip and offset
+                tri = np.fromiter(
+                    chain.from_iterable(
+                        map(
+                            triangle_get, map(poly.Triangle, range(1, nb_triangles + 1))
+                        )
+                    ),
+                    dtype=np.int32,
+                    count=3 * nb_triangles,
+                ).reshape(-1, 3)
+                if is_reversed:
+                    tri = tri[:, (0, 2, 1)]
+                triangles.append(tri + offset)
+                self.triangles_per_face.append(nb_triangles)
 
                 # add normals
                 if poly.HasUVNodes():
-                    prop = BRepGProp_Face(face)
+                    normal = BRepGProp_Face(face).Normal
                     flat = []
-                    for i in range(1, poly.NbNodes() + 1):
-                        u, v = poly.UVNode(i).Coord()
-                        prop.Normal(u, v, p_buf, n_buf)
-                        if n_buf.SquareMagnitude() > 0:
-                            n_buf.Normalize()
-                        flat.extend(
-                            n_buf.Reverse().Coord() if internal else n_buf.Coord()
-                        )
-                    self.normals.extend(flat)
-
-                offset += poly.NbNodes()
+                    for u, v in map(
+                        pnt2d_coord, map(poly.UVNode, range(1, nb_nodes + 1))
+                    ):
+                        normal(u, v, p_buf, n_buf)
+                        flat.append(n_buf.Coord())
+                    n = np.array(flat, dtype=np.float64).reshape(-1, 3)
+                    norm = np.linalg.norm(n, axis=1, keepdims=True)
+                    np.divide(n, norm, out=n, where=norm > 0)
+                    normals.append(-n if internal else n)
+
+                offset += nb_nodes
+
+        if vertices:
+            self.vertices = np.concatenate(vertices).ravel()
+            self.triangles = np.concatenate(triangles).ravel()
+        if normals:
+            self.normals = np.concatenate(normals).ravel()
 
     def _compute_missing_normals(self):
         vertices = np.asarray(self.vertices).reshape(-1, 3)
@@ -438,7 +483,7 @@ def compute_quality(bb, deviation=0.1):
 
 
 # cache key: (shape.hash, cache_key, deviaton, angular_tolerance, compute_edges, compute_faces)
-@cached(cache, key=make_key)
+@cost_cached(cache, key=make_key)
 def tessellate(
     shape,
     cache_key,
@@ -451,6 +496,7 @@ def tessellate(
     debug=False,
     progress=None,
     shape_id="",
+    weld_tolerance=None,
 ):
     if isinstance(shape, (list, tuple)):
         if len(shape) == 1:
@@ -462,6 +508,46 @@ def tessellate(
     #     make_compound(shapes) if len(shapes) > 1 else shapes[0]
     # )  # pylint: disable=protected-access
 
+    key = disk_key(
+        cache_key,
+        deviation,
+        angular_tolerance,
+        compute_edges,
+        compute_faces,
+        weld_tolerance,
+    )
+    if key is not None:
+        mesh = disk_cache.get(key)
+        if mesh is not None:
+            if progress is not None:
+                progress.update("c")
+            return mesh
+
+    if weld_tolerance is not None:
+        # optimize the raw mesh, taken from the cache if possible
+        raw_tessellate = tessellate if cache_key is not None else tessellate.__wrapped__
+        raw_mesh = raw_tessellate(
+            shape,
+            cache_key,
+            deviation=deviation,
+            quality=quality,
+            angular_tolerance=angular_tolerance,
+            compute_faces=compute_faces,
+            compute_edges=compute_edges,
+            debug=debug,
+            progress=progress,
+            shape_id=shape_id,
+        )
+        with Timer(debug, "", "optimize mesh:", 3, span="optimize") as t:
+            mesh, stats = optimize_mesh(raw_mesh, weld_tolerance)
+            t.info = (
+                f"{{vertices:{stats['vertices_before']}->{stats['vertices_after']}, "
+                f"saved:{stats['bytes_saved']} bytes}}"
+            )
+        if key is not None:
+            disk_cache[key] = mesh
+        return mesh
+
     if NATIVE and is_native_tessellator_enabled():
         if progress is not None:
             progress.update("*")
@@ -472,7 +558,7 @@ def tessellate(
         tess = Tessellator(shape_id)
 
     tess.compute(shape, quality, angular_tolerance, compute_faces, compute_edges, debug)
-    return {
+    mesh = {
         "vertices": tess.get_vertices(),
         "triangles": tess.get_triangles(),
         "normals": tess.get_normals(),
@@ -485,6 +571,224 @@ def tessellate(
         "triangles_per_face": tess.get_triangles_per_face(),
         "segments_per_edge": tess.get_segments_per_edge(),
     }
+    if key is not None:
+        disk_cache[key] = mesh
+
+    return mesh
+
+
+#
+# Parallel tessellation
+#
+
+
+def _to_shared_memory(mesh):
+    """Copy the arrays of a mesh into one shared memory block"""
+    layout = []
+    offset = 0
+    for key, value in mesh.items():
+        value = np.ascontiguousarray(value)
+        layout.append((key, value.dtype.str, value.shape, offset))
+        offset += (value.nbytes + 7) // 8 * 8  # keep arrays 8 byte aligned
+
+    shm = SharedMemory(create=True, size=max(offset, 1))
+    block = np.ndarray((shm.size,), dtype=np.uint8, buffer=shm.buf)
+    for key, dtype, shape, start in layout:
+        value = np.ascontiguousarray(mesh[key])
+        block[start : start + value.nbytes] = value.view(np.uint8).ravel()
+    del block
+    shm.close()
+
+    return shm.name, layout
+
+
+def _release_shared_memory(name):
+    """Unlink a shared memory block whose mesh is not used"""
+    try:
+        shm = SharedMemory(name=name)
+    except FileNotFoundError:
+        return
+    shm.close()
+    shm.unlink()
+
+
+def _from_shared_memory(name, layout):
+    """Map a mesh from a shared memory block without copying the arrays"""
+    shm = SharedMemory(name=name)
+    # the mapping stays valid after unlinking, it is released with the last array
+    shm.unlink()
+
+    block = np.ndarray((shm.size,), dtype=np.uint8, buffer=shm.buf)
+    weakref.finalize(block, shm.close)
+
+    mesh = {}
+    for key, dtype, shape, start in layout:
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape)) * dtype.itemsize
+        mesh[key] = block[start : start + size].view(dtype).reshape(shape)
+
+    return mesh
+
+
+def _tessellate_remote(args):
+    """Worker function: deserialize the BRep buffer and tessellate it"""
+    buffer, quality, angular_tolerance, compute_faces, compute_edges, weld = args
+
+    start = time.perf_counter()
+    shape = downcast(deserialize(buffer))
+    mesh = tessellate.__wrapped__(
+        shape,
+        None,
+        deviation=None,
+        quality=quality,
+        angular_tolerance=angular_tolerance,
+        compute_faces=compute_faces,
+        compute_edges=compute_edges,
+        weld_tolerance=weld,
+    )
+    return _to_shared_memory(mesh), time.perf_counter() - start
+
+
+def _cache_mesh(key, mesh, cost=None):
+    """Add a mesh to the in memory cache like cost_cached, i.e. skip it if too large"""
+    try:
+        cache.set(key, mesh, cost=cost)
+    except ValueError:
+        pass  # value too large
+
+
+def tessellate_parallel_iter(
+    tasks,
+    deviation: float,
+    angular_tolerance: float,
+    compute_faces=True,
+    compute_edges=True,
+    workers=None,
+    progress=None,
+    weld_tolerance=None,
+):
+    """
+    Tessellate shapes in a process pool. The shapes are shipped to the workers as
+    BRep buffers and the meshes come back via shared memory.
+    Cached meshes are yielded first, the others as soon as a worker finishes them.
+
+    @param tasks: list of (shape, cache_key, quality) tuples
+    @param deviation: the deviation used for the cache key
+    @param angular_tolerance: the angular tolerance
+    @param compute_faces: the flag to compute faces
+    @param compute_edges: the flag to compute edges
+    @param workers: the number of worker processes (None: number of cpus)
+    @param progress: the progress bar
+    @param weld_tolerance: optimize the meshes with this tolerance, see optimize_mesh
+
+    @return: generator of (task index, mesh) tuples
+    """
+    pending = {}
+    for i, (shape, cache_key, quality) in enumerate(tasks):
+        key = make_key(
+            shape,
+            cache_key,
+            deviation,
+            quality,
+            angular_tolerance,
+            compute_edges=compute_edges,
+            compute_faces=compute_faces,
+            progress=progress,
+            weld_tolerance=weld_tolerance,
+        )
+        mesh = cache.lookup(key)
+        if mesh is None and disk_key(*key) is not None:
+            mesh = disk_cache.get(key)
+            if mesh is not None:
+                _cache_mesh(key, mesh)
+                if progress is not None:
+                    progress.update("c")
+        if mesh is not None:
+            yield i, mesh
+        elif key in pending:
+            # same cache key as an earlier task, will be a cache hit
+            if progress is not None:
+                progress.update("c")
+            pending[key].append(i)
+        else:
+            pending[key] = [i]
+
+    if not pending:
+        return
+
+    if os.name == "posix":
+        # share the resource tracker with the workers, so that segments created in
+        # a worker and unlinked in this process are tracked once only
+        resource_tracker.ensure_running()
+
+    mark = "*" if NATIVE and is_native_tessellator_enabled() else "+"
+    executor = ProcessPoolExecutor(max_workers=workers)
+    futures = {}
+    received = set()
+    try:
+        for key, indices in pending.items():
+            job = (
+                serialize(tasks[indices[0]][0]),
+                tasks[indices[0]][2],
+                angular_tolerance,
+                compute_faces,
+                compute_edges,
+                weld_tolerance,
+            )
+            futures[executor.submit(_tessellate_remote, job)] = key
+
+        for future in as_completed(futures):
+            key = futures[future]
+            shared, cost = future.result()
+            mesh = _from_shared_memory(*shared)
+            received.add(future)
+            _cache_mesh(key, mesh, cost=cost)
+            if disk_key(*key) is not None:
+                disk_cache[key] = mesh
+
+            if progress is not None:
+                progress.update(mark)
+
+            for i in pending[key]:
+                yield i, mesh
+    finally:
+        # after an error or when the generator is closed early, the meshes of the
+        # finished but not received futures would leak their shared memory
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in futures:
+            if future in received or future.cancelled() or future.exception():
+                continue
+            _release_shared_memory(future.result()[0][0])
+
+
+def tessellate_parallel(
+    tasks,
+    deviation: float,
+    angular_tolerance: float,
+    compute_faces=True,
+    compute_edges=True,
+    workers=None,
+    progress=None,
+    weld_tolerance=None,
+):
+    """
+    Tessellate shapes in a process pool, see tessellate_parallel_iter.
+
+    @return: the meshes in the order of the tasks
+    """
+    meshes = [None] * len(tasks)
+    for i, mesh in tessellate_parallel_iter(
+        tasks,
+        deviation,
+        angular_tolerance,
+        compute_faces,
+        compute_edges,
+        workers,
+        progress,
+        weld_tolerance,
+    ):
+        meshes[i] = mesh
+    return meshes
 
 
 def discretize_edge(edge, deflection=0.1, num=None):
@@ -521,9 +825,13 @@ def discretize_edge(edge, deflection=0.1, num=None):
 def discretize_edges(edges, deflection=0.1, shape_id=""):
     d_edges = []
     segments_per_edge = []
-    vertices = []
     edge_types = []
 
+    # The vertices of every edge. A vertex shared by several edges is kept once per
+    # edge: get_vertices creates new objects for every edge and TopoDS objects
+    # compare by identity, so a "not in vertices" check never finds a duplicate
+    vertices = []
+
     trace = Trace(LOG_FILE)
 
     for ind, edge in enumerate(edges):
@@ -535,24 +843,30 @@ def discretize_edges(edges, deflection=0.1, shape_id=""):
             num = int((length(edge) / 2000) / deflection)
             d = discretize_edge(edge, deflection=deflection, num=num)
 
-        d_edges.extend(d.flatten())
+        d_edges.append(d.ravel())
         segments_per_edge.append(len(d))
 
-        for v in get_vertices(edge):
-            if v not in vertices:  # ignore duplicates
-                vertices.append(v)
+        vertices.extend(get_vertices(edge))
 
-    d_vertices = []
     for ind, v in enumerate(vertices):
         trace.vertex(f"{shape_id}/vertices/vertex{ind}", v)
-        d_vertices.extend(get_point(v))
+
+    d_vertices = np.fromiter(
+        chain.from_iterable(map(gp_Pnt.Coord, map(BRep_Tool.Pnt_s, vertices))),
+        dtype="float32",
+        count=3 * len(vertices),
+    )
 
     trace.close()
     return {
-        "edges": np.asarray(d_edges, dtype="float32"),
+        "edges": (
+            np.concatenate(d_edges).astype("float32")
+            if d_edges
+            else np.empty(0, dtype="float32")
+        ),
         "segments_per_edge": np.asarray(segments_per_edge, dtype="int32"),
         "edge_types": np.asarray(edge_types, dtype="int32"),
-        "obj_vertices": np.asarray(d_vertices, dtype="float32"),
+        "obj_vertices": d_vertices,
     }
 
 
@@ -1,4 +1,3 @@
-import base64
 import json
 import math
 import time
@@ -7,6 +6,9 @@ import warnings
 import numpy as np
 from webcolors import hex_to_rgb, name_to_rgb, rgb_to_hex
 
+from .buffer_codecs import encode_array
+from .profiler import NULL_SPAN, profiler, timeit_level
+
 
 def round_sig(x, sig):
     return round(x, sig - int(math.floor(math.log10(abs(x)))) - 1)
@@ -120,25 +122,46 @@ class Color:
 
 
 class Timer:
-    def __init__(self, timeit, name, activity, level=0, newline=False):
-        if isinstance(timeit, bool):
-            self.timeit = 99 if timeit else -1
-        else:
-            self.timeit = timeit
+    """
+    Time a section of code. The section is recorded as span by the profiler (if
+    enabled, or up to the timeit level during Profiler.run) and printed if
+    level <= timeit.
+
+    @param timeit: True (print all levels), False (print nothing) or the max level
+    @param name: The name of the object, e.g. the instance
+    @param activity: The activity, printed and used as span name
+    @param level: The nesting level of the activity
+    @param newline: Print an empty line first
+    @param span: The span name if it differs from the activity
+    """
+
+    def __init__(self, timeit, name, activity, level=0, newline=False, span=None):
+        self.timeit = timeit_level(timeit)
         self.activity = activity
         self.name = name
         self.level = level
         self.newline = newline
         self.info = ""
+        if profiler.records(level):
+            if span is None:
+                span = activity.strip().rstrip(":").strip()
+            self.span = profiler.span(span, name=name, level=level)
+        else:
+            self.span = NULL_SPAN
         self.start = time.time()
 
     def __enter__(self):
         if self.newline:
             print("", flush=True)
 
+        self.span.__enter__()
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
+        if self.info != "":
+            self.span.set(info=self.info)
+        self.span.__exit__(exc_type, exc_value, exc_traceback)
+
         if self.level <= self.timeit:
             prefix = ""
             if self.level > 0:
@@ -224,30 +247,51 @@ def flatten(nested_list):
 #
 
 
-def numpy_to_buffer_json(value):
-    def walk(obj):
+def numpy_to_buffer_json(value, codecs=None, compress=False, report=False):
+    """
+    Replace all numpy arrays in a nested structure of dicts and lists by base64
+    encoded buffers.
+
+    @param value: The nested structure, e.g. the shapes tree with meshed instances
+    @param codecs: dict of codec names by dict key, e.g. buffer_codecs.MESH_CODECS
+                   (None: send all arrays raw with codec "b64")
+    @param compress: Deflate (zlib) every buffer before base64 encoding
+    @param report: Additionally return the statistics of the encoding
+
+    @return: The encoded structure, with report=True a tuple of the encoded
+             structure and a dict with the raw and encoded sizes in bytes, the
+             compression ratio and the encode time in seconds
+    """
+    start = time.perf_counter()
+    stats = {"raw_bytes": 0, "encoded_bytes": 0}
+
+    def walk(obj, key=None):
         if isinstance(obj, np.ndarray):
-            if not obj.flags["C_CONTIGUOUS"]:
-                obj = np.ascontiguousarray(obj)
-
-            obj = obj.ravel()
-            return {
-                "shape": obj.shape,
-                "dtype": str(obj.dtype),
-                "buffer": base64.b64encode(memoryview(obj)).decode(),
-                "codec": "b64",
-            }
+            codec = "b64" if codecs is None else codecs.get(key, "b64")
+            encoded, size = encode_array(obj.ravel(), codec, compress)
+            stats["raw_bytes"] += obj.nbytes
+            stats["encoded_bytes"] += size
+            return encoded
         elif isinstance(obj, (tuple, list)):
-            return [walk(el) for el in obj]
+            return [walk(el, key) for el in obj]
         elif isinstance(obj, dict):
             rv = {}
             for k, v in obj.items():
-                rv[k] = walk(v)
+                rv[k] = walk(v, k)
             return rv
         else:
             return obj
 
-    return walk(value)
+    with profiler.span("serialize", codecs=codecs is not None, compress=compress):
+        result = walk(value)
+    if not report:
+        return result
+
+    stats["ratio"] = (
+        stats["raw_bytes"] / stats["encoded_bytes"] if stats["encoded_bytes"] else 1.0
+    )
+    stats["encode_time"] = time.perf_counter() - start
+    return result, stats
 
 
 def numpy_to_json(obj, indent=None):
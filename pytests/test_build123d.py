@@ -2,12 +2,14 @@
 import unittest
 
 import build123d as bd
+import numpy as np
 import pytest
 import webcolors
 from build123d import *
 
 from ocp_tessellate.convert import OcpConverter
 from ocp_tessellate.ocp_utils import *
+from ocp_tessellate.tessellator import discretize_edges
 
 
 class MyUnitTest(unittest.TestCase):
@@ -1128,3 +1130,46 @@ class TestMultipleObjects(MyUnitTest):
         self.assertEqual(o.name, "b2")
         self.assertEqual(o.color.web_color, "#0000ff")
         self.assertEqual(o.color.a, 0.4)
+
+
+def reference_vertices(edges):
+    # the vertices of discretize_edges, collected with a list search
+    vertices = []
+    for edge in edges:
+        for v in get_vertices(edge):
+            if v not in vertices:
+                vertices.append(v)
+    return [list(get_point(v)) for v in vertices]
+
+
+class TestDiscretizeEdges(MyUnitTest):
+    def test_shared_vertices(self):
+        w = Polyline((0, 0), (1, 0), (1, 1), (0, 1), close=True)
+        edges = list(get_edges(w.wrapped))
+        result = discretize_edges(edges)
+        self.assertEqual(result["segments_per_edge"].tolist(), [1, 1, 1, 1])
+        self.assertEqual(result["edges"].shape, (24,))
+        # the vertices shared by adjacent edges are kept for both edges
+        self.assertEqual(
+            result["obj_vertices"].reshape(-1, 3).tolist(),
+            [[0, 0, 0], [1, 0, 0], [1, 0, 0], [1, 1, 0]]
+            + [[1, 1, 0], [0, 1, 0], [0, 1, 0], [0, 0, 0]],
+        )
+
+    def test_reversed_and_shared_edges(self):
+        box = Box(1, 2, 3)
+        circle = Circle(1).edges()[0].wrapped
+        edges = list(get_edges(box.wrapped))
+        edges += [downcast(edges[0].Reversed()), edges[1], circle]
+        edges.append(downcast(circle.Reversed()))
+        # shared edges of the faces, with both orientations
+        for face in box.faces():
+            edges.extend(get_edges(face.wrapped))
+
+        vertices = discretize_edges(edges)["obj_vertices"].reshape(-1, 3)
+        np.testing.assert_allclose(vertices, reference_vertices(edges), atol=1e-6)
+
+    def test_empty(self):
+        result = discretize_edges([])
+        self.assertEqual(result["edges"].shape, (0,))
+        self.assertEqual(result["obj_vertices"].shape, (0,))
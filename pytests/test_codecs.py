@@ -0,0 +1,61 @@
+import unittest
+
+import numpy as np
+from build123d import *
+
+from ocp_tessellate.buffer_codecs import MESH_CODECS, decode_array, encode_array
+from ocp_tessellate.convert import tessellate_group, to_ocpgroup
+from ocp_tessellate.utils import numpy_to_buffer_json
+
+
+class TestCodecs(unittest.TestCase):
+    def setUp(self):
+        group, instances = to_ocpgroup(Sphere(10) - Cylinder(3, 30))
+        meshes, _, _ = tessellate_group(group, instances, {"render_edges": True})
+        self.mesh = meshes[0]
+
+    def test_raw(self):
+        encoded = numpy_to_buffer_json(self.mesh)
+        self.assertEqual(encoded["vertices"]["codec"], "b64")
+        np.testing.assert_array_equal(
+            decode_array(encoded["vertices"]), self.mesh["vertices"]
+        )
+
+    def test_mesh_codecs(self):
+        encoded, stats = numpy_to_buffer_json(
+            self.mesh, MESH_CODECS, compress=True, report=True
+        )
+        self.assertGreater(stats["ratio"], 3)
+        self.assertGreater(stats["encode_time"], 0)
+
+        vertices = self.mesh["vertices"].reshape(-1, 3)
+        extent = vertices.max(axis=0) - vertices.min(axis=0)
+        decoded = decode_array(encoded["vertices"]).reshape(-1, 3)
+        self.assertTrue(np.all(np.abs(decoded - vertices) <= extent / 65535))
+
+        decoded = decode_array(encoded["normals"])
+        np.testing.assert_allclose(decoded, self.mesh["normals"], atol=1e-4)
+
+        self.assertEqual(encoded["triangles"]["index_type"], "uint16")
+        decoded = decode_array(encoded["triangles"])
+        self.assertEqual(decoded.dtype, np.uint16)
+        np.testing.assert_array_equal(decoded, self.mesh["triangles"])
+
+        self.assertEqual(encoded["face_types"]["codec"], "b64")
+        self.assertEqual(encoded["face_types"]["compression"], "deflate")
+
+    def test_delta_varint(self):
+        indices = np.array([0, 1, 70000, 3, 2**31 - 1, 5], dtype=np.int32)
+        encoded, _ = encode_array(indices, "delta-varint")
+        self.assertEqual(encoded["index_type"], "uint32")
+        np.testing.assert_array_equal(decode_array(encoded), indices)
+
+    def test_oct16(self):
+        normals = np.array(
+            [[0, 0, 1], [0, 0, -1], [1, 0, 0], [-0.6, 0.0, -0.8], [0, 0, 0]],
+            dtype=np.float32,
+        )
+        encoded, _ = encode_array(normals.ravel(), "oct16")
+        decoded = decode_array(encoded).reshape(-1, 3)
+        np.testing.assert_allclose(decoded[:4], normals[:4], atol=1e-4)
+        np.testing.assert_allclose(decoded[4], [0, 0, 1])
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+from build123d import *
+
+from ocp_tessellate.convert import tessellate_group, to_ocpgroup
+from ocp_tessellate.disk_cache import DiskCache
+from ocp_tessellate.tessellator import cache
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.dc = DiskCache(tmpdir.name, 2 * 1024 * 1024)
+
+        cache.clear()
+        self.addCleanup(cache.clear)
+        g, i = to_ocpgroup(Box(1, 1, 1) - Box(2, 2, 0.2))
+        meshes, _, _ = tessellate_group(g, i)
+        self.mesh = meshes[0]
+
+    def test_disk_cache(self):
+        dc = self.dc
+        key = ("key", 0.1, 0.2, True, True)
+        dc[key] = self.mesh
+        self.assertTrue(key in dc)
+        mesh = dc.get(key)
+        for k in self.mesh:
+            self.assertEqual(mesh[k].dtype, self.mesh[k].dtype)
+            self.assertTrue(np.array_equal(mesh[k], self.mesh[k]))
+
+        # least recently used entries are evicted
+        dc.maxsize = dc.currsize
+        dc[("key2",)] = self.mesh
+        self.assertFalse(key in dc)
+        self.assertTrue(("key2",) in dc)
+
+    def test_running_size(self):
+        dc = self.dc
+        with patch.object(dc, "entries", wraps=dc.entries) as entries:
+            for n in range(20):
+                dc[("key", n)] = self.mesh
+            # one scan for the initial size, no scan per insert
+            self.assertEqual(entries.call_count, 1)
+        self.assertEqual(dc._size, dc.currsize)
+
+        # exceeding maxsize evicts down to the low watermark
+        dc.maxsize = dc.currsize
+        dc[("key", 20)] = self.mesh
+        self.assertLess(
+            dc.currsize, 0.9 * dc.maxsize + os.path.getsize(dc._path(("key", 20)))
+        )
+        self.assertTrue(("key", 20) in dc)
+        self.assertEqual(dc._size, dc.currsize)
+
+    def test_corrupt_entry(self):
+        dc = self.dc
+        for n, damage in enumerate(
+            (
+                lambda data: data[:40],  # truncated header
+                lambda data: data[:16] + b"x" + data[17:],  # invalid JSON
+                lambda data: data[: len(data) // 2],  # truncated arrays
+                lambda data: b"garbage!" + data[8:],  # wrong magic
+            )
+        ):
+            key = ("corrupt", n)
+            dc[key] = self.mesh
+            path = dc._path(key)
+            with open(path, "rb") as fd:
+                data = fd.read()
+            with open(path, "wb") as fd:
+                fd.write(damage(data))
+
+            # a corrupt entry is a miss and removed
+            self.assertIsNone(dc.get(key))
+            self.assertFalse(key in dc)
+
+            dc[key] = self.mesh
+            self.assertIsNotNone(dc.get(key))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import gc
+import unittest
+
+from build123d import *
+from OCP.TopoDS import TopoDS_Compound
+
+from ocp_tessellate.convert import (
+    OcpConverter,
+    _dispatch,
+    dispatch,
+    register_handler,
+)
+from ocp_tessellate.ocp_utils import (
+    compound_type_cache,
+    get_compound_type,
+    is_mixed_compound,
+    make_compound,
+    unroll_topods_compound,
+)
+
+
+class Gear:
+    """A user type that is not known to the converter"""
+
+    def __init__(self, teeth):
+        self.teeth = teeth
+
+
+class SpurGear(Gear):
+    pass
+
+
+class CountingIterable:
+    """An iterable without len that counts the items taken from it"""
+
+    def __init__(self, n):
+        self.n = n
+        self.taken = 0
+
+    def __iter__(self):
+        for i in range(self.n):
+            self.taken += 1
+            yield i
+
+
+class TestDispatch(unittest.TestCase):
+    def test_kinds(self):
+        box = Box(1, 1, 1)
+        self.assertEqual(dispatch(box)[0], "shapes")
+        self.assertEqual(dispatch(box.wrapped)[0], "shapes")
+        self.assertEqual(dispatch([box, box])[0], "list")
+        self.assertEqual(dispatch(ShapeList([box, box]))[0], "shape_list")
+        self.assertEqual(dispatch(ShapeList([box, box.solid()]))[0], "list")
+        self.assertEqual(dispatch({"a": box})[0], "dict")
+        self.assertEqual(dispatch([])[0], "empty")
+        self.assertEqual(dispatch(Compound([]))[0], "empty")
+        self.assertEqual(dispatch(Location())[0], "location_plane")
+        self.assertEqual(dispatch(Axis.X)[0], "axis")
+        self.assertEqual(dispatch(Vector(1, 2, 3))[0], "vector")
+        self.assertEqual(dispatch("text")[0], "skip")
+        self.assertEqual(dispatch(Gear(3))[0], "unknown")
+
+    def test_object_checks(self):
+        # same class, the kind depends on the object
+        mixed = Compound([Box(1, 1, 1), Circle(1)])
+        solids = Compound([Box(1, 1, 1), Sphere(1)])
+        self.assertEqual(dispatch(mixed)[0], "compound")
+        self.assertEqual(dispatch(solids)[0], "shapes")
+        self.assertEqual(dispatch(solids, unroll_compounds=True)[0], "compound")
+
+        assembly = Compound(label="a", children=[Box(1, 1, 1)])
+        self.assertEqual(dispatch(assembly)[0], "build123d_assembly")
+
+    def test_memoized(self):
+        _dispatch.clear()
+        for i in range(10):
+            dispatch(Box(i + 1, 1, 1))
+        self.assertEqual(len(_dispatch), 1)
+
+    def test_empty_iterable_not_materialized(self):
+        objs = CountingIterable(1000)
+        self.assertNotEqual(dispatch(objs)[0], "empty")
+        self.assertEqual(objs.taken, 1)
+
+        self.assertEqual(dispatch(CountingIterable(0))[0], "empty")
+
+    def test_register_handler(self):
+        def handle_gear(converter, cad_obj, name, color, alpha, level):
+            return converter.to_ocp(
+                Cylinder(cad_obj.teeth, 1),
+                names=[name or "Gear"],
+                colors=[color],
+                level=level + 1,
+            ).objects[0]
+
+        self.assertEqual(dispatch(SpurGear(3))[0], "unknown")
+
+        register_handler(Gear, handle_gear)
+        try:
+            self.assertEqual(dispatch(SpurGear(3))[0], "custom")
+            g = OcpConverter().to_ocp(SpurGear(3), Box(1, 1, 1), names=["g", "b"])
+            self.assertEqual([o.name for o in g.objects], ["g", "b"])
+            self.assertEqual(g.objects[0].kind, "solid")
+        finally:
+            register_handler(Gear, None)
+
+        self.assertEqual(dispatch(SpurGear(3))[0], "unknown")
+
+
+class TestCompoundType(unittest.TestCase):
+    def test_types(self):
+        box, circle = Box(1, 1, 1), Circle(1)
+        nested = make_compound([make_compound([box.wrapped]), box.solid().wrapped])
+        cases = [
+            (make_compound([]), None),
+            (box, "Solid"),
+            (circle, "Face"),
+            (nested, "Solid"),
+            (make_compound([nested, circle.wrapped]), "mixed"),
+            (Compound([box, Edge.make_line((0, 0), (1, 1))]), "mixed"),
+        ]
+        for compound, typ in cases:
+            self.assertEqual(get_compound_type(compound), typ)
+            topods = compound if isinstance(compound, TopoDS_Compound) else None
+            if topods is not None:
+                self.assertEqual(unroll_topods_compound(topods)[1], typ)
+        self.assertTrue(is_mixed_compound(make_compound([nested, circle.wrapped])))
+
+    def test_cached_per_tshape(self):
+        compound_type_cache.clear()
+        compound = Compound([Box(1, 1, 1), Sphere(1)])
+        self.assertEqual(get_compound_type(compound), "Solid")
+        self.assertEqual(len(compound_type_cache), 1)
+
+        # a located copy shares the TShape and the cache entry
+        moved = compound.wrapped.Moved(Location((5, 0, 0)).wrapped)
+        self.assertEqual(get_compound_type(moved), "Solid")
+        self.assertEqual(len(compound_type_cache), 1)
+
+        faces = Compound([Circle(1)])
+        self.assertEqual(get_compound_type(faces), "Face")
+        self.assertEqual(len(compound_type_cache), 2)
+
+        # the cache does not keep the compounds alive
+        del compound, moved, faces
+        gc.collect()
+        self.assertEqual(len(compound_type_cache), 0)
@@ -0,0 +1,89 @@
+import copy
+import unittest
+from unittest.mock import patch
+
+from build123d import *
+from OCP.BRep import BRep_Builder
+from OCP.BRepMesh import BRepMesh_IncrementalMesh
+from OCP.gp import gp_Pnt
+
+from ocp_tessellate import fingerprint
+from ocp_tessellate.fingerprint import clear_fingerprints, full_digest, shape_digest
+
+
+def bezier_face(height):
+    points = [
+        [Vector(x, y, height if x == y == 1 else 0) for x in range(3)] for y in range(3)
+    ]
+    return Face.make_bezier_surface(points)
+
+
+class TestFingerprint(unittest.TestCase):
+    def setUp(self):
+        clear_fingerprints()
+        self.addCleanup(clear_fingerprints)
+
+    def test_memo(self):
+        box = Box(1, 2, 3)
+        digest = shape_digest(box.wrapped)
+        self.assertEqual(digest, full_digest(box.wrapped))
+        self.assertEqual(digest, shape_digest(box.wrapped))
+
+        # moving the shape in place invalidates the memoized digest
+        box.location = Location((1, 0, 0))
+        self.assertNotEqual(digest, shape_digest(box.wrapped))
+        self.assertEqual(shape_digest(box.wrapped), full_digest(box.wrapped))
+
+    def test_geometry(self):
+        # same topology, vertices and parameter ranges, different surfaces
+        flat, bulged = bezier_face(1), bezier_face(4)
+        self.assertNotAlmostEqual(flat.area, bulged.area, 2)
+        self.assertNotEqual(shape_digest(flat.wrapped), shape_digest(bulged.wrapped))
+
+    def test_shared_tshape(self):
+        # shape objects with the same TShape and location share the memoized digest
+        box = Box(1, 2, 3)
+        digest = shape_digest(box.wrapped)
+        with patch.object(fingerprint, "serialize") as serialize:
+            self.assertEqual(
+                shape_digest(box.wrapped.Located(box.wrapped.Location())), digest
+            )
+            self.assertEqual(shape_digest(copy.copy(box).wrapped), digest)
+            serialize.assert_not_called()
+
+    def test_mutation(self):
+        # moving a vertex in place keeps the shape objects and TShapes
+        box = Box(1, 2, 3)
+        compound = Compound([box, Sphere(1)])
+        box_digest = shape_digest(box.wrapped)
+        compound_digest = shape_digest(compound.wrapped)
+
+        vertex = box.vertices()[0]
+        point = vertex.to_tuple()
+        BRep_Builder().UpdateVertex(
+            vertex.wrapped, gp_Pnt(point[0] + 0.5, point[1], point[2]), 1e-7
+        )
+
+        self.assertNotEqual(shape_digest(box.wrapped), box_digest)
+        self.assertEqual(shape_digest(box.wrapped), full_digest(box.wrapped))
+        # the vertex is shared, the compound is outdated, too
+        self.assertNotEqual(shape_digest(compound.wrapped), compound_digest)
+        self.assertEqual(shape_digest(compound.wrapped), full_digest(compound.wrapped))
+
+    def test_meshing(self):
+        # neither the triangulation nor the flags changed by meshing count
+        box, meshed = Box(1, 2, 3), Box(1, 2, 3)
+        digest = shape_digest(box.wrapped)
+        BRepMesh_IncrementalMesh(box.wrapped, 0.01)
+        BRepMesh_IncrementalMesh(meshed.wrapped, 0.01)
+        self.assertEqual(shape_digest(box.wrapped), digest)
+        self.assertEqual(shape_digest(meshed.wrapped), digest)
+        self.assertEqual(full_digest(meshed.wrapped), digest)
+
+        # nor does adding the shape to a compound
+        Compound([meshed])
+        self.assertEqual(full_digest(meshed.wrapped), digest)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import copy
+import json
+import struct
+import unittest
+
+import numpy as np
+from build123d import *
+
+from ocp_tessellate.convert import tessellate_group, to_ocpgroup
+from ocp_tessellate.gltf import export_glb
+
+
+def reference(obj, label, loc):
+    new_obj = copy.copy(obj)
+    new_obj.label = label
+    return new_obj.move(loc)
+
+
+def parse_glb(data):
+    magic, version, length = struct.unpack("<III", data[:12])
+    json_length, _ = struct.unpack("<II", data[12:20])
+    gltf = json.loads(data[20 : 20 + json_length])
+    bin_start = 20 + json_length + 8
+    return magic, version, length, gltf, data[bin_start:]
+
+
+def read_accessor(gltf, binary, index):
+    accessor = gltf["accessors"][index]
+    view = gltf["bufferViews"][accessor["bufferView"]]
+    dtype = np.float32 if accessor["componentType"] == 5126 else np.uint32
+    components = {"SCALAR": 1, "VEC3": 3, "VEC4": 4}[accessor["type"]]
+    start = view["byteOffset"]
+    array = np.frombuffer(binary[start : start + view["byteLength"]], dtype=dtype)
+    return array.reshape(accessor["count"], components)
+
+
+class TestGlb(unittest.TestCase):
+    def setUp(self):
+        b = Box(1, 2, 3)
+        boxes = [reference(b, f"b{i}", Pos(X=3 * i)) for i in range(4)]
+        row = Compound(children=boxes, label="row")
+        asm = Compound(children=[row, Sphere(1)], label="asm")
+        group, instances = to_ocpgroup(
+            asm, Line((0, 0), (5, 5)), names=["asm", "l"], colors=[None, "red"]
+        )
+        self.meshed, self.shapes, _ = tessellate_group(
+            group, instances, {"render_edges": True}
+        )
+
+    def test_nodes(self):
+        data = export_glb(self.meshed, self.shapes, y_up=False)
+        magic, version, length, gltf, binary = parse_glb(data)
+        self.assertEqual(magic, 0x46546C67)
+        self.assertEqual(version, 2)
+        self.assertEqual(length, len(data))
+        self.assertEqual(len(data) % 4, 0)
+
+        # the box is written once and referenced by four nodes
+        self.assertEqual(len(self.meshed), 2)
+        names = [node["name"] for node in gltf["nodes"]]
+        self.assertEqual(names[:3], ["Group", "asm", "row"])
+        box_nodes = [n for n in gltf["nodes"] if n["name"].startswith("b")]
+        self.assertEqual(len(box_nodes), 4)
+        self.assertEqual(len({n["mesh"] for n in box_nodes}), 1)
+        self.assertEqual(
+            [n["translation"][0] for n in box_nodes], [-0.5, 2.5, 5.5, 8.5]
+        )
+
+        mesh = gltf["meshes"][box_nodes[0]["mesh"]]
+        modes = [p["mode"] for p in mesh["primitives"]]
+        self.assertEqual(modes, [4, 1])
+
+        triangles = mesh["primitives"][0]
+        positions = read_accessor(gltf, binary, triangles["attributes"]["POSITION"])
+        indices = read_accessor(gltf, binary, triangles["indices"])
+        np.testing.assert_array_equal(
+            positions.ravel(), self.meshed[box_nodes[0]["mesh"]]["vertices"]
+        )
+        self.assertEqual(indices.max(), len(positions) - 1)
+
+        line = [n for n in gltf["nodes"] if n["name"] == "l"][0]
+        primitive = gltf["meshes"][line["mesh"]]["primitives"][0]
+        self.assertEqual(primitive["mode"], 1)
+        material = gltf["materials"][primitive["material"]]
+        self.assertEqual(
+            material["pbrMetallicRoughness"]["baseColorFactor"], [1.0, 0.0, 0.0, 1.0]
+        )
+
+    def test_instancing(self):
+        data = export_glb(self.meshed, self.shapes, instancing=True)
+        _, _, _, gltf, binary = parse_glb(data)
+        self.assertIn("EXT_mesh_gpu_instancing", gltf["extensionsRequired"])
+
+        instanced = [
+            n
+            for n in gltf["nodes"]
+            if "EXT_mesh_gpu_instancing" in n.get("extensions", {})
+        ]
+        self.assertEqual(len(instanced), 2)
+        counts = sorted(
+            gltf["accessors"][
+                n["extensions"]["EXT_mesh_gpu_instancing"]["attributes"]["TRANSLATION"]
+            ]["count"]
+            for n in instanced
+        )
+        self.assertEqual(counts, [1, 4])
+
+        box = [n for n in instanced if n["name"] == "b0"][0]
+        attributes = box["extensions"]["EXT_mesh_gpu_instancing"]["attributes"]
+        translations = read_accessor(gltf, binary, attributes["TRANSLATION"])
+        np.testing.assert_allclose(translations[:, 0], [-0.5, 2.5, 5.5, 8.5], atol=1e-6)
@@ -4,8 +4,15 @@ import unittest
 import build123d as bd
 from build123d import *
 
-from ocp_tessellate.convert import OcpConverter, tessellate_group
+from ocp_tessellate.convert import (
+    OcpConverter,
+    tessellate_group,
+    tessellate_group_iter,
+    to_ocpgroup,
+)
 from ocp_tessellate.ocp_utils import *
+from ocp_tessellate.session import TessellationSession
+from ocp_tessellate.tessellator import cache
 
 
 def reference(obj, label, loc=None):
@@ -48,6 +55,18 @@ class ProgressCache:
         self.run += 1
 
 
+class ProgressMarks:
+    def __init__(self, marks, test):
+        self.marks = marks
+        self.run = 0
+        self.test = test
+
+    def update(self, mark):
+        print(mark, end="", flush=True)
+        self.test.assertEqual(mark, self.marks[self.run])
+        self.run += 1
+
+
 class MyUnitTest(unittest.TestCase):
     def _assertTupleAlmostEquals(self, expected, actual, places, msg=None):
         for i, j in zip(actual, expected):
@@ -96,4 +115,123 @@ class TestInstances(MyUnitTest):
         )
         i = c.instances
         self.assertEqual(len(i), 4)
-        _ = tessellate_group(g, i, progress=ProgressCache(3, self))
+        # s and b are unchanged and hit the cache, only b2 needs to be tessellated
+        _ = tessellate_group(g, i, progress=ProgressMarks("cc+c", self))
+
+    def test_dedup(self):
+        self.addCleanup(cache.clear)
+        bolt = Cylinder(0.3, 3) + Pos(0, 0, 1.5) * Cylinder(0.5, 0.3)
+        # transformed copies have new TShapes with the same geometry
+        copies = [
+            Pos(3 * i, 0, 0) * bolt.transformed((10 * i, 0, 7 * i)) for i in range(4)
+        ]
+        others = [
+            bolt.mirror(Plane.XZ),  # mirrored, not a rigid transformation
+            Cylinder(0.3, 3.1) + Pos(0, 0, 1.5) * Cylinder(0.5, 0.3),
+        ]
+
+        g, i, stats = to_ocpgroup(copies + others, report=True)
+        self.assertEqual(len(i), 6)
+        self.assertEqual(stats["meshes_saved"], 0)
+
+        g, i, stats = to_ocpgroup(copies + others, dedup=True, report=True)
+        self.assertEqual(len(i), 3)
+        self.assertEqual(stats, {"occurrences": 6, "instances": 3, "meshes_saved": 3})
+        self.assertEqual([o.ref for o in g.objects], [0, 0, 0, 0, 1, 2])
+
+        # the instance at the location of an occurrence covers its shape
+        meshes, shapes, _ = tessellate_group(g, i)
+        for obj, part in zip(copies, shapes["parts"]):
+            m = loc_to_matrix(tq_to_loc(*part["loc"]))
+            v = np.asarray(meshes[part["shape"]["ref"]]["vertices"]).reshape(-1, 3)
+            v = v @ m[:3, :3].T + m[:3, 3]
+            bb = BoundingBox(obj.wrapped, optimal=True)
+            self._assertTupleAlmostEquals((bb.xmin, bb.ymin, bb.zmin), v.min(0), 2)
+            self._assertTupleAlmostEquals((bb.xmax, bb.ymax, bb.zmax), v.max(0), 2)
+
+    def test_iter(self):
+        self.addCleanup(cache.clear)
+        b = Box(1, 2, 3)
+        c = OcpConverter()
+        g = c.to_ocp(
+            Sphere(1), b, reference(b, label="b1", loc=Pos(X=3)), Cone(1, 0, 2)
+        )
+        i = c.instances
+        meshes, shapes, mapping = tessellate_group(g, i)
+
+        results = list(tessellate_group_iter(g, i))
+        self.assertEqual(len(results), len(i) + 1)
+        self.assertEqual(sorted(ref for ref, _ in results[:-1]), list(range(len(i))))
+        for ref, mesh in results[:-1]:
+            self.assertIs(mesh, meshes[ref])
+
+        ref, (shapes2, mapping2) = results[-1]
+        self.assertIsNone(ref)
+        self.assertEqual(shapes2["bb"], shapes["bb"])
+
+    def test_session(self):
+        self.addCleanup(cache.clear)
+        session = TessellationSession()
+        b = Box(1, 2, 3)
+        s = Sphere(1)
+
+        delta = session.update(b, s, names=["b", "s"])
+        self.assertEqual(set(delta["added"]), {"/Group/b", "/Group/s"})
+        self.assertEqual(delta["removed"], [])
+        self.assertEqual(delta["modified"], {})
+        self.assertEqual(delta["new_instances"], [0, 1])
+
+        delta = session.update(b, s, names=["b", "s"])
+        self.assertEqual(delta["added"], {})
+        self.assertEqual(delta["removed"], [])
+        self.assertEqual(delta["modified"], {})
+        self.assertEqual(delta["new_instances"], [])
+
+        c = Cone(1, 0, 2)
+        delta = session.update(b, reference(s, "s", Pos(X=3)), c, names=["b", "s", "c"])
+        self.assertEqual(set(delta["added"]), {"/Group/c"})
+        self.assertEqual(set(delta["modified"]), {"/Group/s"})
+        # the moved sphere reuses its mesh
+        self.assertEqual(delta["new_instances"], [2])
+
+        delta = session.update(b, c, names=["b", "c"], colors=["red", None])
+        self.assertEqual(delta["added"], {})
+        self.assertEqual(delta["removed"], ["/Group/s"])
+        self.assertEqual(set(delta["modified"]), {"/Group/b"})
+        self.assertEqual(delta["new_instances"], [])
+        self.assertEqual(len(session.known), 2)
+
+    def test_session_incremental(self):
+        self.addCleanup(cache.clear)
+        session = TessellationSession()
+        b = Box(1, 2, 3)
+        c = Cone(1, 0, 2)
+        objs = [b, {"s": Sphere(1), "l": Line((0, 0), (1, 1))}, c]
+
+        delta = session.update(*objs)
+        self.assertEqual(delta["converted"], [0, 1, 2])
+
+        # unchanged objects are neither converted nor collected again
+        delta = session.update(*objs)
+        self.assertEqual(delta["converted"], [])
+        self.assertEqual((delta["added"], delta["modified"]), ({}, {}))
+
+        # moving an object in place is detected
+        c.location = Location((5, 0, 0))
+        delta = session.update(*objs)
+        self.assertEqual(delta["converted"], [2])
+        self.assertEqual(set(delta["modified"]), {"/Group/Solid(2)"})
+        self.assertEqual(delta["new_instances"], [])
+
+        # the scene is the one of to_ocpgroup
+        g, i = to_ocpgroup(*objs)
+        meshes, shapes, _ = tessellate_group(g, i)
+        self.assertEqual(delta["shapes"]["bb"], shapes["bb"])
+        self.assertEqual(
+            [instance["cache_id"] for instance in session.instances],
+            [instance["cache_id"] for instance in i],
+        )
+        self.assertEqual(
+            [p["id"] for p in delta["shapes"]["parts"]],
+            [p["id"] for p in shapes["parts"]],
+        )
@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+from build123d import *
+
+from ocp_tessellate.convert import tessellate_group, to_ocpgroup
+from ocp_tessellate.mesh_cache import CostAwareCache, mesh_nbytes
+from ocp_tessellate.tessellator import cache
+
+
+def mesh():
+    return {"vertices": np.zeros(200, dtype=np.float32)}
+
+
+class TestMeshCache(unittest.TestCase):
+    def test_cost_aware_cache(self):
+        size = mesh_nbytes(mesh())
+        c = CostAwareCache(maxsize=3 * size)
+
+        c.set("cheap", mesh(), cost=0.01)
+        c.set("expensive", mesh(), cost=1.0)
+        c.set("medium", mesh(), cost=0.1)
+        self.assertEqual(c.currsize, 3 * size)
+
+        # the cheapest entry is evicted first, although it is not the oldest
+        c.set("new", mesh(), cost=0.5)
+        self.assertNotIn("cheap", c)
+        self.assertIn("expensive", c)
+
+        self.assertIsNotNone(c.lookup("expensive"))
+        self.assertIsNone(c.lookup("cheap"))
+        stats = c.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["entries"], 3)
+        self.assertEqual(stats["currsize"], 3 * size)
+        self.assertEqual(stats["time_saved"], 1.0)
+
+        c.clear()
+        self.assertEqual(c.stats()["evictions"], 1)
+        self.assertEqual(c.currsize, 0)
+
+    def test_oversized(self):
+        c = CostAwareCache(maxsize=mesh_nbytes(mesh()) - 1)
+        with self.assertRaises(ValueError):
+            c.set("big", mesh(), cost=1.0)
+        self.assertEqual(len(c), 0)
+
+    def test_cache_stats(self):
+        cache.clear()
+        cache.reset_stats()
+        self.addCleanup(cache.clear)
+        g, i = to_ocpgroup(Box(1, 1, 1) - Box(2, 2, 0.2))
+        tessellate_group(g, i)
+        tessellate_group(g, i)
+        stats = cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 1)
+        self.assertGreater(stats["time_saved"], 0)
+        self.assertEqual(stats["currsize"], mesh_nbytes(next(iter(cache.values()))))
+
+
+if __name__ == "__main__":
+    unittest.main()
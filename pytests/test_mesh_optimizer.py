@@ -0,0 +1,114 @@
+import unittest
+
+import numpy as np
+from build123d import *
+
+from ocp_tessellate.convert import tessellate_group, to_ocpgroup
+from ocp_tessellate.mesh_optimizer import (
+    cache_miss_ratio,
+    optimize_mesh,
+    optimize_stats,
+)
+from ocp_tessellate.tessellator import cache
+
+
+class TestMeshOptimizer(unittest.TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        g, i = to_ocpgroup(Sphere(10) - Cylinder(3, 30))
+        self.group, self.instances = g, i
+
+    def raw_mesh(self):
+        raw, _, _ = tessellate_group(self.group, self.instances)
+        return raw[0]
+
+    def test_optimize_mesh(self):
+        raw = self.raw_mesh()
+        self.assertEqual(len(cache), 1)
+        welded, _, _ = tessellate_group(
+            self.group, self.instances, {"weld_tolerance": 1e-5}
+        )
+        # the optimized mesh is cached next to the raw mesh
+        self.assertEqual(len(cache), 2)
+
+        welded = welded[0]
+        self.assertLess(len(welded["vertices"]), len(raw["vertices"]))
+        self.assertEqual(len(welded["normals"]), len(welded["vertices"]))
+        self.assertEqual(
+            welded["triangles_per_face"].tolist(), raw["triangles_per_face"].tolist()
+        )
+        self.assertEqual(len(welded["triangles"]), len(raw["triangles"]))
+        self.assertLess(
+            cache_miss_ratio(welded["triangles"]), cache_miss_ratio(raw["triangles"])
+        )
+
+        _, stats = optimize_mesh(raw, 1e-5)
+        self.assertEqual(3 * stats["vertices_after"], len(welded["vertices"]))
+        self.assertGreater(stats["bytes_saved"], 0)
+        self.assertTrue(stats["welded"])
+        self.assertTrue(stats["reordered"])
+
+    def test_report(self):
+        kwargs = {"weld_tolerance": 1e-5}
+        raw = self.raw_mesh()
+        self.assertIsNone(optimize_stats(raw))
+
+        welded, _, _, stats = tessellate_group(
+            self.group, self.instances, kwargs, report=True
+        )
+        self.assertEqual(stats["optimized"], 1)
+        self.assertEqual(stats["vertices_before"], len(raw["vertices"]) // 3)
+        self.assertEqual(stats["vertices_after"], len(welded[0]["vertices"]) // 3)
+        self.assertGreater(stats["bytes_saved"], 0)
+        self.assertEqual(
+            stats["bytes_saved"], stats["bytes_before"] - stats["bytes_after"]
+        )
+        self.assertEqual(optimize_stats(welded[0])["bytes_saved"], stats["bytes_saved"])
+
+        # the statistics are kept with the cached mesh
+        _, _, _, cached = tessellate_group(
+            self.group, self.instances, kwargs, report=True
+        )
+        self.assertEqual(cached, stats)
+
+        # without optimization, nothing is reported
+        _, _, _, stats = tessellate_group(self.group, self.instances, report=True)
+        self.assertEqual(stats["optimized"], 0)
+        self.assertEqual(stats["bytes_saved"], 0)
+
+    def test_mismatched_normals(self):
+        # normals that are not per vertex can't be welded, the vertices stay as is
+        raw = dict(self.raw_mesh())
+        raw["normals"] = np.asarray(raw["normals"])[:-3]
+        mesh, stats = optimize_mesh(raw, 1e-5)
+        self.assertFalse(stats["welded"])
+        self.assertTrue(stats["reordered"])
+        np.testing.assert_array_equal(mesh["vertices"], np.ravel(raw["vertices"]))
+        np.testing.assert_array_equal(mesh["normals"], raw["normals"])
+
+        # the triangles are only reordered
+        before = {tuple(t) for t in np.reshape(raw["triangles"], (-1, 3)).tolist()}
+        after = {tuple(t) for t in mesh["triangles"].reshape(-1, 3).tolist()}
+        self.assertEqual(before, after)
+
+    def test_no_normals(self):
+        raw = dict(self.raw_mesh())
+        raw["normals"] = np.empty(0, dtype=np.float32)
+        mesh, stats = optimize_mesh(raw, 1e-5)
+        self.assertTrue(stats["welded"])
+        self.assertLess(len(mesh["vertices"]), len(np.ravel(raw["vertices"])))
+        self.assertEqual(len(mesh["normals"]), 0)
+
+    def test_max_reorder(self):
+        raw = self.raw_mesh()
+        num_triangles = len(raw["triangles"]) // 3
+        mesh, stats = optimize_mesh(raw, 1e-5, max_reorder=num_triangles - 1)
+        self.assertTrue(stats["welded"])
+        self.assertFalse(stats["reordered"])
+        self.assertLess(len(mesh["vertices"]), len(np.ravel(raw["vertices"])))
+        self.assertEqual(len(mesh["triangles"]), len(np.ravel(raw["triangles"])))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+import copy
+import unittest
+
+import numpy as np
+from build123d import *
+
+from ocp_tessellate.convert import tessellate_group, to_ocpgroup
+from ocp_tessellate.ocp_utils import loc_to_tq
+from ocp_tessellate.packed import (
+    DEFAULT_WIDTH,
+    EDGES,
+    MESH,
+    VERTICES,
+    geometry,
+    pack_scene,
+    tq_to_matrices,
+)
+from ocp_tessellate.utils import numpy_to_buffer_json
+
+
+def reference(obj, label, loc):
+    new_obj = copy.copy(obj)
+    new_obj.label = label
+    return new_obj.move(loc)
+
+
+def leaves(shapes, matrix=np.identity(4)):
+    # recursive reference for the occurrence table
+    t, q = shapes["loc"] if shapes.get("loc") is not None else ((0, 0, 0), (0, 0, 0, 1))
+    matrix = matrix @ tq_to_matrices(np.array([t]), np.array([q]))[0]
+    if shapes.get("parts") is None:
+        return [(shapes, matrix)]
+    return [leaf for part in shapes["parts"] for leaf in leaves(part, matrix)]
+
+
+def count_arrays(obj):
+    if isinstance(obj, np.ndarray):
+        return 1
+    if isinstance(obj, (list, tuple)):
+        return sum(count_arrays(el) for el in obj)
+    if isinstance(obj, dict):
+        return sum(count_arrays(el) for el in obj.values())
+    return 0
+
+
+class TestPacked(unittest.TestCase):
+    def setUp(self):
+        b = Box(1, 2, 3)
+        boxes = [reference(b, f"b{i}", Pos(X=3 * i) * Rot(Z=30 * i)) for i in range(4)]
+        row = Compound(children=boxes, label="row")
+        asm = Compound(children=[row, Sphere(1)], label="asm").move(Pos(Z=5))
+        group, instances = to_ocpgroup(
+            asm,
+            Line((0, 0), (5, 5)),
+            Vertex(1, 2, 3),
+            names=["asm", "l", "v"],
+            colors=[None, "red", "blue"],
+        )
+        self.meshed, self.shapes, _ = tessellate_group(
+            group, instances, {"render_edges": True}
+        )
+        self.scene = pack_scene(self.meshed, self.shapes)
+
+    def test_geometries(self):
+        kinds = self.scene["geometries"]["kind"]
+        self.assertEqual(list(kinds), [MESH, MESH, EDGES, VERTICES])
+
+        # every mesh round trips through the packed buffers
+        for i, mesh in enumerate(self.meshed):
+            packed = geometry(self.scene, i)
+            for key in ("vertices", "normals", "triangles", "edges"):
+                np.testing.assert_array_equal(packed[key], np.ravel(mesh[key]))
+
+        # the buffers are views, not copies
+        self.assertTrue(
+            np.shares_memory(
+                geometry(self.scene, 1)["vertices"], self.scene["buffers"]["vertices"]
+            )
+        )
+
+    def test_occurrences(self):
+        occurrences = self.scene["occurrences"]
+        expected = leaves(self.shapes)
+        self.assertEqual(occurrences["id"], [leaf["id"] for leaf, _ in expected])
+        self.assertEqual(len(occurrences["ref"]), 7)
+
+        # the four boxes share one geometry
+        self.assertEqual(list(occurrences["ref"]), [0, 0, 0, 0, 1, 2, 3])
+
+        for i, (leaf, matrix) in enumerate(expected):
+            np.testing.assert_allclose(occurrences["transform"][i], matrix, atol=1e-6)
+
+        # the transforms place the box vertices like the located shapes
+        vertices = geometry(self.scene, 0)["vertices"].reshape(-1, 3)
+        placed = vertices @ occurrences["transform"][3][:3, :3].T
+        placed += occurrences["transform"][3][:3, 3]
+        np.testing.assert_allclose(placed.mean(axis=0), (9, 0, 5), atol=1e-5)
+
+        np.testing.assert_allclose(occurrences["color"][5], (1, 0, 0, 1))
+        np.testing.assert_allclose(occurrences["color"][6], (0, 0, 1, 1))
+        self.assertEqual(occurrences["state"].shape, (7, 2))
+
+    def test_edge_colors(self):
+        group, instances = to_ocpgroup(
+            Polyline((0, 0), (1, 0), (1, 1), (0, 1)), names=["p"], colors=["red"]
+        )
+        meshed, shapes, _ = tessellate_group(group, instances, {})
+        part = shapes["parts"][0]
+        part["color"] = ["#ff0000", "#00ff00", "#0000ff"]
+        part["width"] = None
+        scene = pack_scene(meshed, shapes)
+
+        # one RGBA color per edge, the occurrence gets the first one
+        colors = geometry(scene, 0)["colors"].reshape(-1, 4)
+        np.testing.assert_allclose(colors[:, :3], np.identity(3))
+        np.testing.assert_allclose(scene["occurrences"]["color"][0], (1, 0, 0, 1))
+
+        # a missing line width falls back to the default, not NaN
+        self.assertEqual(scene["occurrences"]["width"][0], DEFAULT_WIDTH)
+
+        # single colored parts have no colors
+        self.assertNotIn("colors", geometry(self.scene, 2))
+
+    def test_buffers(self):
+        data = {"instances": self.meshed, "shapes": self.shapes}
+        self.assertLess(count_arrays(self.scene), count_arrays(data))
+        self.assertEqual(len(self.scene["buffers"]), 10)
+        self.assertEqual(count_arrays(self.scene), 19)
+
+        # the packed scene serializes like the nested result
+        _, stats = numpy_to_buffer_json(self.scene, report=True)
+        self.assertGreater(stats["encoded_bytes"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
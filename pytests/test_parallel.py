@@ -0,0 +1,80 @@
+import os
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+from build123d import *
+
+from ocp_tessellate import tessellator
+from ocp_tessellate.convert import tessellate_group, to_ocpgroup
+from ocp_tessellate.mesh_cache import CostAwareCache
+from ocp_tessellate.tessellator import cache, tessellate_parallel_iter
+
+
+def shared_memory_blocks():
+    if not os.path.isdir("/dev/shm"):
+        return None
+    return set(os.listdir("/dev/shm"))
+
+
+class Marks:
+    def __init__(self):
+        self.marks = []
+
+    def update(self, mark):
+        self.marks.append(mark)
+
+
+class TestParallel(unittest.TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        with BuildPart() as bp:
+            Box(1, 1, 1)
+        self.objs = (bp, Box(1, 1, 1) - Box(2, 2, 0.2), Solid.make_cone(2, 1, 2))
+
+    def test_parallel(self):
+        g, i = to_ocpgroup(*self.objs)
+        seq, _, _ = tessellate_group(g, i)
+        cache.clear()
+        progress = Marks()
+        par, _, _ = tessellate_group(g, i, progress=progress, workers=2)
+        self.assertTrue(all(mark in "+*" for mark in progress.marks))
+        self.assertEqual(len(cache), len(i))
+        for m1, m2 in zip(seq, par):
+            self.assertEqual(m1.keys(), m2.keys())
+            for k in m1:
+                self.assertEqual(m1[k].dtype, m2[k].dtype)
+                self.assertTrue(np.allclose(m1[k], m2[k], atol=1e-5))
+
+        # the second run is served from the cache
+        progress = Marks()
+        tessellate_group(g, i, progress=progress, workers=2)
+        self.assertEqual(set(progress.marks), {"c"})
+
+    def test_oversized_mesh(self):
+        # a mesh larger than the cache is returned, but not cached
+        blocks = shared_memory_blocks()
+        g, i = to_ocpgroup(*self.objs)
+        with patch.object(tessellator, "cache", CostAwareCache(maxsize=1)):
+            par, _, _ = tessellate_group(g, i, workers=2)
+            self.assertEqual(len(tessellator.cache), 0)
+        self.assertEqual(len(par), len(i))
+        self.assertTrue(all(len(mesh["triangles"]) > 0 for mesh in par))
+        if blocks is not None:
+            self.assertEqual(shared_memory_blocks() - blocks, set())
+
+    def test_close_early(self):
+        # the meshes that were not received release their shared memory
+        blocks = shared_memory_blocks()
+        shapes = [Box(1, 1, 1), Sphere(1), Solid.make_cone(2, 1, 2), Torus(3, 1)]
+        tasks = [(shape.wrapped, f"close_{n}", 0.1) for n, shape in enumerate(shapes)]
+        meshes = tessellate_parallel_iter(tasks, 0.1, 0.2, workers=2)
+        next(meshes)
+        meshes.close()
+        if blocks is not None:
+            self.assertEqual(shared_memory_blocks() - blocks, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
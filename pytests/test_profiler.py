@@ -0,0 +1,90 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+
+from build123d import *
+
+from ocp_tessellate.convert import tessellate_group, to_ocpgroup
+from ocp_tessellate.profiler import NULL_SPAN, Profiler, profiler
+from ocp_tessellate.tessellator import cache
+
+
+class TestProfiler(unittest.TestCase):
+    def test_profiler(self):
+        p = Profiler()
+        self.assertIs(p.span("mesh"), NULL_SPAN)
+
+        p.enable()
+        with p.span("tessellate", objects=2):
+            with p.span("mesh", name="a") as span:
+                span.set(triangles=12)
+            with p.span("mesh", name="b"):
+                pass
+        agg = p.aggregate()
+        self.assertEqual(agg["mesh"]["count"], 2)
+        self.assertEqual(agg["tessellate"]["count"], 1)
+        self.assertAlmostEqual(
+            agg["tessellate"]["self"] + agg["mesh"]["total"],
+            agg["tessellate"]["total"],
+        )
+        self.assertTrue(p.summary().startswith("span"))
+
+        events = p.to_chrome_trace()["traceEvents"]
+        self.assertEqual([e["name"] for e in events], ["mesh", "mesh", "tessellate"])
+        self.assertEqual(events[0]["args"], {"name": "a", "triangles": 12})
+        self.assertTrue(all(e["ph"] == "X" for e in events))
+
+    def test_profiler_tessellate(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(profiler.clear)
+        self.addCleanup(profiler.disable)
+        profiler.clear()
+        profiler.enable()
+        g, i = to_ocpgroup(Box(1, 1, 1) - Box(2, 2, 0.2))
+        tessellate_group(g, i)
+        names = set(profiler.aggregate())
+        self.assertTrue({"convert", "tessellate_group", "mesh"} <= names)
+
+    def test_timeit(self):
+        # timeit records the spans of the call up to its level
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(profiler.clear)
+        profiler.clear()
+        g, i = to_ocpgroup(Box(1, 1, 1) - Box(2, 2, 0.2))
+
+        with redirect_stdout(io.StringIO()):
+            tessellate_group(g, i, timeit=1)
+        self.assertFalse(profiler.enabled)
+        names = set(profiler.aggregate())
+        self.assertIn("tessellate_group", names)
+        self.assertNotIn("mesh", names)  # a level 2 timer
+
+        # every call replaces the spans of the previous one
+        with redirect_stdout(io.StringIO()) as out:
+            tessellate_group(g, i, timeit=True)
+        self.assertIn("tessellate:", out.getvalue())
+        aggregate = profiler.aggregate()
+        self.assertEqual(aggregate["tessellate_group"]["count"], 1)
+        self.assertEqual(aggregate["mesh"]["count"], 1)
+
+        # without timeit nothing is recorded
+        tessellate_group(g, i)
+        self.assertEqual(profiler.aggregate(), aggregate)
+
+        # an enabled profiler keeps collecting all levels
+        profiler.clear()
+        profiler.enable()
+        self.addCleanup(profiler.disable)
+        with redirect_stdout(io.StringIO()):
+            tessellate_group(g, i, timeit=1)
+        tessellate_group(g, i)
+        self.assertTrue(profiler.enabled)
+        aggregate = profiler.aggregate()
+        self.assertEqual(aggregate["tessellate_group"]["count"], 2)
+        self.assertEqual(aggregate["mesh"]["count"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,457 @@
+# %%
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import cadquery as cq
+from OCP.STEPCAFControl import STEPCAFControl_Writer
+from OCP.STEPControl import STEPControl_AsIs
+from OCP.TCollection import TCollection_ExtendedString
+from OCP.TDataStd import TDataStd_Name
+from OCP.Quantity import Quantity_ColorRGBA
+from OCP.TDocStd import TDocStd_Document
+from OCP.TopAbs import TopAbs_FACE
+from OCP.TopExp import TopExp_Explorer
+from OCP.XCAFDoc import (
+    XCAFDoc_ColorCurv,
+    XCAFDoc_ColorGen,
+    XCAFDoc_ColorSurf,
+    XCAFDoc_DocumentTool,
+)
+
+from ocp_tessellate import stepreader
+from ocp_tessellate.convert import to_ocpgroup
+from ocp_tessellate.stepreader import StepReader, _read_step_remote, unique_names
+
+
+def write_shared_step(filename, n):
+    """A STEP file with n references to a screw and 3 to a compound of 2 solids"""
+    doc = TDocStd_Document(TCollection_ExtendedString("XmlOcaf"))
+    shape_tool = XCAFDoc_DocumentTool.ShapeTool_s(doc.Main())
+
+    screw = cq.Workplane().box(1, 1, 1).union(cq.Workplane().cylinder(3, 0.3))
+    pair = cq.Compound.makeCompound(
+        [
+            cq.Solid.makeBox(1, 1, 1),
+            cq.Solid.makeSphere(0.5).moved(cq.Location((3, 0, 0))),
+        ]
+    )
+    top = shape_tool.NewShape()
+    TDataStd_Name.Set_s(top, TCollection_ExtendedString("top"))
+    for name, shape, count in (("screw", screw.val(), n), ("pair", pair, 3)):
+        label = shape_tool.AddShape(shape.wrapped, False, False)
+        TDataStd_Name.Set_s(label, TCollection_ExtendedString(name))
+        for i in range(count):
+            loc = cq.Location((2 * i, 5 if name == "pair" else 0, 0))
+            shape_tool.AddComponent(top, label, loc.wrapped)
+    shape_tool.UpdateAssemblies()
+
+    writer = STEPCAFControl_Writer()
+    writer.SetNameMode(True)
+    writer.Transfer(doc, STEPControl_AsIs)
+    writer.Write(filename)
+
+
+def walk(objs):
+    for obj in objs:
+        yield obj
+        if obj["shapes"] is not None:
+            yield from walk(obj["shapes"])
+
+
+def write_face_colored_step(filename, n):
+    """A STEP file with n parts with colored faces, every second with a part color"""
+    doc = TDocStd_Document(TCollection_ExtendedString("XmlOcaf"))
+    shape_tool = XCAFDoc_DocumentTool.ShapeTool_s(doc.Main())
+    color_tool = XCAFDoc_DocumentTool.ColorTool_s(doc.Main())
+    red, green, blue = [
+        Quantity_ColorRGBA(*c, 1) for c in ((1, 0, 0), (0, 1, 0), (0, 0, 1))
+    ]
+
+    top = shape_tool.NewShape()
+    for i in range(n):
+        shape = cq.Solid.makeBox(1, 1, 1).fuse(cq.Solid.makeSphere(0.3))
+        label = shape_tool.AddShape(shape.wrapped, False, False)
+        for j, face in enumerate(shape.Faces()):
+            face_label = shape_tool.AddSubShape(label, face.wrapped)
+            color = red if i % 3 == 0 or j % 2 == 0 else green
+            color_tool.SetColor(face_label, color, XCAFDoc_ColorSurf)
+        if i % 2 == 1:
+            color_tool.SetColor(label, blue, XCAFDoc_ColorGen)
+        shape_tool.AddComponent(top, label, cq.Location((2 * i, 0, 0)).wrapped)
+    shape_tool.UpdateAssemblies()
+
+    writer = STEPCAFControl_Writer()
+    writer.SetColorMode(True)
+    writer.Transfer(doc, STEPControl_AsIs)
+    writer.Write(filename)
+
+
+class TestStepReaderCache(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.step = os.path.join(tmpdir.name, "assembly.step")
+        self.cache_name = os.path.join(tmpdir.name, "assembly")
+
+        a = cq.Assembly(name="top")
+        for i in range(3):
+            a.add(
+                cq.Workplane().box(1, 1, 1),
+                name=f"box{i}",
+                loc=cq.Location((2 * i, 0, 0)),
+                color=cq.Color("red"),
+            )
+        a.add(cq.Workplane().sphere(1), name="sphere", color=cq.Color(0, 0, 1, 0.5))
+        a.save(self.step)
+
+    def test_roundtrip(self):
+        reader = StepReader()
+        reader.load(self.step, cache_name=self.cache_name)
+        self.assertTrue(os.path.exists(f"{self.cache_name}.jq"))
+
+        cached = StepReader()
+        self.assertTrue(cached.load_assembly(f"{self.cache_name}.jq", self.step))
+
+        expected = list(walk(reader.assemblies))
+        actual = list(walk(cached.assemblies))
+        self.assertEqual(len(expected), len(actual))
+        for e, a in zip(expected, actual):
+            self.assertEqual(e["name"], a["name"])
+            self.assertEqual(e["color"], a["color"])
+            self.assertTrue(
+                e["loc"]
+                .Transformation()
+                .TranslationPart()
+                .IsEqual(a["loc"].Transformation().TranslationPart(), 1e-9)
+            )
+            if e["shape"] is None:
+                self.assertIsNone(a["shape"])
+            else:
+                self.assertEqual(e["shape"].ShapeType(), a["shape"].ShapeType())
+
+        cached.to_cadquery()
+
+    def test_lazy_shapes(self):
+        StepReader().load(self.step, cache_name=self.cache_name)
+        cached = StepReader()
+        cached.load_assembly(f"{self.cache_name}.jq", self.step)
+        leaf = [o for o in walk(cached.assemblies) if o["shapes"] is None][0]
+        self.assertIsNone(dict.get(leaf, "shape"))
+        shape = leaf["shape"]
+        self.assertIsNotNone(shape)
+        self.assertIs(leaf["shape"], shape)
+
+    def test_invalidation(self):
+        StepReader().load(self.step, cache_name=self.cache_name)
+        cache_filename = f"{self.cache_name}.jq"
+
+        # touched, but same content
+        stat = os.stat(self.step)
+        os.utime(self.step, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        self.assertTrue(StepReader().load_assembly(cache_filename, self.step))
+
+        # changed content
+        with open(self.step, "a") as fd:
+            fd.write("\n")
+        self.assertFalse(StepReader().load_assembly(cache_filename, self.step))
+
+        reader = StepReader()
+        reader.load(self.step, cache_name=self.cache_name)
+        self.assertTrue(StepReader().load_assembly(cache_filename, self.step))
+
+    def test_refresh_mtime(self):
+        reader = StepReader()
+        reader.load(self.step, cache_name=self.cache_name)
+        cache_filename = f"{self.cache_name}.jq"
+
+        stat = os.stat(self.step)
+        os.utime(self.step, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        with patch.object(stepreader, "file_hash", wraps=stepreader.file_hash) as fh:
+            self.assertTrue(StepReader().load_assembly(cache_filename, self.step))
+            self.assertEqual(fh.call_count, 1)
+
+            # the matching hash updated the mtime, so the file is not hashed again
+            cached = StepReader()
+            self.assertTrue(cached.load_assembly(cache_filename, self.step))
+            self.assertEqual(fh.call_count, 1)
+        self.assertEqual(
+            len(list(walk(cached.assemblies))), len(list(walk(reader.assemblies)))
+        )
+        leaf = [o for o in walk(cached.assemblies) if o["shapes"] is None][0]
+        self.assertIsNotNone(leaf["shape"])
+
+    def test_options(self):
+        StepReader().load(self.step, cache_name=self.cache_name)
+        cache_filename = f"{self.cache_name}.jq"
+
+        # the tree depends on the reader options, other options miss the cache
+        for options in (
+            {"use_colors": False},
+            {"analyse_faces": False},
+            {"split_compounds": False},
+        ):
+            reader = StepReader(**options)
+            self.assertFalse(reader.load_assembly(cache_filename, self.step))
+        self.assertTrue(StepReader(lazy=True).load_assembly(cache_filename, self.step))
+
+        reader = StepReader(use_colors=False)
+        reader.load(self.step, cache_name=self.cache_name)
+        colors = {o["color"] for o in walk(reader.assemblies) if o["shapes"] is None}
+        self.assertEqual(colors, {stepreader.DEFAULT_COLOR})
+
+        cached = StepReader(use_colors=False)
+        self.assertTrue(cached.load_assembly(cache_filename, self.step))
+        self.assertEqual(
+            [o["color"] for o in walk(cached.assemblies)],
+            [o["color"] for o in walk(reader.assemblies)],
+        )
+        self.assertFalse(StepReader().load_assembly(cache_filename, self.step))
+
+    def test_corrupt_cache(self):
+        original = StepReader()
+        original.load(self.step, cache_name=self.cache_name)
+        count = len(list(walk(original.assemblies)))
+        cache_filename = f"{self.cache_name}.jq"
+        with open(cache_filename, "rb") as fd:
+            data = fd.read()
+        size = int.from_bytes(data[8:16], "little")
+
+        damaged = [
+            data[:12],  # truncated size
+            data[: 16 + size // 2],  # truncated header
+            data[:16] + b"x" + data[17:],  # invalid JSON
+            data[:8] + (1 << 40).to_bytes(8, "little") + data[16:],  # huge size
+            data[: len(data) - 10],  # truncated blobs
+            data[:16] + b"[]" + b" " * (size - 2) + data[16 + size :],  # no dict
+        ]
+        for content in damaged:
+            with open(cache_filename, "wb") as fd:
+                fd.write(content)
+            self.assertFalse(StepReader().load_assembly(cache_filename, self.step))
+
+            # loading falls back to parsing the STEP file and rewrites the cache
+            reader = StepReader()
+            reader.load(self.step, cache_name=self.cache_name)
+            self.assertEqual(len(list(walk(reader.assemblies))), count)
+            self.assertTrue(StepReader().load_assembly(cache_filename, self.step))
+
+
+class TestStepReaderPrototypes(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.step = os.path.join(tmpdir.name, "shared.step")
+        write_shared_step(self.step, 20)
+
+    def test_prototypes(self):
+        reader = StepReader()
+        reader.load(self.step)
+        self.assertEqual(len(reader.prototypes), 3)
+
+        occurrences = reader.assemblies[0]["shapes"]
+        self.assertEqual(len(occurrences), 23)
+        screws = [o for o in occurrences if o["name"] == "screw"]
+        self.assertEqual(len({o["prototype"] for o in screws}), 1)
+        self.assertTrue(all(o["shape"] is screws[0]["shape"] for o in screws))
+        self.assertEqual(
+            [o["loc"].Transformation().TranslationPart().X() for o in screws[:3]],
+            [0, 2, 4],
+        )
+
+    def test_one_instance_per_prototype(self):
+        reader = StepReader()
+        reader.load(self.step)
+        for assembly in (reader.to_cadquery(share_shapes=True), reader.to_build123d()):
+            _, instances = to_ocpgroup(assembly)
+            self.assertEqual(len(instances), 2)
+
+    def test_cadquery_workplanes(self):
+        # by default every occurrence is a new Workplane
+        reader = StepReader()
+        reader.load(self.step)
+        assembly = reader.to_cadquery()
+        leaves = [a.obj for _, a in assembly.traverse() if a.obj is not None]
+        self.assertEqual(len(leaves), 23)
+        self.assertTrue(all(isinstance(leaf, cq.Workplane) for leaf in leaves))
+        self.assertEqual(len({id(leaf) for leaf in leaves}), 23)
+
+        # with shared shapes the occurrences of a prototype share one cadquery Shape
+        assembly = reader.to_cadquery(share_shapes=True)
+        leaves = [a.obj for _, a in assembly.traverse() if a.obj is not None]
+        self.assertTrue(all(isinstance(leaf, cq.Shape) for leaf in leaves))
+        self.assertEqual(len({id(leaf) for leaf in leaves}), 2)
+
+
+class TestStepReaderColors(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.step = os.path.join(tmpdir.name, "faces.step")
+        write_face_colored_step(self.step, 6)
+
+    def test_color_index(self):
+        reader = StepReader()
+        reader.load(self.step)
+        self.assertGreater(reader.timings["color_index"], 0)
+        self.assertGreater(reader.timings["color_analysis"], 0)
+
+        def query(shape):
+            col = Quantity_ColorRGBA()
+            for typ in (XCAFDoc_ColorGen, XCAFDoc_ColorSurf, XCAFDoc_ColorCurv):
+                if reader.color_tool.GetColor(shape, typ, col):
+                    rgb = col.GetRGB()
+                    return (rgb.Red(), rgb.Green(), rgb.Blue(), col.Alpha())
+            return None
+
+        count = 0
+        for obj in walk(reader.assemblies):
+            if obj["shape"] is None:
+                continue
+            shape = obj["shape"]
+            self.assertEqual(reader._lookup_color(shape), query(shape))
+            exp = TopExp_Explorer(shape, TopAbs_FACE)
+            while exp.More():
+                self.assertEqual(
+                    reader._lookup_color(exp.Current()), query(exp.Current())
+                )
+                count += 1
+                exp.Next()
+        self.assertGreater(count, 0)
+
+        colors = [o["color"] for o in reader.assemblies[0]["shapes"]]
+        self.assertEqual(colors[0], (1.0, 0.0, 0.0, 1.0))  # all faces red
+        self.assertEqual(colors[1], (0.0, 0.0, 1.0, 1.0))  # mixed faces, part color
+
+
+class TestStepReaderLazy(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.step = os.path.join(tmpdir.name, "faces.step")
+        write_face_colored_step(self.step, 6)
+
+    def test_lazy_index(self):
+        reader = StepReader(lazy=True)
+        reader.load(self.step)
+        self.assertEqual(len(reader._unresolved), 6)
+        self.assertEqual(reader.timings["color_index"], 0.0)
+
+        top = reader.assemblies[0]
+        self.assertEqual(top["child_count"], 6)
+        parts = top["shapes"]
+        self.assertEqual(
+            [o["loc"].Transformation().TranslationPart().X() for o in parts],
+            [0, 2, 4, 6, 8, 10],
+        )
+        self.assertFalse(any(part.resolved for part in parts))
+        self.assertEqual(len(reader._unresolved), 6)
+
+        # resolving one occurrence resolves its prototype only
+        self.assertIsNotNone(parts[2]["shape"])
+        self.assertTrue(parts[2].resolved)
+        self.assertEqual(len(reader._unresolved), 5)
+
+    def test_lazy_equals_eager(self):
+        eager = StepReader()
+        eager.load(self.step)
+        lazy = StepReader(lazy=True)
+        lazy.load(self.step)
+
+        expected = [(o["name"], o["color"]) for o in walk(eager.assemblies)]
+        actual = [(o["name"], o["color"]) for o in walk(lazy.assemblies)]
+        self.assertEqual(expected, actual)
+
+    def test_lazy_path(self):
+        reader = StepReader(lazy=True)
+        reader.load(self.step)
+        name, _ = list(unique_names(reader.assemblies[0]["shapes"]))[3]
+
+        shape = reader.subtree_to_cadquery(name)
+        self.assertIsInstance(shape, cq.Shape)
+        self.assertEqual(len(reader._unresolved), 5)
+
+        with self.assertRaises(KeyError):
+            reader.subtree_to_cadquery("unknown")
+
+
+def read_step_or_crash(args):
+    # worker function that kills its process for files named crash*.step
+    if os.path.basename(args[0]).startswith("crash"):
+        os._exit(1)
+    return _read_step_remote(args)
+
+
+class TestStepReaderBatch(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.shared = os.path.join(tmpdir.name, "shared.step")
+        write_shared_step(self.shared, 4)
+        self.faces = os.path.join(tmpdir.name, "faces.step")
+        write_face_colored_step(self.faces, 3)
+        self.broken = os.path.join(tmpdir.name, "broken.step")
+        with open(self.broken, "w") as fd:
+            fd.write("not a step file")
+
+    def test_load_files(self):
+        reader = StepReader()
+        report = reader.load_files([self.shared, self.broken, self.faces], workers=2)
+
+        self.assertEqual(list(report["errors"]), [self.broken])
+        self.assertEqual(set(report["timings"]), {self.shared, self.broken, self.faces})
+        for filename in (self.shared, self.faces):
+            for key in ("read", "parse", "serialize", "total"):
+                self.assertGreaterEqual(report["timings"][filename][key], 0)
+
+        # the total is measured per file in the worker
+        for filename in (self.shared, self.faces):
+            timings = report["timings"][filename]
+            self.assertGreaterEqual(
+                timings["total"],
+                timings["read"] + timings["parse"] + timings["serialize"],
+            )
+            self.assertLessEqual(timings["total"], report["duration"])
+
+        # one group per file, in the given order
+        self.assertEqual([o["name"] for o in reader.assemblies], ["shared", "faces"])
+
+        single = StepReader()
+        single.load(self.shared)
+        self.assertEqual(
+            [o["name"] for o in walk(reader.assemblies[0]["shapes"])],
+            [o["name"] for o in walk(single.assemblies)],
+        )
+        single = StepReader()
+        single.load(self.faces)
+        self.assertEqual(
+            [o["color"] for o in walk(reader.assemblies[1]["shapes"])],
+            [o["color"] for o in walk(single.assemblies)],
+        )
+
+    def test_crashed_worker(self):
+        # a crashing worker breaks the pool, the other files are still loaded
+        crash = os.path.join(os.path.dirname(self.shared), "crash.step")
+        with open(crash, "w") as fd:
+            fd.write("crashes the worker")
+        filenames = [self.shared, crash, self.faces, self.broken]
+
+        reader = StepReader()
+        with patch.object(stepreader, "_read_step_remote", read_step_or_crash):
+            report = reader.load_files(filenames, workers=2)
+
+        self.assertEqual(set(report["errors"]), {crash, self.broken})
+        self.assertTrue(report["errors"][crash].startswith("BrokenProcessPool"))
+        self.assertEqual(set(report["timings"]), set(filenames))
+        self.assertEqual([o["name"] for o in reader.assemblies], ["shared", "faces"])
+
+    def test_to_ocpgroup(self):
+        reader = StepReader()
+        reader.load_files([self.shared, self.faces], workers=2)
+        assembly = reader.to_build123d()
+        self.assertEqual([c.label for c in assembly.children], ["shared", "faces"])
+
+        group, instances = to_ocpgroup(assembly)
+        self.assertEqual(len(group.objects), 2)
+        self.assertGreater(len(instances), 0)
@@ -0,0 +1,56 @@
+import unittest
+
+from build123d import *
+
+from ocp_tessellate.convert import tessellate_group, to_ocpgroup
+
+
+def nested_dict(box, depth):
+    obj = box
+    for _ in range(depth):
+        obj = {"part": box, "sub": obj}
+    return obj
+
+
+class TestTraversal(unittest.TestCase):
+    def test_deeper_than_recursion_limit(self):
+        box = Box(1, 1, 1)
+        group, instances = to_ocpgroup(nested_dict(box, 2000))
+        self.assertEqual(len(instances), 1)
+        self.assertEqual(group.count_shapes(), 2001)
+
+        meshed_instances, shapes, mapping = tessellate_group(group, instances)
+        self.assertEqual(len(group.to_state()), 2001)
+
+        level = shapes
+        for _ in range(1999):
+            self.assertEqual([p["name"] for p in level["parts"]], ["part", "sub"])
+            level = level["parts"][1]
+        self.assertEqual(level["parts"][1]["id"], "/Dict" + "/sub" * 2000)
+
+    def test_collect_order(self):
+        b = Box(1, 1, 1, mode=Mode.PRIVATE)
+        s = Sphere(1)
+        s.label = "s"
+        c = Cylinder(1, 2)
+        c.label = "c"
+        b.label = "b"
+        asm = Compound(
+            label="asm",
+            children=[b, Compound(label="sub", children=[s, c]), Box(2, 2, 2)],
+        )
+        group, instances = to_ocpgroup(asm)
+        _, shapes, mapping = tessellate_group(group, instances)
+
+        def ids(obj):
+            result = [obj["id"]]
+            for part in obj.get("parts", []):
+                result.extend(ids(part))
+            return result
+
+        self.assertEqual(
+            ids(shapes),
+            ["/asm", "/asm/b", "/asm/sub", "/asm/sub/s", "/asm/sub/c", "/asm/Solid"],
+        )
+        self.assertEqual(ids(mapping), ids(shapes))
+        self.assertEqual(list(group.to_state()), ids(shapes)[1:2] + ids(shapes)[3:])